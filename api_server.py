@@ -0,0 +1,216 @@
+"""
+Headless HTTP API pro generování
+
+Úlohy se zadávají přes `POST /v1/jobs` a zpracovává je dlouho běžící worker
+proces (viz inference_worker.py), který drží pipeline rezidentní. Úloha
+běží nezávisle na klientovi - odpojení prohlížeče ji nepřeruší a výsledek
+lze vyzvednout později.
+
+Endpointy:
+    POST /v1/jobs                      zadání úlohy (multipart `image` nebo JSON `image_base64`)
+    GET  /v1/jobs/<id>                 stav a průběh úlohy
+    GET  /v1/jobs/<id>/result          seznam URL výsledků
+    GET  /v1/jobs/<id>/result/<n>      n-tá varianta jako PNG (od 0)
+    GET  /v1/jobs/<id>/result.zip      všechny varianty jako ZIP (?params=0 bez params.json)
+    GET  /v1/models                    modely z katalogu (?kind=lora|full)
+    GET  /v1/stats                     statistiky workeru a fronty
+    GET  /metrics                      metriky workeru ve formátu Prometheus
+    GET  /health                       worker proces běží (liveness)
+    GET  /ready                        modely z PRELOAD_MODELS jsou předehřáté (503 do té doby)
+
+Spuštění: `python api_server.py` (API_HOST, API_PORT). Pro test na CPU bez
+modelů: `TINY_PIPELINE=true FORCE_CPU=true python api_server.py`.
+"""
+
+import base64
+import io
+import json
+import os
+
+from flask import Flask, Response, jsonify, request, send_file, url_for
+from PIL import Image
+
+from config import API_HOST, API_PORT, TINY_PIPELINE, UPLOADED_MODELS_PATH, resolve_cache_dir
+from inference_worker import InferenceWorker
+from job_params import parse_job_params
+from model_catalog import get_catalog_roots, get_model_catalog
+from model_inspect import inspect_model
+from tracing import render_prometheus
+from zip_export import iter_zip
+
+
+def resolve_model(model_path, model_type):
+    """Ověří, že model leží v povolených složkách, a doplní jeho typ."""
+    if TINY_PIPELINE:
+        return model_path or "tiny", model_type or "full_model"
+    if not model_path:
+        raise ValueError("Chybí parametr model_path")
+
+    real_path = os.path.realpath(model_path)
+    allowed_roots = [os.path.realpath(root) for root, _kind in get_catalog_roots()]
+    allowed_roots.append(os.path.realpath(UPLOADED_MODELS_PATH))
+    if not any(real_path.startswith(root + os.sep) for root in allowed_roots):
+        raise ValueError("Model není v povolených složkách modelů")
+    if not real_path.endswith('.safetensors') or not os.path.isfile(real_path):
+        raise ValueError(f"Model {model_path} neexistuje")
+
+    if model_type is None:
+        model_type = inspect_model(real_path)['model_type']
+    if model_type not in ("lora", "full_model"):
+        raise ValueError("Nepodporovaný typ modelu")
+    return real_path, model_type
+
+
+def read_input_image():
+    """Vstupní obrázek z multipart pole `image` nebo JSON pole `image_base64`."""
+    if 'image' in request.files:
+        data = request.files['image'].read()
+    else:
+        payload = request.get_json(silent=True) or {}
+        if not payload.get('image_base64'):
+            raise ValueError("Chybí vstupní obrázek (image nebo image_base64)")
+        try:
+            data = base64.b64decode(payload['image_base64'])
+        except ValueError:
+            raise ValueError("Neplatné base64 v image_base64")
+    try:
+        return Image.open(io.BytesIO(data)).convert("RGB")
+    except Exception as e:
+        raise ValueError(f"Nelze načíst vstupní obrázek: {e}")
+
+
+def job_response(job):
+    """Veřejná podoba stavu úlohy (bez interních cest)."""
+    response = {
+        'job_id': job['id'],
+        'status': job['status'],
+        'progress': job['progress'],
+        'message': job['message'],
+        'warnings': job['warnings'],
+        'error': job['error'],
+        'created': job['created'],
+        'started': job['started'],
+        'finished': job['finished'],
+        'status_url': url_for('job_status', job_id=job['id']),
+    }
+    if job['status'] == 'done':
+        response['result_url'] = url_for('job_result', job_id=job['id'])
+    return response
+
+
+def create_app(worker=None):
+    """Vytvoří Flask aplikaci; bez předaného workeru spustí vlastní."""
+    app = Flask(__name__)
+    if worker is None:
+        worker = InferenceWorker(resolve_cache_dir('api_jobs'))
+        worker.start()
+    app.config['INFERENCE_WORKER'] = worker
+
+    def error(message, status=400):
+        return jsonify({'error': message}), status
+
+    @app.post('/v1/jobs')
+    def submit_job():
+        values = request.form.to_dict() if request.form else (request.get_json(silent=True) or {})
+        try:
+            input_image = read_input_image()
+            params = parse_job_params(values)
+            model_path, model_type = resolve_model(values.get('model_path'), values.get('model_type') or None)
+        except ValueError as e:
+            return error(str(e))
+
+        job_id, job_dir = worker.create_job_dir()
+        input_path = os.path.join(job_dir, "input.png")
+        input_image.save(input_path, format="PNG")
+        job = worker.submit(job_id, job_dir, input_path, model_path, model_type, params)
+        return jsonify(job_response(job)), 202
+
+    @app.get('/v1/jobs/<job_id>')
+    def job_status(job_id):
+        job = worker.get(job_id)
+        if job is None:
+            return error("Úloha neexistuje", 404)
+        return jsonify(job_response(job))
+
+    @app.get('/v1/jobs/<job_id>/result')
+    def job_result(job_id):
+        job = worker.get(job_id)
+        if job is None:
+            return error("Úloha neexistuje", 404)
+        if job['status'] != 'done':
+            return error(f"Úloha není dokončena (stav {job['status']})", 409)
+        return jsonify({
+            'job_id': job_id,
+            'images': [url_for('job_result_image', job_id=job_id, index=i) for i in range(len(job['images']))],
+            'zip': url_for('job_result_zip', job_id=job_id),
+            'warnings': job['warnings'],
+        })
+
+    @app.get('/v1/jobs/<job_id>/result/<int:index>')
+    def job_result_image(job_id, index):
+        job = worker.get(job_id)
+        if job is None or job['status'] != 'done' or index >= len(job['images']):
+            return error("Výsledek neexistuje", 404)
+        return send_file(job['images'][index], mimetype="image/png",
+                         download_name=f"variant_{index + 1}.png")
+
+    @app.get('/v1/jobs/<job_id>/result.zip')
+    def job_result_zip(job_id):
+        job = worker.get(job_id)
+        if job is None:
+            return error("Úloha neexistuje", 404)
+        if job['status'] != 'done':
+            return error(f"Úloha není dokončena (stav {job['status']})", 409)
+        # Soubory se čtou z disku po blocích až během odesílání
+        members = [(f"variant_{i + 1}.png", path) for i, path in enumerate(job['images'])]
+        if request.args.get('params', '1') != '0':
+            params = dict(job['params'], model=os.path.basename(job['model_path']), model_type=job['model_type'])
+            members.append(("params.json", json.dumps(params, indent=2).encode()))
+        return Response(
+            iter_zip(members), mimetype="application/zip",
+            headers={'Content-Disposition': f'attachment; filename="{job_id}.zip"'}
+        )
+
+    @app.get('/v1/models')
+    def list_models():
+        catalog = get_model_catalog(get_catalog_roots())
+        catalog.refresh_if_stale()
+        kinds = [request.args['kind']] if request.args.get('kind') else ['lora', 'full']
+        return jsonify({kind: catalog.list_models(kind, search=request.args.get('search')) for kind in kinds})
+
+    @app.get('/v1/stats')
+    def stats():
+        return jsonify({
+            'worker_alive': worker.is_alive(),
+            'worker_restarts': worker.restarts,
+            'queued': worker.queue_length(),
+            'worker': worker.worker_stats,
+        })
+
+    @app.get('/metrics')
+    def metrics():
+        # Úseky a čítače se měří ve worker procesu, posílá je s každou úlohou
+        body = render_prometheus(worker.worker_stats.get('metrics', {}), extra_gauges=[
+            ('worker_alive', {}, int(worker.is_alive())),
+            ('worker_restarts', {}, worker.restarts),
+            ('queued_jobs', {}, worker.queue_length()),
+            ('worker_ready', {}, int(worker.readiness.get('ready', False))),
+        ])
+        return Response(body, content_type="text/plain; version=0.0.4; charset=utf-8")
+
+    @app.get('/health')
+    def health():
+        return jsonify({'status': 'ok', 'worker_alive': worker.is_alive()})
+
+    @app.get('/ready')
+    def ready():
+        readiness = dict(worker.readiness)
+        ready = readiness.get('ready', False) and worker.is_alive()
+        return jsonify(dict(readiness, ready=ready)), 200 if ready else 503
+
+    return app
+
+
+if __name__ == '__main__':
+    print(f"🚀 Inference API na http://{API_HOST}:{API_PORT}")
+    create_app().run(host=API_HOST, port=API_PORT, threaded=True)
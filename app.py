@@ -1,36 +1,35 @@
 import streamlit as st
-import torch
 from PIL import Image
 import os
-import io
-from diffusers import StableDiffusionXLImg2ImgPipeline
-from diffusers.utils import load_image
-from diffusers import (
-    DPMSolverMultistepScheduler,
-    EulerDiscreteScheduler,
-    EulerAncestralDiscreteScheduler,
-    DDIMScheduler,
-    LMSDiscreteScheduler,
-    PNDMScheduler
-)
-from safetensors.torch import load_file
+import json
 import time
-import gc
-from pathlib import Path
-import platform
-import psutil
-from typing import Optional
-
-# Environment variables pro konfiguraci
-FORCE_CPU = os.getenv('FORCE_CPU', 'false').lower() == 'true'
-MAX_MEMORY_GB = float(os.getenv('MAX_MEMORY_GB', '8'))
-# BASE_MODEL - nepoužíváme base modely, pouze uživatelské full a LoRA modely
-ENABLE_ATTENTION_SLICING = os.getenv('ENABLE_ATTENTION_SLICING', 'true').lower() == 'true'
-ENABLE_CPU_OFFLOAD = os.getenv('ENABLE_CPU_OFFLOAD', 'auto')
-LORA_MODELS_PATH = os.getenv('LORA_MODELS_PATH', '/data/loras')
-FULL_MODELS_PATH = os.getenv('FULL_MODELS_PATH', '/data/models')
-HF_HOME = os.getenv('HF_HOME', '/root/.cache/huggingface')
-BASE_MODEL = os.getenv('BASE_MODEL', 'stabilityai/stable-diffusion-xl-base-1.0')
+
+from config import (
+    HF_HOME,
+    INFERENCE_API_URL,
+    resolve_cache_dir,
+    resolve_model_dirs,
+)
+from model_catalog import get_catalog_roots, get_model_catalog
+from model_store import get_model_store
+from result_cache import get_result_cache
+from zip_export import write_zip
+from model_inspect import inspect_model
+from inference_worker import collect_worker_stats, engine_loaded
+from inference_client import RemoteInferenceError, get_inference_client
+from system_probe import get_probe_if_ready, get_system_info, start_background_probe
+from tracing import start_metrics_server
+from warmup import get_readiness, start_background_warmup
+
+# torch, diffusers a generační jádro (inference, batch_scheduler) se importují
+# až při prvním generování - rerun po posunu slideru se ML kódu nedotkne.
+
+# Lokální inference - metriky na METRICS_PORT, průzkum zařízení a předehřátí
+# modelů z PRELOAD_MODELS na pozadí (vše jen jednou za proces)
+if not INFERENCE_API_URL:
+    start_metrics_server()
+    start_background_probe()
+    start_background_warmup()
 
 # Nastavení stránky
 st.set_page_config(page_title="AI Stylový Přenos", page_icon="🎨", layout="wide")
@@ -450,15 +449,7 @@ h3 { font-size: 1.25rem; }
 """, unsafe_allow_html=True)
 
 # Vytvoření adresářů - s fallback pro lokální vývoj
-try:
-    os.makedirs(LORA_MODELS_PATH, exist_ok=True)
-    os.makedirs(FULL_MODELS_PATH, exist_ok=True)
-except OSError:
-    # Fallback pro lokální vývoj - použij lokální složky
-    LORA_MODELS_PATH = './lora_models'
-    FULL_MODELS_PATH = './models'
-    os.makedirs(LORA_MODELS_PATH, exist_ok=True)
-    os.makedirs(FULL_MODELS_PATH, exist_ok=True)
+LORA_MODELS_PATH, FULL_MODELS_PATH = resolve_model_dirs()
 
 try:
     os.makedirs(HF_HOME, exist_ok=True)
@@ -467,124 +458,17 @@ except OSError:
     HF_HOME = os.path.expanduser('~/.cache/huggingface')
     os.makedirs(HF_HOME, exist_ok=True)
 
-def detect_runpod_paths():
-    """Detekuje dostupné RunPod cesty pro modely."""
-    possible_paths = {
-        'workspace_loras': '/workspace/loras',
-        'workspace_models': '/workspace/models', 
-        'data_loras': '/data/loras',
-        'data_models': '/data/models',
-        'runpod_volume_loras': '/runpod-volume/loras',
-        'runpod_volume_models': '/runpod-volume/models',
-        'content_loras': '/content/loras',  # Colab style
-        'content_models': '/content/models'
-    }
-    
-    available_paths = []
-    for name, path in possible_paths.items():
-        if os.path.exists(path):
-            available_paths.append(path)
-    
-    return available_paths
+def get_lora_models_list(search=None, base_arch=None, lora_rank=None):
+    """Získá seznam dostupných LoRA modelů z katalogu persistentního disku včetně RunPod detekce."""
+    catalog = get_model_catalog(get_catalog_roots())
+    catalog.refresh_if_stale()
+    return catalog.list_models('lora', search=search, base_arch=base_arch, lora_rank=lora_rank)
 
-def get_lora_models_list():
-    """Získá seznam dostupných LoRA modelů z persistentního disku včetně RunPod detekce."""
-    lora_files = []
-    
-    # Zkusí všechny možné cesty
-    search_paths = [LORA_MODELS_PATH] + detect_runpod_paths()
-    
-    for search_path in search_paths:
-        if 'lora' in search_path.lower() and os.path.exists(search_path):
-            try:
-                for root, dirs, files in os.walk(search_path):
-                    for file in files:
-                        if file.endswith('.safetensors'):
-                            file_path = os.path.join(root, file)
-                            file_size = os.path.getsize(file_path) / (1024 * 1024)  # MB
-                            # Relativní cesta pro lepší zobrazení
-                            rel_path = os.path.relpath(file_path, search_path)
-                            display_name = f"{os.path.basename(search_path)}/{rel_path}" if '/' in rel_path else f"{os.path.basename(search_path)}/{file}"
-                            
-                            # Kontrola duplicit
-                            if not any(existing['path'] == file_path for existing in lora_files):
-                                lora_files.append({
-                                    'name': display_name,
-                                    'path': file_path,
-                                    'size_mb': file_size,
-                                    'source': search_path
-                                })
-            except PermissionError:
-                continue
-    
-    return sorted(lora_files, key=lambda x: x['name'])
-
-def get_full_models_list():
-    """Získá seznam dostupných full modelů z persistentního disku včetně RunPod detekce."""
-    models = []
-    
-    # Zkusí všechny možné cesty
-    search_paths = [FULL_MODELS_PATH] + detect_runpod_paths()
-    
-    for search_path in search_paths:
-        if 'model' in search_path.lower() and os.path.exists(search_path):
-            try:
-                for root, dirs, files in os.walk(search_path):
-                    for file in files:
-                        if file.endswith('.safetensors'):
-                            file_path = os.path.join(root, file)
-                            file_size = os.path.getsize(file_path) / (1024 * 1024)  # MB
-                            # Relativní cesta pro lepší zobrazení
-                            rel_path = os.path.relpath(file_path, search_path)
-                            display_name = f"{os.path.basename(search_path)}/{rel_path}" if '/' in rel_path else f"{os.path.basename(search_path)}/{file}"
-                            
-                            # Kontrola duplicit
-                            if not any(existing['path'] == file_path for existing in models):
-                                models.append({
-                                    'name': display_name,
-                                    'path': file_path,
-                                    'size_mb': file_size,
-                                    'source': search_path
-                                })
-            except PermissionError:
-                continue
-    
-    return sorted(models, key=lambda x: x['name'])
-
-# Funkce pro detekci hardware
-def get_system_info():
-    """Získá informace o systému a dostupném hardware"""
-    info = {
-        'platform': platform.system(),
-        'cpu_count': psutil.cpu_count(),
-        'memory_gb': psutil.virtual_memory().total / (1024**3),
-        'cuda_available': torch.cuda.is_available(),
-        'cuda_device_count': torch.cuda.device_count() if torch.cuda.is_available() else 0,
-        'cuda_device_name': torch.cuda.get_device_name(0) if torch.cuda.is_available() else None,
-        'cuda_memory_gb': torch.cuda.get_device_properties(0).total_memory / (1024**3) if torch.cuda.is_available() else 0
-    }
-    return info
-
-def get_optimal_device():
-    """Určí optimální zařízení pro inference s fallback pro CUDA chyby"""
-    if FORCE_CPU:
-        return "cpu", "Vynuceno CPU"
-    
-    if not torch.cuda.is_available():
-        return "cpu", "CUDA není dostupná"
-    
-    try:
-        # Test CUDA funkčnosti s RTX 5090 fallback
-        test_tensor = torch.randn(10, device='cuda')
-        _ = test_tensor + 1  # Jednoduchý test operace
-        gpu_memory = torch.cuda.get_device_properties(0).total_memory / (1024**3)
-        if gpu_memory < 4:
-            return "cpu", f"Nedostatek GPU paměti ({gpu_memory:.1f} GB < 4 GB)"
-        
-        return "cuda", f"GPU: {torch.cuda.get_device_name(0)} ({gpu_memory:.1f} GB)"
-    except Exception as e:
-        # Fallback na CPU při CUDA chybách (RTX 5090 kompatibilita)
-        return "cpu", f"CUDA chyba - fallback na CPU: {str(e)[:30]}..."
+def get_full_models_list(search=None, base_arch=None):
+    """Získá seznam dostupných full modelů z katalogu persistentního disku včetně RunPod detekce."""
+    catalog = get_model_catalog(get_catalog_roots())
+    catalog.refresh_if_stale()
+    return catalog.list_models('full', search=search, base_arch=base_arch)
 
 def show_progress_bar(progress: float, text: str = "") -> None:
     """Zobrazí progress bar s textem"""
@@ -602,13 +486,14 @@ def update_progress(progress_bar, progress: float, text: str = "") -> None:
 # Nadpis aplikace
 # Odstraněno podle požadavku uživatele
 
-# Systémové informace přesunuty do sidebaru
+# Systémové informace přesunuty do sidebaru - počítají se jednou za proces,
+# zařízení zjišťuje vlákno na pozadí (dokud nedoběhne, UI na něj nečeká)
 sys_info = get_system_info()
-device, device_reason = get_optimal_device()
+device_probe = get_probe_if_ready()
 
 # Zobrazení varování při CUDA chybě
-if "chyba" in device_reason.lower():
-    st.warning(f"⚠️ CUDA problém detekován, přepínám na CPU: {device_reason}")
+if device_probe is not None and "chyba" in device_probe['reason'].lower():
+    st.warning(f"⚠️ CUDA problém detekován, přepínám na CPU: {device_probe['reason']}")
 
 # Hlavní obsah bude přesunut do col_main
 
@@ -616,262 +501,198 @@ if "chyba" in device_reason.lower():
 def detect_model_type(file_path):
     """Detekuje zda je soubor LoRA model nebo full safetensors model"""
     try:
-        # Načteme metadata ze safetensors souboru
-        state_dict = load_file(file_path)
-        
-        # Kontrola velikosti souboru
-        file_size = os.path.getsize(file_path) / (1024 * 1024 * 1024)  # GB
-        
-        # LoRA modely jsou obvykle menší (< 1GB) a obsahují specifické klíče
-        lora_keys = ['lora_unet', 'lora_te', 'alpha', 'rank']
-        has_lora_keys = any(any(lora_key in key for lora_key in lora_keys) for key in state_dict.keys())
-        
-        # Full modely jsou větší a obsahují kompletní váhy
-        full_model_keys = ['model.diffusion_model', 'first_stage_model', 'cond_stage_model']
-        has_full_keys = any(any(full_key in key for full_key in full_model_keys) for key in state_dict.keys())
-        
-        if has_lora_keys or file_size < 1.0:
-            return "lora"
-        elif has_full_keys or file_size > 2.0:
-            return "full_model"
-        else:
-            # Pokud nejsme si jisti, zkusíme podle velikosti
-            return "lora" if file_size < 1.0 else "full_model"
-            
+        # Čte se jen JSON hlavička, výsledek je v cache podle (cesta, velikost, mtime)
+        return inspect_model(file_path)['model_type']
     except Exception as e:
         st.warning(f"Nelze detekovat typ modelu: {e}")
         return "unknown"
 
 # Funkce pro aplikaci stylu na vstupní obrázek
 def apply_style(input_image, model_path, model_type, strength, guidance_scale, num_inference_steps, progress_callback, clip_skip=2, seed=None, upscale_factor=1, num_images=1, sampler="DPMSolverMultistepScheduler", variance_seed=None, variance_strength=0.0):
-    # Použití optimální device detekce s fallback
-    device, device_reason = get_optimal_device()
-    torch_dtype = torch.float16 if device == "cuda" else torch.float32
+    """
+    Aplikuje styl lokálně, nebo přes inference API, pokud je nastaveno
+    INFERENCE_API_URL. Vrací klíče výsledků v cache výsledků (None při chybě).
+    """
+    params = dict(
+        strength=strength, guidance_scale=guidance_scale, num_inference_steps=num_inference_steps,
+        clip_skip=clip_skip, seed=seed, upscale_factor=upscale_factor, num_images=num_images,
+        sampler=sampler, variance_seed=variance_seed, variance_strength=variance_strength
+    )
+    if INFERENCE_API_URL:
+        # Tenký klient - torch ani generační jádro se v procesu UI nenačítají
+        try:
+            results = get_inference_client().generate(
+                input_image, model_path, model_type, progress_callback, notify=st.warning, **params
+            )
+        except RemoteInferenceError as e:
+            st.error(str(e))
+            return None
+        return get_result_cache().add_all(results)
     
-    # Logování device informací
-    if "chyba" in device_reason.lower():
-        print(f"Warning: {device_reason}")
+    # Generační jádro (torch, diffusers) se načte až tady - při prvním lokálním generování
+    from inference import InferenceError
+    from batch_scheduler import get_batch_scheduler
+    from upscaling import get_upscale_stage
+    # Upscaling až po generování, po jednom obrázku rovnou do cache výsledků -
+    # zvětšené varianty nejsou v paměti najednou (jako upscale_to_files ve workeru)
+    params.pop('upscale_factor')
+    generation_progress = progress_callback
+    if upscale_factor > 1:
+        # Generování končí na 90 %, zbytek průběhu patří upscalingu
+        generation_progress = lambda value, text="": progress_callback(value * 0.9, text)
+    try:
+        # Přes plánovač dávek - souběžné kompatibilní požadavky poběží v jedné dávce
+        results = get_batch_scheduler().run(
+            input_image, model_path, model_type, progress_callback=generation_progress,
+            notify=st.warning, **params
+        )
+    except InferenceError as e:
+        st.error(str(e))
+        return None
     
-    # Progress tracking - začátek
-    progress_callback(0.1)
+    cache = get_result_cache()
+    if upscale_factor <= 1:
+        return cache.add_all(results)
+    result_keys = [None] * len(results)
+    get_upscale_stage().run(
+        results, upscale_factor, lambda index, image: result_keys.__setitem__(index, cache.add(image)),
+        progress_callback
+    )
+    progress_callback(1.0)
+    return result_keys
+
+def render_results(result_keys, output_placeholder):
+    """Zobrazí výsledky z cache - náhled, miniatury i stažení používají hotové bajty"""
+    cache = get_result_cache()
+    entries = [entry for entry in (cache.get(key) for key in result_keys) if entry is not None]
+    if not entries:
+        return
     
-    # Pokročilé vyčištění paměti před načtením
-    if device == "cuda":
-        torch.cuda.empty_cache()
-        torch.cuda.synchronize()
-    gc.collect()
+    output_placeholder.empty()
     
-    # Nastavení memory efficient attention pro velké modely
-    os.environ["PYTORCH_CUDA_ALLOC_CONF"] = "max_split_size_mb:512"
+    if len(entries) == 1:
+        with output_placeholder.container():
+            st.image(entries[0]['png'], width=int(400 * 0.84))
+            
+            # Tlačítko pro stažení
+            st.download_button(
+                label="📥 Stáhnout",
+                data=entries[0]['png'],
+                file_name="result.png",
+                mime="image/png",
+                use_container_width=True
+            )
+        return
     
-    # Optimalizace pro velké modely na základě environment variables
-    enable_memory_efficient_attention = ENABLE_ATTENTION_SLICING
+    num_images = len(entries)
+    # Pro více variant zobrazíme info v col2 a mřížku pod sloupci
+    with output_placeholder.container():
+        st.markdown(f"### 🖼️ {num_images} variant")
+        st.markdown("*Mřížka níže*")
     
-    if ENABLE_CPU_OFFLOAD == 'auto':
-        enable_cpu_offload = device == "cpu" or (torch.cuda.is_available() and torch.cuda.get_device_properties(0).total_memory < MAX_MEMORY_GB * 1024**3)
-    else:
-        enable_cpu_offload = ENABLE_CPU_OFFLOAD.lower() == 'true'
+    # Galerie variant s velkým náhledem a miniaturami
+    st.markdown("---")
+    st.markdown('<div class="variant-gallery">', unsafe_allow_html=True)
+    st.markdown(f"### 🖼️ Galerie variant ({num_images})")
     
-    try:
-        # Progress tracking - načítání modelu
-        progress_callback(0.2)
-        
-        if model_type == "lora":
-            # Robustnější CUDA handling pro RTX 5090
-            try:
-                # Načtení base modelu pro LoRA
-                pipe = StableDiffusionXLImg2ImgPipeline.from_pretrained(
-                    BASE_MODEL,
-                    torch_dtype=torch_dtype,
-                    variant="fp16" if device == "cuda" else None,
-                    use_safetensors=True,
-                    low_cpu_mem_usage=True,
-                    clip_skip=clip_skip
-                )
-            except RuntimeError as cuda_error:
-                if "CUDA" in str(cuda_error):
-                    # Fallback na CPU při CUDA chybě
-                    st.warning(f"⚠️ CUDA chyba při načítání modelu, přepínám na CPU: {str(cuda_error)[:50]}...")
-                    device = "cpu"
-                    torch_dtype = torch.float32
-                    pipe = StableDiffusionXLImg2ImgPipeline.from_pretrained(
-                        BASE_MODEL,
-                        torch_dtype=torch_dtype,
-                        use_safetensors=True,
-                        low_cpu_mem_usage=True,
-                        clip_skip=clip_skip
-                    )
-                else:
-                    raise cuda_error
-            
-            # Progress tracking - optimalizace
-            progress_callback(0.4)
-            
-            # Memory efficient optimizations
-            if enable_memory_efficient_attention:
-                pipe.enable_attention_slicing()
-                pipe.enable_vae_slicing()
-                
-            if enable_cpu_offload:
-                pipe.enable_model_cpu_offload()
-            else:
-                pipe = pipe.to(device)
-            
-            # Progress tracking - načítání LoRA
-            progress_callback(0.5)
-            
-            # Načtení LoRA modelu - robustnější přístup
-            try:
-                # Pokus o načtení jako adresář s adapter_config.json
-                if os.path.isdir(model_path):
-                    pipe.load_lora_weights(model_path)
-                else:
-                    # Načtení .safetensors souboru přímo
-                    pipe.load_lora_weights(model_path, adapter_name="lora_adapter")
-            except Exception as e:
-                try:
-                    # Fallback - načtení pomocí from_single_file
-                    pipe.load_lora_weights(model_path, weight_name=os.path.basename(model_path))
-                except Exception as e2:
-                    st.warning(f"Nelze načíst LoRA model: {e2}")
-                    # Pokračovat bez LoRA
-                    pass
-                
-        elif model_type == "full_model":
-            # Načtení full safetensors modelu
-            try:
-                pipe = StableDiffusionXLImg2ImgPipeline.from_single_file(
-                    model_path,
-                    torch_dtype=torch_dtype,
-                    use_safetensors=True,
-                    low_cpu_mem_usage=True,
-                    clip_skip=clip_skip
-                )
-                
-                # Progress tracking - optimalizace
-                progress_callback(0.5)
-                
-                # Memory efficient optimizations pro full modely
-                if enable_memory_efficient_attention:
-                    pipe.enable_attention_slicing()
-                    pipe.enable_vae_slicing()
+    # Inicializace vybrané varianty
+    if st.session_state.get('selected_variant', 0) >= num_images:
+        st.session_state.selected_variant = 0
+    selected = st.session_state.get('selected_variant', 0)
+    
+    # Hlavní náhled
+    st.markdown('<div class="variant-main-preview">', unsafe_allow_html=True)
+    st.markdown(f"**Varianta {selected + 1} - Hlavní náhled**")
+    st.image(entries[selected]['png'], use_column_width=True)
+    
+    # Tlačítko pro stažení vybrané varianty
+    st.download_button(
+        label=f"📥 Stáhnout variantu {selected + 1}",
+        data=entries[selected]['png'],
+        file_name=f"result_variant_{selected + 1}.png",
+        mime="image/png",
+        key="download_selected_variant",
+        use_container_width=True
+    )
+    st.markdown('</div>', unsafe_allow_html=True)
+    
+    # Miniatury variant
+    st.markdown("**Vyberte variantu:**")
+    st.markdown('<div class="variant-thumbnails">', unsafe_allow_html=True)
+    
+    # Vytvoření sloupců pro miniatury (max 4 na řádek)
+    cols_per_row = min(4, num_images)
+    rows = (num_images + cols_per_row - 1) // cols_per_row
+    
+    for row in range(rows):
+        thumbnail_cols = st.columns(cols_per_row)
+        for col_idx in range(cols_per_row):
+            img_idx = row * cols_per_row + col_idx
+            if img_idx < num_images:
+                with thumbnail_cols[col_idx]:
+                    # CSS třída pro vybranou miniaturu
+                    thumbnail_class = "selected" if img_idx == selected else ""
                     
-                if enable_cpu_offload:
-                    pipe.enable_model_cpu_offload()
-                else:
-                    pipe = pipe.to(device)
-            except Exception as e:
-                st.error(f"Chyba při načítání full modelu: {e}")
-                return None
-        else:
-            st.error("Nepodporovaný typ modelu")
-            return None
-        
-        # Progress tracking - příprava generování
-        progress_callback(0.6)
-        
-        # Nastavení scheduleru
-        scheduler_map = {
-            "DPMSolverMultistepScheduler": DPMSolverMultistepScheduler,
-            "EulerDiscreteScheduler": EulerDiscreteScheduler,
-            "EulerAncestralDiscreteScheduler": EulerAncestralDiscreteScheduler,
-            "DDIMScheduler": DDIMScheduler,
-            "LMSDiscreteScheduler": LMSDiscreteScheduler,
-            "PNDMScheduler": PNDMScheduler
-        }
-        
-        if sampler in scheduler_map:
-            pipe.scheduler = scheduler_map[sampler].from_config(pipe.scheduler.config)
-        
-        progress_callback(0.6, f"Generuji {num_images} variant...")
-        
-        # Generování více obrázků
-        results = []
-        for i in range(num_images):
-            # Nastavení generátoru pro reprodukovatelnost
-            generator = None
-            current_seed = seed
-            
-            if seed is not None:
-                if variance_seed is not None and i > 0:
-                    # Pro varianty použijeme kombinaci původního seed a variance seed
-                    current_seed = seed + (variance_seed * i) % 2147483647
-                generator = torch.Generator(device=device).manual_seed(current_seed)
-            
-            # Callback pro progress bar během generování
-            def callback_fn(step, timestep, latents):
-                # Mapování kroků generování na progress 0.6 - 0.85
-                generation_progress = 0.6 + (i / num_images) * 0.25 + (step / num_inference_steps) * (0.25 / num_images)
-                progress_callback(generation_progress)
-                return latents
-            
-            # Aktualizace progress pro každý obrázek
-            progress_callback(0.6 + (i / num_images) * 0.25, f"Generuji obrázek {i+1}/{num_images}...")
-            
-            # Aplikace stylu na vstupní obrázek
-            # Prázdný prompt, protože nechceme generovat podle textu
-            try:
-                result = pipe(
-                    image=input_image,
-                    prompt="",
-                    strength=strength,
-                    guidance_scale=guidance_scale,
-                    num_inference_steps=num_inference_steps,
-                    generator=generator,
-                    callback=callback_fn,
-                    callback_steps=1
-                ).images[0]
-                
-                results.append(result)
-            
-            except Exception as e:
-                st.error(f"Chyba při generování obrázku {i+1}: {e}")
-                continue
-        
-        # Progress tracking - generování dokončeno
-        progress_callback(0.85)
-        
-        # Upscaling pokud je povoleno
-        if upscale_factor > 1:
-            progress_callback(0.9, "Upscaling obrázků...")
-            upscaled_results = []
-            for i, result in enumerate(results):
-                try:
-                    # Jednoduché upscaling pomocí PIL (pro Real-ESRGAN by bylo potřeba další závislost)
-                    original_size = result.size
-                    new_size = (original_size[0] * upscale_factor, original_size[1] * upscale_factor)
-                    upscaled_result = result.resize(new_size, Image.Resampling.LANCZOS)
-                    upscaled_results.append(upscaled_result)
-                    progress_callback(0.9 + (i / len(results)) * 0.05, f"Upscaling {i+1}/{len(results)}...")
-                except Exception as e:
-                    progress_callback(0.95, f"Upscaling obrázku {i+1} selhal: {e}")
-                    upscaled_results.append(result)  # Použij původní obrázek
-            results = upscaled_results
-        
-        # Progress tracking - dokončeno
-        progress_callback(1.0)
-        
-        # Vrátíme první obrázek pro zpětnou kompatibilitu, ale všechny jsou v results
-        return results[0] if results else None
-        
-    finally:
-        # Vyčištění paměti po dokončení
-        if device == "cuda":
-            torch.cuda.empty_cache()
-        gc.collect()
-        
-        # Uvolnění pipeline z paměti
-        if 'pipe' in locals():
-            del pipe
-            if device == "cuda":
-                torch.cuda.empty_cache()
-            gc.collect()
+                    # Tlačítko pro výběr varianty
+                    if st.button(
+                        f"Varianta {img_idx + 1}",
+                        key=f"select_variant_{img_idx}",
+                        use_container_width=True
+                    ):
+                        st.session_state.selected_variant = img_idx
+                        st.rerun()
+                    
+                    # Miniatura obrázku - do prohlížeče jde jen zmenšenina
+                    st.markdown(f'<div class="variant-thumbnail {thumbnail_class}">', unsafe_allow_html=True)
+                    st.image(entries[img_idx]['thumbnail'], width=150)
+                    st.markdown('</div>', unsafe_allow_html=True)
+                    
+                    # Individuální tlačítko pro stažení
+                    st.download_button(
+                        label="📥",
+                        data=entries[img_idx]['png'],
+                        file_name=f"variant_{img_idx + 1}.png",
+                        mime="image/png",
+                        key=f"download_thumb_{img_idx}",
+                        help=f"Stáhnout variantu {img_idx + 1}"
+                    )
+    
+    st.markdown('</div>', unsafe_allow_html=True)
+    
+    # Stažení všech variant - ZIP se skládá proudově do souboru jednou pro sadu
+    # výsledků, session drží jen jeho cestu (ne bajty archivu)
+    include_params = st.checkbox("Přiložit parametry (JSON)", value=True, key="zip_include_params")
+    params_json = None
+    if include_params and st.session_state.get('result_params'):
+        params_json = json.dumps(st.session_state.result_params, indent=2)
+    zip_signature = (tuple(result_keys), params_json)
+    zip_export = st.session_state.get('zip_export')
+    if zip_export is None or zip_export[0] != zip_signature or not os.path.exists(zip_export[1]):
+        if zip_export is not None and os.path.exists(zip_export[1]):
+            os.remove(zip_export[1])
+        members = [(f"variant_{i + 1}.png", entry['png']) for i, entry in enumerate(entries)]
+        if params_json:
+            members.append(("params.json", params_json.encode()))
+        zip_export = (zip_signature, write_zip(members, resolve_cache_dir('exports')))
+        st.session_state.zip_export = zip_export
+    with open(zip_export[1], 'rb') as zip_file:
+        st.download_button(
+            label="📦 Stáhnout všechny varianty (ZIP)",
+            data=zip_file,
+            file_name="varianty.zip",
+            mime="application/zip",
+            key="download_all_variants",
+            use_container_width=True
+        )
+    
+    st.markdown('</div>', unsafe_allow_html=True)
 
 # Inicializace session state pro uchování nahraných souborů
-if 'uploaded_model_file' not in st.session_state:
-    st.session_state.uploaded_model_file = None
+if 'uploaded_model_path' not in st.session_state:
+    st.session_state.uploaded_model_path = None
     st.session_state.model_type = None
     st.session_state.model_name = None
+    st.session_state.model_uploader_key = 0
 
 
     
@@ -881,10 +702,11 @@ if 'uploaded_model_file' not in st.session_state:
 
 with st.sidebar:
     # Inicializace session state pro uchování nahraných souborů
-    if 'uploaded_model_file' not in st.session_state:
-        st.session_state.uploaded_model_file = None
+    if 'uploaded_model_path' not in st.session_state:
+        st.session_state.uploaded_model_path = None
         st.session_state.model_type = None
         st.session_state.model_name = None
+        st.session_state.model_uploader_key = 0
     
 
     
@@ -925,8 +747,6 @@ with st.sidebar:
         variance_strength = 0.0
 
 # Inicializace globálních proměnných pro model
-if 'current_model_file' not in st.session_state:
-    st.session_state.current_model_file = None
 if 'current_model_path' not in st.session_state:
     st.session_state.current_model_path = None
 if 'selected_lora_model' not in st.session_state:
@@ -935,7 +755,6 @@ if 'selected_full_model' not in st.session_state:
     st.session_state.selected_full_model = None
 
 # Resetování globálních proměnných na začátku
-st.session_state.current_model_file = None
 st.session_state.current_model_path = None
 
 # Hlavní layout s pravým sidebarom
@@ -950,32 +769,48 @@ with col_right:
     
     # Nahrání modelu
     with st.expander("📁 Nahrát Model", expanded=False):
+        # Nový klíč uploaderu po uložení = nový prázdný widget, buffer se uvolní
         uploaded_file = st.file_uploader(
             "Model (.safetensors):", 
             type=["safetensors"],
-            key="right_model_uploader"
+            key=f"right_model_uploader_{st.session_state.model_uploader_key}"
         )
         
         if uploaded_file is not None:
-            if (st.session_state.uploaded_model_file is None or 
-                st.session_state.model_name != uploaded_file.name):
-                st.session_state.uploaded_model_file = uploaded_file
-                st.session_state.model_name = uploaded_file.name
-                st.session_state.model_type = None
+            with st.spinner("💾 Ukládám model..."):
+                stored_path, _digest, created = get_model_store().put_upload(uploaded_file)
+            st.session_state.uploaded_model_path = stored_path
+            st.session_state.model_name = uploaded_file.name
+            st.session_state.model_type = None
+            st.session_state.model_uploader_key += 1
+            if not created:
+                print(f"♻️ Model {uploaded_file.name} už je v úložišti: {stored_path}")
+            del uploaded_file
+            st.rerun()
         
-        if st.session_state.uploaded_model_file is not None:
-            st.session_state.current_model_file = st.session_state.uploaded_model_file
+        if st.session_state.uploaded_model_path is not None and not os.path.isfile(st.session_state.uploaded_model_path):
+            st.session_state.uploaded_model_path = None
+            st.session_state.model_name = None
+        
+        if st.session_state.uploaded_model_path is not None:
             st.success(f"✅ {st.session_state.model_name}")
             if st.button("🗑️ Vymazat", key="right_clear_model"):
-                st.session_state.uploaded_model_file = None
+                st.session_state.uploaded_model_path = None
                 st.session_state.model_type = None
                 st.session_state.model_name = None
-                st.session_state.current_model_file = None
                 st.rerun()
     
     # LoRA modely
     with st.expander("⚙️ LoRA Modely", expanded=False):
-        lora_models = get_lora_models_list()
+        lora_facets = get_model_catalog(get_catalog_roots()).facets('lora')
+        lora_search = st.text_input("Hledat:", key="right_lora_search")
+        lora_arch = st.selectbox("Architektura:", ["(vše)"] + lora_facets['base_arch'], key="right_lora_arch")
+        lora_rank = st.selectbox("Rank:", ["(vše)"] + lora_facets['lora_rank'], key="right_lora_rank")
+        lora_models = get_lora_models_list(
+            search=lora_search or None,
+            base_arch=None if lora_arch == "(vše)" else lora_arch,
+            lora_rank=None if lora_rank == "(vše)" else lora_rank
+        )
         if lora_models:
             model_options = [f"{model['name']} ({model['size_mb']:.1f} MB)" for model in lora_models]
             selected_model = st.selectbox(
@@ -993,7 +828,13 @@ with col_right:
     
     # Full modely
     with st.expander("🔧 Full Modely", expanded=False):
-        full_models = get_full_models_list()
+        full_facets = get_model_catalog(get_catalog_roots()).facets('full')
+        full_search = st.text_input("Hledat:", key="right_full_search")
+        full_arch = st.selectbox("Architektura:", ["(vše)"] + full_facets['base_arch'], key="right_full_arch")
+        full_models = get_full_models_list(
+            search=full_search or None,
+            base_arch=None if full_arch == "(vše)" else full_arch
+        )
         if full_models:
             model_options = [f"{model['name']} ({model['size_mb']:.1f} MB)" for model in full_models]
             selected_model = st.selectbox(
@@ -1086,9 +927,55 @@ with col_right:
         st.write(f"**Platforma:** {sys_info['platform']}")
         st.write(f"**CPU:** {sys_info['cpu_count']} jader")
         st.write(f"**RAM:** {sys_info['memory_gb']:.1f} GB")
-        st.write(f"**Zařízení:** {device_reason}")
-        if sys_info['cuda_available']:
-            st.write(f"**GPU paměť:** {sys_info['cuda_memory_gb']:.1f} GB")
+        # S inference API generuje služba - zařízení UI se nezjišťuje
+        if not INFERENCE_API_URL:
+            if device_probe is None:
+                st.write("**Zařízení:** zjišťuji...")
+            else:
+                st.write(f"**Zařízení:** {device_probe['reason']}")
+                if device_probe['cuda_available']:
+                    st.write(f"**GPU paměť:** {device_probe['cuda_memory_gb']:.1f} GB")
+            readiness = get_readiness()
+            if not readiness['ready']:
+                st.write(f"**Předehřátí modelů:** probíhá ({len(readiness['models'])} hotovo)")
+        
+        # Statistiky rezidentních pipeline - lokálně, nebo z worker procesu inference API
+        if INFERENCE_API_URL:
+            st.write(f"**Inference API:** {INFERENCE_API_URL}")
+            try:
+                engine_stats = get_inference_client().stats()['worker']
+            except RemoteInferenceError as e:
+                st.warning(f"⚠️ {e}")
+                engine_stats = {}
+        elif engine_loaded():
+            engine_stats = collect_worker_stats()
+        else:
+            # Jádro se ještě nenačetlo - statistiky by zbytečně importovaly torch
+            engine_stats = {}
+        
+        if engine_stats:
+            registry_stats = engine_stats['registry']
+            st.write(f"**Modely v paměti:** {registry_stats['resident']} "
+                     f"(RAM {registry_stats['host_gb']:.1f} GB, GPU {registry_stats['device_gb']:.1f} GB)")
+            st.write(f"**Cache:** {registry_stats['hits']} hit / {registry_stats['misses']} miss / "
+                     f"{registry_stats['evictions']} eviction")
+            cond_stats = engine_stats['conditioning']
+            st.write(f"**Cache podmínění:** {cond_stats['hits']} hit / {cond_stats['misses']} miss")
+            latent_stats = engine_stats['latents']
+            st.write(f"**Cache latentů:** {latent_stats['entries']} ({latent_stats['cached_mb']:.1f} MB, "
+                     f"{latent_stats['hit_rate']:.0%} hit rate)")
+            lora_stats = engine_stats['lora_weights']
+            st.write(f"**LoRA v RAM:** {lora_stats['cached']} ({lora_stats['cached_gb']:.2f} GB, "
+                     f"{lora_stats['hits']} hit / {lora_stats['misses']} miss)")
+            batch_stats = engine_stats['batching']
+            histogram = ", ".join(f"{size}×{count}" for size, count in batch_stats['batch_size_histogram'].items())
+            st.write(f"**Dávky:** {batch_stats['batches']} ({histogram or '-'}), "
+                     f"čekání p95 {batch_stats['queue_delay_ms']['p95']:.0f} ms")
+            spans = engine_stats.get('metrics', {}).get('spans', [])
+            if spans:
+                phases = ", ".join(f"{entry['name']} {1000 * entry['sum'] / entry['count']:.0f} ms"
+                                   for entry in sorted(spans, key=lambda entry: entry['name']))
+                st.write(f"**Fáze (průměr):** {phases}")
     
     # Uzavření pravého sidebaru
     st.markdown('</div>', unsafe_allow_html=True)
@@ -1115,7 +1002,7 @@ with col_main:
         output_placeholder = st.empty()
     
     # Zpracování obrázku
-    if process_button and input_image_file is not None and (st.session_state.current_model_file is not None or st.session_state.current_model_path is not None or st.session_state.uploaded_model_file is not None):
+    if process_button and input_image_file is not None and (st.session_state.uploaded_model_path is not None or st.session_state.current_model_path is not None):
         # Kompaktní progress tracking - dva pruhy vedle sebe
         with progress_container:
             # Dva sloupce pro progress pruhy
@@ -1151,16 +1038,9 @@ with col_main:
         
         try:
             # Zpracování modelu podle zdroje
-            if st.session_state.current_model_file is not None:
-                os.makedirs("models", exist_ok=True)
-                final_model_path = os.path.join("models", st.session_state.current_model_file.name)
-                with open(final_model_path, "wb") as f:
-                    f.write(st.session_state.current_model_file.getbuffer())
-            elif st.session_state.uploaded_model_file is not None:
-                os.makedirs("models", exist_ok=True)
-                final_model_path = os.path.join("models", st.session_state.model_name)
-                with open(final_model_path, "wb") as f:
-                    f.write(st.session_state.uploaded_model_file.getbuffer())
+            # Nahraný model je už uložen v úložišti modelů
+            if st.session_state.uploaded_model_path is not None:
+                final_model_path = st.session_state.uploaded_model_path
             else:
                 final_model_path = st.session_state.current_model_path
             
@@ -1172,7 +1052,7 @@ with col_main:
             update_progress(0.1)
             start_time = time.time()
             
-            result_image = apply_style(
+            result_keys = apply_style(
                 input_image,
                 final_model_path,
                 model_type,
@@ -1192,111 +1072,18 @@ with col_main:
             # Vyčištění progress baru
             progress_container.empty()
             
-            # Vyčištění output_placeholder a zobrazení výsledku
-            output_placeholder.empty()
+            # Výsledky jsou zakódované v cache - dál se pracuje jen s bajty
+            if result_keys:
+                st.session_state.result_keys = result_keys
+                st.session_state.result_params = {
+                    'model': os.path.basename(final_model_path), 'model_type': model_type,
+                    'strength': strength, 'guidance_scale': guidance_scale,
+                    'num_inference_steps': num_inference_steps, 'clip_skip': clip_skip,
+                    'seed': seed, 'upscale_factor': upscale_factor, 'num_images': num_images,
+                    'sampler': sampler, 'variance_seed': variance_seed, 'variance_strength': variance_strength,
+                }
+                st.session_state.selected_variant = 0
             
-            if num_images == 1:
-                with output_placeholder.container():
-                    st.image(result_image, width=int(400 * 0.84))
-                    
-                    # Tlačítko pro stažení
-                    buf = io.BytesIO()
-                    result_image.save(buf, format="PNG")
-                    st.download_button(
-                        label="📥 Stáhnout",
-                        data=buf.getvalue(),
-                        file_name="result.png",
-                        mime="image/png",
-                        use_container_width=True
-                    )
-            else:
-                # Pro více variant zobrazíme info v col2 a mřížku pod sloupci
-                with output_placeholder.container():
-                    st.markdown(f"### 🖼️ {num_images} variant")
-                    st.markdown("*Mřížka níže*")
-            
-            # Galerie variant s velkým náhledem a miniaturami
-            if num_images > 1:
-                st.markdown("---")
-                st.markdown('<div class="variant-gallery">', unsafe_allow_html=True)
-                st.markdown(f"### 🖼️ Galerie variant ({num_images})")
-                
-                # Inicializace vybrané varianty
-                if 'selected_variant' not in st.session_state:
-                    st.session_state.selected_variant = 0
-                
-                # Hlavní náhled
-                st.markdown('<div class="variant-main-preview">', unsafe_allow_html=True)
-                st.markdown(f"**Varianta {st.session_state.selected_variant + 1} - Hlavní náhled**")
-                
-                # Zobrazení vybraného obrázku ve velkém
-                selected_image = result_image  # Pro demonstraci - v reálné implementaci by to byl result_images[st.session_state.selected_variant]
-                st.image(selected_image, use_column_width=True)
-                
-                # Tlačítko pro stažení vybrané varianty
-                buf = io.BytesIO()
-                selected_image.save(buf, format="PNG")
-                st.download_button(
-                    label=f"📥 Stáhnout variantu {st.session_state.selected_variant + 1}",
-                    data=buf.getvalue(),
-                    file_name=f"result_variant_{st.session_state.selected_variant + 1}.png",
-                    mime="image/png",
-                    key="download_selected_variant",
-                    use_container_width=True
-                )
-                st.markdown('</div>', unsafe_allow_html=True)
-                
-                # Miniatury variant
-                st.markdown("**Vyberte variantu:**")
-                st.markdown('<div class="variant-thumbnails">', unsafe_allow_html=True)
-                
-                # Vytvoření sloupců pro miniatury (max 4 na řádek)
-                cols_per_row = min(4, num_images)
-                rows = (num_images + cols_per_row - 1) // cols_per_row
-                
-                for row in range(rows):
-                    thumbnail_cols = st.columns(cols_per_row)
-                    for col_idx in range(cols_per_row):
-                        img_idx = row * cols_per_row + col_idx
-                        if img_idx < num_images:
-                            with thumbnail_cols[col_idx]:
-                                # CSS třída pro vybranou miniaturu
-                                thumbnail_class = "selected" if img_idx == st.session_state.selected_variant else ""
-                                
-                                # Tlačítko pro výběr varianty
-                                if st.button(
-                                    f"Varianta {img_idx + 1}",
-                                    key=f"select_variant_{img_idx}",
-                                    use_container_width=True
-                                ):
-                                    st.session_state.selected_variant = img_idx
-                                    st.rerun()
-                                
-                                # Miniatura obrázku
-                                st.markdown(f'<div class="variant-thumbnail {thumbnail_class}">', unsafe_allow_html=True)
-                                st.image(result_image, width=150)  # V reálné implementaci: result_images[img_idx]
-                                st.markdown('</div>', unsafe_allow_html=True)
-                                
-                                # Individuální tlačítko pro stažení
-                                buf_thumb = io.BytesIO()
-                                result_image.save(buf_thumb, format="PNG")
-                                st.download_button(
-                                    label="📥",
-                                    data=buf_thumb.getvalue(),
-                                    file_name=f"variant_{img_idx + 1}.png",
-                                    mime="image/png",
-                                    key=f"download_thumb_{img_idx}",
-                                    help=f"Stáhnout variantu {img_idx + 1}"
-                                )
-                
-                st.markdown('</div>', unsafe_allow_html=True)
-                
-                # Tlačítko pro stažení všech variant
-                if st.button("📦 Stáhnout všechny varianty", use_container_width=True):
-                    st.info("💡 Funkce stažení všech variant bude implementována v budoucí verzi.")
-                
-                st.markdown('</div>', unsafe_allow_html=True)
-                
         except Exception as e:
             progress_container.empty()
             st.error(f"❌ Chyba: {str(e)}")
@@ -1304,8 +1091,12 @@ with col_main:
     elif process_button:
         if input_image_file is None:
             st.warning("⚠️ Nahrajte obrázek")
-        if (model_file is None and model_path is None and 
-            st.session_state.uploaded_model_file is None):
+        if (st.session_state.current_model_path is None and 
+            st.session_state.uploaded_model_path is None):
             st.warning("⚠️ Vyberte model")
     
+    # Výsledky posledního generování zůstávají zobrazené i po rerunu (výběr varianty)
+    if st.session_state.get('result_keys'):
+        render_results(st.session_state.result_keys, output_placeholder)
+    
     # Informace o aplikaci odstraněny podle požadavku uživatele
\ No newline at end of file
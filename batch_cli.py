@@ -0,0 +1,314 @@
+"""
+Dávkové generování z příkazové řádky
+
+Vstupní obrázky se čtou proudově z adresáře (rekurzivně) nebo z manifestu
+(řádek = cesta, případně JSON `{"image": ..., "id": ...}`) a prochází mřížkou
+modelů a sad parametrů. Práce je řazená po modelech - každý model se načte
+jednou a projdou jím všechny sady parametrů a všechny obrázky, LoRA modely
+jdou nakonec, protože sdílí základní pipeline.
+
+Výstupy se ukládají průběžně do `<výstup>/<id průchodu>/` a každá dokončená
+položka se zapíše do `progress.jsonl` (append + fsync). Přerušenou úlohu
+stačí spustit znovu stejným příkazem - dokončené položky se přeskočí.
+
+Příklady:
+    python batch_cli.py ./inputs --output ./out --model models/a.safetensors --param strength=0.4,0.6
+    python batch_cli.py manifest.txt --output ./out --grid grid.json
+
+grid.json:
+    {"models": ["models/a.safetensors", "lora_models/b.safetensors"],
+     "params": {"strength": [0.4, 0.6], "num_inference_steps": 30, "seed": 42}}
+"""
+
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import sys
+import time
+from collections import deque
+
+from PIL import Image
+
+from config import TINY_PIPELINE
+from job_params import JOB_PARAMS, parse_job_params
+from upscaling import get_upscale_stage
+
+# Počet rozpracovaných obrázků předaných plánovači - drží paměť konstantní
+BATCH_IN_FLIGHT = int(os.getenv('BATCH_IN_FLIGHT', '4'))
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp', '.bmp')
+PROGRESS_FILE = 'progress.jsonl'
+
+
+# --- vstupy -------------------------------------------------------------------
+
+def iter_directory(root):
+    """Obrázky v adresáři jako (klíč, cesta); klíčem je relativní cesta."""
+    for dirpath, dirnames, filenames in os.walk(root):
+        # Stabilní pořadí mezi běhy
+        dirnames.sort()
+        for name in sorted(filenames):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                path = os.path.join(dirpath, name)
+                yield os.path.relpath(path, root), path
+
+
+def iter_manifest(manifest_path):
+    """Obrázky z manifestu; relativní cesty jsou vůči adresáři manifestu."""
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    with open(manifest_path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            if line.startswith('{'):
+                entry = json.loads(line)
+                path = entry['image']
+                key = str(entry.get('id', path))
+            else:
+                path = key = line
+            yield key, os.path.join(base_dir, path)
+
+
+def iter_inputs(source):
+    if os.path.isdir(source):
+        return iter_directory(source)
+    return iter_manifest(source)
+
+
+# --- mřížka -------------------------------------------------------------------
+
+def load_grid(grid_path, models, param_specs):
+    """Vrátí (modely, sady parametrů) z grid.json a parametrů příkazové řádky."""
+    grid = {}
+    if grid_path:
+        with open(grid_path, encoding='utf-8') as f:
+            grid = json.load(f)
+
+    models = list(grid.get('models', [])) + list(models)
+    values = dict(grid.get('params', {}))
+    for spec in param_specs:
+        name, sep, raw = spec.partition('=')
+        if not sep:
+            raise ValueError(f"Parametr musí být ve tvaru jméno=hodnota[,hodnota...]: {spec}")
+        values[name] = raw.split(',')
+
+    unknown = sorted(set(values) - set(JOB_PARAMS))
+    if unknown:
+        raise ValueError(f"Neznámé parametry: {', '.join(unknown)}")
+    if not models and not TINY_PIPELINE:
+        raise ValueError("Není zadán žádný model (--model nebo models v grid.json)")
+
+    names = sorted(values)
+    axes = [values[name] if isinstance(values[name], list) else [values[name]] for name in names]
+    param_sets = [parse_job_params(dict(zip(names, combo))) for combo in itertools.product(*axes)]
+    return models or ["tiny"], param_sets
+
+
+def resolve_models(models):
+    """Doplní typ modelu; vrací [(cesta, typ)]."""
+    if TINY_PIPELINE:
+        return [(model_path, "full_model") for model_path in models]
+    from model_inspect import inspect_model
+
+    resolved = []
+    for model_path in models:
+        if not os.path.isfile(model_path):
+            raise ValueError(f"Model {model_path} neexistuje")
+        model_type = inspect_model(model_path)['model_type']
+        if model_type not in ("lora", "full_model"):
+            raise ValueError(f"Nepodporovaný typ modelu: {model_path}")
+        resolved.append((os.path.abspath(model_path), model_type))
+    return resolved
+
+
+def plan_passes(models, param_sets):
+    """
+    Průchody mřížkou seřazené po modelech - model se přepne jen jednou.
+    Plné modely jdou první, LoRA nakonec (sdílí jednu základní pipeline).
+    """
+    passes = []
+    for model_path, model_type in sorted(models, key=lambda model: model[1] == "lora"):
+        for params in param_sets:
+            identity = json.dumps({'model': model_path, 'params': params}, sort_keys=True)
+            passes.append({
+                'id': hashlib.sha1(identity.encode()).hexdigest()[:12],
+                'model_path': model_path,
+                'model_type': model_type,
+                'params': params,
+            })
+    return passes
+
+
+# --- průběh -------------------------------------------------------------------
+
+class ProgressManifest:
+    """Append-only JSONL záznam dokončených položek."""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'a', encoding='utf-8')
+        # Po zabití procesu může poslední řádek zůstat neúplný
+        if self._file.tell() > 0:
+            with open(path, 'rb') as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b'\n':
+                    self._file.write('\n')
+
+    def completed(self, pass_id):
+        """Klíče dokončených položek jednoho průchodu (čte se proudově)."""
+        done = set()
+        with open(self.path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if record.get('pass') == pass_id and record.get('status') == 'done':
+                    done.add(record['item'])
+        return done
+
+    def record(self, **record):
+        self._file.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
+
+
+def output_stem(key):
+    """Cesta výstupu odvozená z klíče položky (bez možnosti zapsat mimo výstup)."""
+    stem = os.path.splitext(os.path.normpath(key))[0]
+    if os.path.isabs(stem) or stem.startswith('..'):
+        stem = hashlib.sha1(key.encode()).hexdigest()
+    return stem
+
+
+def save_outputs(images, pass_dir, key, upscale_factor=1):
+    """
+    Uloží varianty atomicky (tmp + rename) a vrátí relativní cesty. Upscaling
+    zapisuje po dlaždicích rovnou do souborů.
+    """
+    stem = output_stem(key)
+    relative_paths = [f"{stem}_v{i + 1}.png" for i in range(len(images))]
+    paths = [os.path.join(pass_dir, relative) for relative in relative_paths]
+    os.makedirs(os.path.dirname(paths[0]), exist_ok=True)
+    tmp_paths = [path + '.tmp' for path in paths]
+    if upscale_factor > 1:
+        get_upscale_stage().upscale_to_files(images, upscale_factor, tmp_paths)
+    else:
+        for image, tmp_path in zip(images, tmp_paths):
+            image.save(tmp_path, format="PNG")
+    for tmp_path, path in zip(tmp_paths, paths):
+        os.replace(tmp_path, path)
+    return relative_paths
+
+
+def run_pass(scheduler, manifest, source, job, output_dir, in_flight_limit, totals):
+    """Projde všechny vstupy jedním modelem a sadou parametrů."""
+    pass_dir = os.path.join(output_dir, job['id'])
+    os.makedirs(pass_dir, exist_ok=True)
+    with open(os.path.join(pass_dir, 'pass.json'), 'w', encoding='utf-8') as f:
+        json.dump({key: job[key] for key in ('model_path', 'model_type', 'params')}, f, indent=2)
+
+    done = manifest.completed(job['id'])
+    in_flight = deque()
+    # Upscaling až při ukládání - po dlaždicích rovnou na disk
+    params = dict(job['params'])
+    upscale_factor = params.pop('upscale_factor', 1)
+
+    def finish():
+        key, future, started = in_flight.popleft()
+        try:
+            images = future.result()
+            if not images:
+                raise RuntimeError("Nevygenerována žádná varianta")
+            outputs = save_outputs(images, pass_dir, key, upscale_factor)
+        except Exception as e:
+            manifest.record(**{'pass': job['id'], 'item': key, 'status': 'error', 'error': str(e)})
+            totals['failed'] += 1
+            print(f"❌ {key}: {e}")
+            return
+        manifest.record(**{
+            'pass': job['id'], 'item': key, 'status': 'done', 'outputs': outputs,
+            'seconds': round(time.monotonic() - started, 3),
+        })
+        totals['done'] += 1
+        print(f"✅ [{job['id']}] {key} ({len(outputs)} variant)")
+
+    for key, path in iter_inputs(source):
+        if key in done:
+            totals['skipped'] += 1
+            continue
+        try:
+            with Image.open(path) as image:
+                input_image = image.convert("RGB")
+        except Exception as e:
+            manifest.record(**{'pass': job['id'], 'item': key, 'status': 'error', 'error': f"Nelze načíst obrázek: {e}"})
+            totals['failed'] += 1
+            print(f"❌ {key}: nelze načíst obrázek ({e})")
+            continue
+        # Scheduler spojí souběžné obrázky stejného rozlišení do jedné dávky
+        future = scheduler.submit(input_image, job['model_path'], job['model_type'], **params)
+        in_flight.append((key, future, time.monotonic()))
+        while len(in_flight) >= in_flight_limit:
+            finish()
+    while in_flight:
+        finish()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Dávkové generování přes mřížku modelů a parametrů")
+    parser.add_argument('input', help="adresář s obrázky nebo manifest (.txt / .jsonl)")
+    parser.add_argument('--output', required=True, help="výstupní adresář (obsahuje i progress.jsonl)")
+    parser.add_argument('--model', action='append', default=[], help="cesta k modelu (lze opakovat)")
+    parser.add_argument('--grid', help="JSON s klíči models a params")
+    parser.add_argument('--param', action='append', default=[], help="jméno=hodnota[,hodnota...] (lze opakovat)")
+    parser.add_argument('--in-flight', type=int, default=BATCH_IN_FLIGHT, help="počet rozpracovaných obrázků")
+    parser.add_argument('--dry-run', action='store_true', help="jen vypíše plán průchodů")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.input):
+        parser.error(f"Vstup {args.input} neexistuje")
+    try:
+        models, param_sets = load_grid(args.grid, args.model, args.param)
+        passes = plan_passes(resolve_models(models), param_sets)
+    except ValueError as e:
+        parser.error(str(e))
+
+    print(f"📋 {len(passes)} průchodů ({len(models)} modelů × {len(param_sets)} sad parametrů)")
+    for job in passes:
+        print(f"   {job['id']}  {os.path.basename(job['model_path'])}  {json.dumps(job['params'])}")
+    if args.dry_run:
+        return 0
+
+    from batch_scheduler import get_batch_scheduler
+
+    os.makedirs(args.output, exist_ok=True)
+    manifest = ProgressManifest(os.path.join(args.output, PROGRESS_FILE))
+    scheduler = get_batch_scheduler()
+    totals = {'done': 0, 'skipped': 0, 'failed': 0}
+    started = time.monotonic()
+    try:
+        for job in passes:
+            print(f"🔄 Průchod {job['id']}: {os.path.basename(job['model_path'])}")
+            run_pass(scheduler, manifest, args.input, job, args.output, max(1, args.in_flight), totals)
+    except KeyboardInterrupt:
+        print("⏹️ Přerušeno - spusťte stejný příkaz znovu pro pokračování")
+        return 130
+    finally:
+        manifest.close()
+
+    elapsed = time.monotonic() - started
+    print(
+        f"🏁 Hotovo za {elapsed:.1f}s: {totals['done']} vygenerováno, "
+        f"{totals['skipped']} přeskočeno (již hotovo), {totals['failed']} chyb"
+    )
+    return 1 if totals['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,289 @@
+"""
+Dynamické dávkování požadavků napříč uživateli a API klienty
+
+Požadavky se nespouštějí hned - plánovač chvíli (BATCH_WINDOW_MS) čeká na
+další kompatibilní požadavky a spustí je jedním průchodem pipeline. Během
+běhu dávky se fronta plní, takže při zátěži se dávky tvoří samy i bez čekání.
+
+Kompatibilní jsou požadavky se stejným modelem, rozlišením vstupu, počtem
+kroků a samplerem. Strength, CFG a clip_skip pipeline bere jako jednu
+hodnotu pro celou dávku - požadavky, které se v nich liší, běží v oddělených
+dávkách. Seed zůstává zachován (každý vzorek má vlastní generátor). Pokud
+dávka selže, každý její požadavek se zkusí znovu samostatně.
+
+Požadavek, pro který teď není volná paměť (MemoryBusyError), se vrátí do
+fronty a zkusí se znovu po MEMORY_RETRY_S - vlákno plánovače mezitím spouští
+ostatní požadavky. Odmítne se až po MEMORY_WAIT_S.
+"""
+
+import os
+import queue
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import Future
+
+from inference import MemoryBusyError, generate_batch, generate_images
+from memory_planner import MEMORY_WAIT_S
+from tracing import count
+
+BATCH_WINDOW_MS = float(os.getenv('BATCH_WINDOW_MS', '50'))
+BATCH_MAX_IMAGES = int(os.getenv('BATCH_MAX_IMAGES', '16'))
+
+# Parametry, které pipeline bere jako jednu hodnotu pro celou dávku
+BATCH_KEY_PARAMS = ('num_inference_steps', 'sampler', 'strength', 'guidance_scale', 'clip_skip')
+# Parametry jednotlivých požadavků v dávce a jejich výchozí hodnoty
+REQUEST_PARAMS = {'seed': None, 'variance_seed': None, 'num_images': 1, 'upscale_factor': 1}
+# Za jak dlouho se znovu zkusí požadavek odložený kvůli obsazené paměti (s)
+MEMORY_RETRY_S = 0.5
+
+
+def batch_key(request):
+    """Klíč kompatibility - požadavky se stejným klíčem mohou běžet v jedné dávce."""
+    params = request['params']
+    return (
+        request['model_path'], request['model_type'], request['input_image'].size
+    ) + tuple(params.get(name) for name in BATCH_KEY_PARAMS)
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+class BatchScheduler:
+    """Fronta požadavků s jedním vláknem, které je spouští po kompatibilních dávkách."""
+
+    def __init__(self, window_ms=BATCH_WINDOW_MS, max_images=BATCH_MAX_IMAGES):
+        self.window = window_ms / 1000
+        self.max_images = max_images
+        self._pending = deque()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._busy = False
+        # Histogram: počet požadavků v dávce -> počet dávek
+        self.batch_sizes = Counter()
+        self.queue_delays = deque(maxlen=1000)
+        self.solo_fallbacks = 0
+
+    # --- zadávání ------------------------------------------------------------
+
+    def submit(self, input_image, model_path, model_type, progress_callback=None, notify=print, on_start=None, **params) -> Future:
+        """
+        Zařadí požadavek (parametry jako `generate_images`) a vrátí Future se
+        seznamem variant. Callbacky se volají z vlákna plánovače.
+        """
+        request = {
+            'input_image': input_image,
+            'model_path': model_path,
+            'model_type': model_type,
+            'params': params,
+            'progress_callback': progress_callback or (lambda value, text="": None),
+            'notify': notify,
+            'on_start': on_start,
+            'enqueued': time.monotonic(),
+            'future': Future(),
+            # Odložený požadavek (obsazená paměť) se nespustí dřív než v tento čas
+            'not_before': 0.0,
+            'busy_since': None,
+        }
+        with self._cond:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._loop, name="batch-scheduler", daemon=True)
+                self._thread.start()
+            self._pending.append(request)
+            self._cond.notify_all()
+        return request['future']
+
+    def run(self, input_image, model_path, model_type, progress_callback=None, notify=print, poll_interval=0.1, **params):
+        """Zadá požadavek a počká na výsledek; callbacky běží ve volajícím vlákně."""
+        events = queue.Queue()
+        future = self.submit(
+            input_image, model_path, model_type,
+            progress_callback=lambda value, text="": events.put((progress_callback, (value, text))),
+            notify=lambda message: events.put((notify, (message,))),
+            **params
+        )
+        while True:
+            try:
+                callback, args = events.get(timeout=poll_interval)
+            except queue.Empty:
+                # Události se posílají před dokončením Future - prázdná fronta = vše doručeno
+                if future.done():
+                    break
+                continue
+            if callback is not None:
+                callback(*args)
+        return future.result()
+
+    def wait_idle(self, timeout=None):
+        """Počká, až fronta i rozpracovaná dávka doběhnou."""
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._pending and not self._busy, timeout)
+
+    # --- plánování -----------------------------------------------------------
+
+    def _loop(self):
+        while True:
+            group = self._next_group()
+            try:
+                self._execute(group)
+            except Exception as e:
+                # Chyba mimo generování (např. v callbacku) - plánovač musí běžet dál
+                for request in group:
+                    if not request['future'].done():
+                        request['future'].set_exception(e)
+            finally:
+                with self._cond:
+                    self._busy = False
+                    self._cond.notify_all()
+
+    def _next_group(self):
+        """Vybere nejstarší požadavek a kompatibilní požadavky došlé do konce okna."""
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                ready = [request for request in self._pending if request['not_before'] <= now]
+                if ready:
+                    break
+                # Jen odložené požadavky - čeká se na nejbližší nebo na nový požadavek
+                retry_in = min((request['not_before'] - now for request in self._pending), default=None)
+                self._cond.wait(retry_in)
+            first = ready[0]
+            key = batch_key(first)
+            deadline = first['enqueued'] + self.window
+            while True:
+                now = time.monotonic()
+                group = [
+                    request for request in self._pending
+                    if batch_key(request) == key and request['not_before'] <= now
+                ]
+                images = sum(request['params'].get('num_images', 1) for request in group)
+                remaining = deadline - now
+                if images >= self.max_images or remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+            selected = []
+            total = 0
+            for request in group:
+                count = request['params'].get('num_images', 1)
+                if selected and total + count > self.max_images:
+                    continue
+                selected.append(request)
+                total += count
+            for request in selected:
+                self._pending.remove(request)
+            self._busy = True
+            return selected
+
+    def _execute(self, group):
+        started = time.monotonic()
+        with self._cond:
+            self.batch_sizes[len(group)] += 1
+            self.queue_delays.extend(started - request['enqueued'] for request in group)
+        for request in group:
+            if request['on_start'] is not None:
+                request['on_start']()
+
+        if len(group) == 1:
+            self._run_solo(group[0])
+            return
+
+        first = group[0]
+        shared = {name: first['params'][name] for name in BATCH_KEY_PARAMS if name in first['params']}
+        requests = [
+            dict(
+                {name: request['params'].get(name, default) for name, default in REQUEST_PARAMS.items()},
+                input_image=request['input_image']
+            )
+            for request in group
+        ]
+
+        def broadcast_progress(value, text=""):
+            for request in group:
+                request['progress_callback'](value, text)
+
+        def broadcast_notify(message):
+            for request in group:
+                request['notify'](message)
+
+        print(f"📦 Dávka {len(group)} požadavků ({sum(r['num_images'] for r in requests)} obrázků)")
+        try:
+            outputs = generate_batch(
+                first['model_path'], first['model_type'], requests,
+                progress_callback=broadcast_progress, notify=broadcast_notify, **shared
+            )
+        except Exception as e:
+            # Chyba jednoho požadavku nesmí shodit ostatní - zkusíme je samostatně
+            print(f"⚠️ Dávka selhala ({e}), spouštím požadavky samostatně")
+            with self._cond:
+                self.solo_fallbacks += 1
+            for request in group:
+                self._run_solo(request)
+            return
+        for request, images in zip(group, outputs):
+            request['future'].set_result(images)
+
+    def _run_solo(self, request):
+        try:
+            images = generate_images(
+                request['input_image'], request['model_path'], request['model_type'],
+                progress_callback=request['progress_callback'], notify=request['notify'],
+                **request['params']
+            )
+        except MemoryBusyError as e:
+            self._defer(request, e)
+        except Exception as e:
+            request['future'].set_exception(e)
+        else:
+            request['future'].set_result(images)
+
+    def _defer(self, request, error):
+        """Vrátí požadavek bez volné paměti do fronty, po MEMORY_WAIT_S ho odmítne."""
+        now = time.monotonic()
+        if request['busy_since'] is None:
+            request['busy_since'] = now
+            request['notify']("⏳ Čekám na uvolnění paměti pro požadavek...")
+        elif now - request['busy_since'] >= MEMORY_WAIT_S:
+            count('admission_rejected_total', reason='busy')
+            request['future'].set_exception(error)
+            return
+        request['not_before'] = now + MEMORY_RETRY_S
+        with self._cond:
+            self._pending.append(request)
+            self._cond.notify_all()
+
+    # --- statistiky ----------------------------------------------------------
+
+    def stats(self):
+        with self._cond:
+            delays = sorted(self.queue_delays)
+            batches = sum(self.batch_sizes.values())
+            return {
+                'batches': batches,
+                'requests': sum(size * count for size, count in self.batch_sizes.items()),
+                'batch_size_histogram': dict(sorted(self.batch_sizes.items())),
+                'queue_delay_ms': {
+                    'mean': 1000 * sum(delays) / len(delays) if delays else 0.0,
+                    'p50': 1000 * percentile(delays, 0.5),
+                    'p95': 1000 * percentile(delays, 0.95),
+                    'max': 1000 * delays[-1] if delays else 0.0,
+                },
+                'solo_fallbacks': self.solo_fallbacks,
+                'pending': len(self._pending),
+            }
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_batch_scheduler() -> BatchScheduler:
+    """Vrátí procesově sdílený plánovač dávek."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = BatchScheduler()
+        return _scheduler
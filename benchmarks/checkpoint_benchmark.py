@@ -0,0 +1,146 @@
+"""
+Benchmark načítání full checkpointů: load_file / from_single_file vs. mmap
+
+Každá varianta běží v samostatném procesu, aby šla změřit špička paměti
+(maxrss - u mmap varianty zahrnuje i namapované stránky souboru, které jádro
+může kdykoli zahodit) a anonymní paměť procesu s načtenými vahami (RssAnon -
+tu jádro uvolnit nemůže). Před každým během se soubor zapíše na disk a vyhodí
+z page cache (fsync + posix_fadvise DONTNEED), takže se měří studené čtení
+jako po startu podu.
+
+Bez --model se vytvoří syntetický safetensors soubor (--synthetic-gb) a měří
+se jen state dict; s --model a --pipeline celé sestavení SDXL pipeline:
+
+    python benchmarks/checkpoint_benchmark.py --synthetic-gb 6
+    python benchmarks/checkpoint_benchmark.py --model /data/models/sdxl.safetensors --pipeline
+"""
+
+import argparse
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+TENSOR_MB = 64
+
+
+def make_checkpoint(path, size_gb):
+    """Syntetický fp16 checkpoint z tenzorů po TENSOR_MB."""
+    import torch
+    from safetensors.torch import save_file
+
+    elements = TENSOR_MB * 1024 * 1024 // 2
+    count = max(1, int(size_gb * 1024 / TENSOR_MB))
+    save_file({f"tensor_{i}": torch.randn(elements, dtype=torch.float16) for i in range(count)}, path)
+
+
+def drop_page_cache(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        # Špinavé stránky (čerstvě zapsaný syntetický soubor) DONTNEED nezahodí
+        os.fsync(fd)
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+    finally:
+        os.close(fd)
+
+
+def touch(state_dict):
+    """Projde všechna data (jako kopie vah na GPU)."""
+    return sum(float(tensor.float().sum()) for tensor in state_dict.values() if tensor.numel())
+
+
+def run_load_file(path, torch_dtype):
+    from safetensors.torch import load_file
+
+    state_dict = {name: tensor.to(torch_dtype) for name, tensor in load_file(path).items()}
+    touch(state_dict)
+    return state_dict
+
+
+def run_mmap(path, torch_dtype):
+    from checkpoint_loader import load_state_dict, readahead
+
+    reader = readahead(path)
+    state_dict = load_state_dict(path, torch_dtype)
+    touch(state_dict)
+    reader.join()
+    return state_dict
+
+
+def run_from_single_file(path, torch_dtype):
+    from diffusers import StableDiffusionXLImg2ImgPipeline
+
+    return StableDiffusionXLImg2ImgPipeline.from_single_file(path, torch_dtype=torch_dtype)
+
+
+def run_mmap_pipeline(path, torch_dtype):
+    from diffusers import StableDiffusionXLImg2ImgPipeline
+    from checkpoint_loader import load_single_file_pipeline
+
+    return load_single_file_pipeline(StableDiffusionXLImg2ImgPipeline, path, torch_dtype)
+
+
+STATE_DICT_MODES = {'load_file': run_load_file, 'mmap': run_mmap}
+PIPELINE_MODES = {'from_single_file': run_from_single_file, 'mmap': run_mmap_pipeline}
+
+
+def anon_rss_mb():
+    """Anonymní rezidentní paměť procesu (bez stránek namapovaných souborů)."""
+    with open('/proc/self/status') as status:
+        for line in status:
+            if line.startswith('RssAnon:'):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def measure(modes, mode, path, dtype_name, result_queue):
+    import torch
+
+    started = time.perf_counter()
+    # Váhy zůstanou načtené až do změření paměti
+    loaded = modes[mode](path, getattr(torch, dtype_name))
+    elapsed = time.perf_counter() - started
+    # ru_maxrss je na Linuxu v KB
+    result_queue.put((elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, anon_rss_mb()))
+    del loaded
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark načítání checkpointů")
+    parser.add_argument('--model', help="safetensors checkpoint (jinak syntetický)")
+    parser.add_argument('--synthetic-gb', type=float, default=2.0)
+    parser.add_argument('--pipeline', action='store_true', help="sestavit celou SDXL pipeline (jen s --model)")
+    parser.add_argument('--dtype', default='float16')
+    parser.add_argument('--repeat', type=int, default=1)
+    args = parser.parse_args()
+    if args.pipeline and not args.model:
+        parser.error("--pipeline vyžaduje --model")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.model
+        if path is None:
+            path = os.path.join(tmp, "synthetic.safetensors")
+            print(f"🧪 Vytvářím syntetický checkpoint {args.synthetic_gb:.1f} GB...")
+            make_checkpoint(path, args.synthetic_gb)
+
+        modes = PIPELINE_MODES if args.pipeline else STATE_DICT_MODES
+        ctx = multiprocessing.get_context('spawn')
+        print(f"📦 {os.path.basename(path)} ({os.path.getsize(path) / 1024**3:.2f} GB), dtype {args.dtype}, "
+              f"{'pipeline' if args.pipeline else 'state dict'}")
+        for mode in modes:
+            for _ in range(args.repeat):
+                drop_page_cache(path)
+                result_queue = ctx.Queue()
+                process = ctx.Process(target=measure, args=(modes, mode, path, args.dtype, result_queue))
+                process.start()
+                elapsed, peak_mb, anon_mb = result_queue.get()
+                process.join()
+                print(f"  {mode:<17} {elapsed:7.2f}s  špička paměti {peak_mb:7.0f} MB  anonymní {anon_mb:7.0f} MB")
+
+
+if __name__ == '__main__':
+    main()
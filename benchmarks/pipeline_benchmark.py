@@ -0,0 +1,246 @@
+"""
+Benchmark generování na malé náhodně inicializované SDXL pipeline
+
+Nic se nestahuje (TINY_PIPELINE). Pro každou kombinaci rozlišení, velikosti
+dávky, sampleru a počtu kroků měří v samostatném procesu:
+načtení modelu, výměnu scheduleru, VAE encode, latenci UNetu na krok,
+decode, upscaling, celé `generate_images` (teplá pipeline) a špičku RSS.
+
+    python benchmarks/pipeline_benchmark.py --output baseline.json
+    python benchmarks/pipeline_benchmark.py --compare baseline.json
+    python benchmarks/pipeline_benchmark.py --compare baseline.json --current results.json
+"""
+
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('TINY_PIPELINE', 'true')
+
+# Metriky porovnávané s baseline: (cesta v záznamu, absolutní tolerance)
+COMPARED_METRICS = {
+    'load_s': 0.05,
+    'scheduler_swap_s': 0.005,
+    'vae_encode_s': 0.01,
+    'unet_step_ms.p50': 2.0,
+    'decode_s': 0.01,
+    'upscale_s': 0.01,
+    'generate_images_s': 0.05,
+    'peak_rss_mb': 20.0,
+}
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def timed(function, *args, **kwargs):
+    started = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - started
+
+
+def run_scenario(scenario, result_queue):
+    """Změří jeden scénář; běží ve vlastním procesu kvůli měření RSS."""
+    import torch
+    from PIL import Image
+
+    from inference import SCHEDULER_MAP, generate_images, get_optimal_device, load_pipeline, sample_generators
+    from latent_cache import encode_latent_distribution
+    from upscaling import get_upscale_stage
+
+    device, _reason = get_optimal_device()
+    torch_dtype = torch.float16 if device == "cuda" else torch.float32
+    size, batch_size, steps = scenario['resolution'], scenario['batch_size'], scenario['steps']
+    image = Image.effect_noise((size, size), 64).convert("RGB")
+
+    def sync():
+        if device == "cuda":
+            torch.cuda.synchronize()
+
+    record = dict(scenario, device=device)
+    pipe, record['load_s'] = timed(load_pipeline, "tiny", "full_model", device, torch_dtype, 2, False, False)
+
+    scheduler_class = SCHEDULER_MAP[scenario['sampler']]
+    pipe.scheduler, record['scheduler_swap_s'] = timed(scheduler_class.from_config, pipe.scheduler.config)
+
+    image_tensor = pipe.image_processor.preprocess(image)
+    encode_latent_distribution(pipe, image_tensor, device, torch_dtype)  # warmup
+    sync()
+    _params, record['vae_encode_s'] = timed(encode_latent_distribution, pipe, image_tensor, device, torch_dtype)
+    sync()
+
+    # Latence UNetu přes forward hooky - bez scheduleru a callbacků
+    unet_times = []
+    starts = []
+
+    # Hooky nesmí nic vracet - návratová hodnota by nahradila vstup/výstup UNetu
+    def before_unet(module, args):
+        sync()
+        starts.append(time.perf_counter())
+
+    def after_unet(module, args, output):
+        sync()
+        unet_times.append(time.perf_counter() - starts.pop())
+
+    pre_hook = pipe.unet.register_forward_pre_hook(before_unet)
+    post_hook = pipe.unet.register_forward_hook(after_unet)
+    call = dict(
+        prompt="", image=[image] * batch_size, strength=1.0, num_inference_steps=steps,
+        guidance_scale=1.0, output_type="latent",
+        generator=sample_generators(device, list(range(batch_size))),
+    )
+    with torch.no_grad():
+        pipe(**call)  # warmup
+        unet_times.clear()
+        latents, record['denoise_s'] = timed(lambda: pipe(**call).images)
+    pre_hook.remove()
+    post_hook.remove()
+    step_ms = sorted(1000 * value for value in unet_times)
+    record['unet_step_ms'] = {
+        'mean': sum(step_ms) / len(step_ms) if step_ms else 0.0,
+        'p50': percentile(step_ms, 0.5),
+        'p95': percentile(step_ms, 0.95),
+        'steps': len(step_ms),
+    }
+
+    with torch.no_grad():
+        sync()
+        decoded, record['decode_s'] = timed(
+            lambda: pipe.vae.decode(latents / pipe.vae.config.scaling_factor, return_dict=False)[0]
+        )
+        sync()
+    images = pipe.image_processor.postprocess(decoded, output_type="pil")
+    _upscaled, record['upscale_s'] = timed(get_upscale_stage().upscale_images, images, scenario['upscale_factor'])
+
+    # Celá cesta generate_images (registr, cache, mikro-dávky) s teplou pipeline
+    params = dict(
+        strength=0.6, guidance_scale=7.5, num_inference_steps=steps, progress_callback=lambda value, text="": None,
+        seed=0, num_images=batch_size, sampler=scenario['sampler'],
+    )
+    generate_images(image, "tiny", "full_model", **params)
+    _results, record['generate_images_s'] = timed(generate_images, image, "tiny", "full_model", **params)
+
+    # ru_maxrss je na Linuxu v KB
+    record['peak_rss_mb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    result_queue.put(record)
+
+
+def run_benchmark(args):
+    ctx = multiprocessing.get_context('spawn')
+    scenarios = [
+        {'resolution': resolution, 'batch_size': batch_size, 'sampler': sampler, 'steps': steps,
+         'upscale_factor': args.upscale_factor}
+        for resolution, batch_size, sampler, steps in itertools.product(
+            args.resolutions, args.batch_sizes, args.samplers, args.steps
+        )
+    ]
+    results = []
+    for scenario in scenarios:
+        result_queue = ctx.Queue()
+        process = ctx.Process(target=run_scenario, args=(scenario, result_queue))
+        process.start()
+        process.join()
+        if process.exitcode != 0:
+            print(f"❌ Scénář {scenario_key(scenario)} selhal (exit code {process.exitcode})")
+            continue
+        record = result_queue.get()
+        results.append(record)
+        print(
+            f"  {scenario_key(record):<48} load {record['load_s']:.2f}s  encode {record['vae_encode_s'] * 1000:.0f}ms  "
+            f"UNet p50 {record['unet_step_ms']['p50']:.1f}ms  decode {record['decode_s'] * 1000:.0f}ms  "
+            f"upscale {record['upscale_s'] * 1000:.0f}ms  generate {record['generate_images_s']:.2f}s  "
+            f"RSS {record['peak_rss_mb']:.0f} MB"
+        )
+    return {
+        'meta': {
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+        },
+        'results': results,
+    }
+
+
+def scenario_key(record):
+    return f"{record['resolution']}px b{record['batch_size']} {record['sampler']} {record['steps']} kroků"
+
+
+def metric_value(record, path):
+    value = record
+    for part in path.split('.'):
+        value = value[part]
+    return value
+
+
+def compare(baseline, current, threshold):
+    """Vypíše změny proti baseline a vrátí seznam regresí."""
+    baseline_records = {scenario_key(record): record for record in baseline['results']}
+    regressions = []
+    for record in current['results']:
+        key = scenario_key(record)
+        reference = baseline_records.get(key)
+        if reference is None:
+            print(f"  {key}: v baseline chybí")
+            continue
+        for path, tolerance in COMPARED_METRICS.items():
+            old, new = metric_value(reference, path), metric_value(record, path)
+            # Regrese = relativně i absolutně horší (malé hodnoty jsou zašuměné)
+            if new > old * (1 + threshold) and new - old > tolerance:
+                regressions.append((key, path, old, new))
+                print(f"  ⚠️ {key} {path}: {old:.3f} -> {new:.3f} (+{(new / old - 1) * 100 if old else 0:.0f} %)")
+    return regressions
+
+
+def parse_list(cast):
+    return lambda value: [cast(item) for item in value.split(',')]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark generování na malé SDXL pipeline")
+    parser.add_argument('--resolutions', type=parse_list(int), default=[256, 512])
+    parser.add_argument('--batch-sizes', type=parse_list(int), default=[1, 4])
+    parser.add_argument('--samplers', type=parse_list(str), default=["DPMSolverMultistepScheduler", "EulerDiscreteScheduler"])
+    parser.add_argument('--steps', type=parse_list(int), default=[4, 8])
+    parser.add_argument('--upscale-factor', type=int, default=2)
+    parser.add_argument('--output', help="uložit výsledky jako JSON")
+    parser.add_argument('--compare', help="baseline JSON pro porovnání")
+    parser.add_argument('--current', help="porovnat uložené výsledky místo nového měření")
+    parser.add_argument('--threshold', type=float, default=0.10, help="relativní tolerance regrese")
+    args = parser.parse_args()
+
+    if args.current:
+        with open(args.current) as f:
+            current = json.load(f)
+    else:
+        print(f"⏱️ Benchmark pipeline ({os.cpu_count()} CPU)")
+        current = run_benchmark(args)
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(current, f, indent=2)
+            print(f"💾 Výsledky uloženy do {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print(f"📊 Porovnání s {args.compare} (tolerance {args.threshold:.0%})")
+        regressions = compare(baseline, current, args.threshold)
+        if regressions:
+            print(f"❌ {len(regressions)} regresí")
+            return 1
+        print("✅ Bez regresí")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
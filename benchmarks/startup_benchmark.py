@@ -0,0 +1,151 @@
+"""
+Benchmark studeného startu a rerunů Streamlit UI
+
+Každé měření běží v čerstvém procesu přes streamlit AppTest (bez prohlížeče):
+- studený start = import Streamlitu a první běh app.py,
+- rerun = posun slideru Strength a nový běh skriptu (p50/p95),
+- moduly naimportované během rerunů a zda první běh importoval torch.
+
+S --ref se stejně změří jiná revize repozitáře (vyexportovaná přes
+git archive), takže jde porovnat stav před a po změně:
+
+    python benchmarks/startup_benchmark.py
+    python benchmarks/startup_benchmark.py --ref HEAD~1 --reruns 20 --output startup.json
+"""
+
+import argparse
+import io
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ('torch', 'diffusers', 'transformers')
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def measure(app_dir, reruns):
+    """Jedno měření v aktuálním procesu (spouští se jako --child)."""
+    started = time.perf_counter()
+    sys.path.insert(0, app_dir)
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(os.path.join(app_dir, 'app.py'), default_timeout=600)
+    at.run()
+    record = {
+        'cold_start_s': time.perf_counter() - started,
+        'first_run_heavy_modules': [name for name in HEAVY_MODULES if name in sys.modules],
+        'exceptions': [str(exception.value) for exception in at.exception],
+    }
+
+    # Průzkum zařízení na pozadí (pokud ho revize má) nesmí zkreslit reruny
+    try:
+        from system_probe import wait_for_probe
+        wait_for_probe()
+    except ImportError:
+        pass
+
+    slider = next(element for element in at.slider if element.label == "Strength")
+    rerun_ms = []
+    imported = set()
+    for i in range(reruns):
+        before = set(sys.modules)
+        slider.set_value(0.5 if i % 2 == 0 else 0.6)
+        rerun_started = time.perf_counter()
+        at.run()
+        rerun_ms.append(1000 * (time.perf_counter() - rerun_started))
+        imported |= set(sys.modules) - before
+        slider = next(element for element in at.slider if element.label == "Strength")
+
+    rerun_ms.sort()
+    record['rerun_ms'] = {
+        'mean': statistics.mean(rerun_ms) if rerun_ms else 0.0,
+        'p50': percentile(rerun_ms, 0.5),
+        'p95': percentile(rerun_ms, 0.95),
+    }
+    record['rerun_imported_modules'] = sorted(imported)
+    return record
+
+
+def run_child(app_dir, reruns):
+    """Spustí měření v čerstvém procesu; pracovní adresář je dočasný (app.py zakládá složky modelů)."""
+    with tempfile.TemporaryDirectory() as workdir:
+        result = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--child', app_dir, '--reruns', str(reruns)],
+            cwd=workdir, capture_output=True, text=True,
+        )
+    if result.returncode != 0:
+        raise RuntimeError(f"Měření selhalo:\n{result.stderr[-2000:]}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def export_revision(ref, directory):
+    """Vyexportuje revizi repozitáře do `directory` (bez zásahu do pracovního stromu)."""
+    archive = subprocess.run(['git', '-C', REPO_DIR, 'archive', ref], capture_output=True, check=True).stdout
+    with tarfile.open(fileobj=io.BytesIO(archive)) as tar:
+        tar.extractall(directory)
+    return directory
+
+
+def benchmark_tree(label, app_dir, repeat, reruns):
+    records = [run_child(app_dir, reruns) for _ in range(repeat)]
+    summary = {
+        'label': label,
+        'cold_start_s': statistics.median(record['cold_start_s'] for record in records),
+        'rerun_p50_ms': statistics.median(record['rerun_ms']['p50'] for record in records),
+        'rerun_p95_ms': statistics.median(record['rerun_ms']['p95'] for record in records),
+        'first_run_heavy_modules': records[0]['first_run_heavy_modules'],
+        'rerun_imported_modules': sorted({name for record in records for name in record['rerun_imported_modules']}),
+        'exceptions': records[0]['exceptions'],
+        'runs': records,
+    }
+    print(
+        f"  {label:<12} start {summary['cold_start_s']:.2f}s  rerun p50 {summary['rerun_p50_ms']:.0f}ms  "
+        f"p95 {summary['rerun_p95_ms']:.0f}ms  těžké moduly při startu: "
+        f"{', '.join(summary['first_run_heavy_modules']) or '-'}  "
+        f"nové moduly při rerunu: {len(summary['rerun_imported_modules'])}"
+    )
+    for exception in summary['exceptions']:
+        print(f"    ⚠️ výjimka v app.py: {exception}")
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark startu a rerunů Streamlit UI")
+    parser.add_argument('--ref', help="git revize pro porovnání (např. HEAD~1)")
+    parser.add_argument('--repeat', type=int, default=3, help="počet čerstvých procesů na strom")
+    parser.add_argument('--reruns', type=int, default=10)
+    parser.add_argument('--output', help="uložit výsledky jako JSON")
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(measure(args.child, args.reruns)))
+        return 0
+
+    print(f"⏱️ Start a reruny UI ({args.repeat}× čerstvý proces, {args.reruns} rerunů)")
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.ref:
+            results.append(benchmark_tree(args.ref, export_revision(args.ref, tmp), args.repeat, args.reruns))
+        results.append(benchmark_tree("aktuální", REPO_DIR, args.repeat, args.reruns))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'created': time.strftime('%Y-%m-%dT%H:%M:%S'), 'results': results}, f, indent=2)
+        print(f"💾 Výsledky uloženy do {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,79 @@
+"""
+Benchmark upscalingu: původní sériový resize vs. dlaždice ve vláknech
+
+Každá varianta běží v samostatném procesu, aby šla změřit špička paměti
+(maxrss). Vstupem jsou náhodné obrázky v rozlišení SDXL.
+
+    python benchmarks/upscale_benchmark.py --images 8 --factor 4
+"""
+
+import argparse
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image
+
+
+def make_images(count, size):
+    return [Image.effect_noise((size, size), 64).convert("RGB") for _ in range(count)]
+
+
+def run_serial(images, factor, output_dir):
+    """Původní cesta - všechny zvětšené varianty v paměti, pak uložení."""
+    results = [image.resize((image.width * factor, image.height * factor), Image.Resampling.LANCZOS) for image in images]
+    for i, result in enumerate(results):
+        result.save(os.path.join(output_dir, f"serial_{i}.png"), format="PNG")
+
+
+def run_tiled(images, factor, output_dir):
+    from upscaling import get_upscale_stage
+
+    paths = [os.path.join(output_dir, f"tiled_{i}.png") for i in range(len(images))]
+    get_upscale_stage().upscale_to_files(images, factor, paths)
+
+
+MODES = {'serial': run_serial, 'tiled': run_tiled}
+
+
+def measure(mode, count, size, factor, result_queue):
+    images = make_images(count, size)
+    with tempfile.TemporaryDirectory() as output_dir:
+        started = time.perf_counter()
+        MODES[mode](images, factor, output_dir)
+        elapsed = time.perf_counter() - started
+    stats = {}
+    if mode == 'tiled':
+        from upscaling import get_upscale_stage
+        stats = get_upscale_stage().stats()
+    # ru_maxrss je na Linuxu v KB
+    result_queue.put((elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, stats))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark upscalingu")
+    parser.add_argument('--images', type=int, default=8)
+    parser.add_argument('--size', type=int, default=1024)
+    parser.add_argument('--factor', type=int, default=4)
+    args = parser.parse_args()
+
+    ctx = multiprocessing.get_context('spawn')
+    print(f"⬆️ {args.images} obrázků {args.size}x{args.size}, faktor {args.factor}, CPU {os.cpu_count()}")
+    for mode in MODES:
+        result_queue = ctx.Queue()
+        process = ctx.Process(target=measure, args=(mode, args.images, args.size, args.factor, result_queue))
+        process.start()
+        elapsed, peak_mb, stats = result_queue.get()
+        process.join()
+        print(f"  {mode:<7} {elapsed:7.2f}s  špička paměti {peak_mb:7.0f} MB")
+        if stats:
+            print(f"          fáze: {stats['seconds']} ({stats['tiles']} dlaždic, {stats['workers']} vláken)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,170 @@
+"""
+Načítání full checkpointů přes memory-mapping
+
+`from_single_file` v diffusers načte celý safetensors soubor do paměti
+(`safetensors.torch.load_file`) a teprve pak ho převádí. Tady se soubor
+namapuje do paměti a tenzory jsou jen pohledy (`torch.frombuffer`) do
+mapování - při převodu do modulů diffusers se nekopírují a na GPU se data
+kopírují rovnou ze stránek souboru. Převod dtype (např. fp32 checkpoint do
+fp16) se dělá po tenzorech, bez druhé kopie celého souboru.
+
+Moduly se při převodu vytváří prázdné (accelerate `init_empty_weights`) a
+hodnoty se převádí na dtype prázdného parametru - během převodu je proto
+výchozí dtype torch nastavený na cílový, jinak by se fp16 checkpoint
+zkopíroval do fp32 a pak zpátky.
+
+Na síťovém volume je pomalé sériové stránkování po page faultech, proto
+soubor souběžně předčítá několik vláken velkými bloky do page cache.
+Vlákna běží na pozadí, zatímco diffusers sestavuje moduly.
+"""
+
+import mmap
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import torch
+
+from model_inspect import read_safetensors_header
+from tracing import span
+
+# Memory-mapped načítání full modelů (false = původní from_single_file)
+CHECKPOINT_MMAP = os.getenv('CHECKPOINT_MMAP', 'true').lower() == 'true'
+# Souběžné předčítání souboru do page cache
+CHECKPOINT_READ_WORKERS = int(os.getenv('CHECKPOINT_READ_WORKERS', '8'))
+CHECKPOINT_READ_BLOCK_MB = int(os.getenv('CHECKPOINT_READ_BLOCK_MB', '16'))
+# Menší soubory se předčítat nevyplatí
+READAHEAD_MIN_BYTES = 256 * 1024 * 1024
+
+SAFETENSORS_TORCH_DTYPES = {
+    'F64': torch.float64,
+    'F32': torch.float32,
+    'F16': torch.float16,
+    'BF16': torch.bfloat16,
+    'I64': torch.int64,
+    'I32': torch.int32,
+    'I16': torch.int16,
+    'I8': torch.int8,
+    'U8': torch.uint8,
+    'BOOL': torch.bool,
+}
+
+
+def readahead(path, workers=CHECKPOINT_READ_WORKERS, block_size=CHECKPOINT_READ_BLOCK_MB * 1024 * 1024):
+    """
+    Načte soubor souběžně po blocích do page cache a vrátí vlákno, které
+    předčítání řídí. Data se zahazují - mapované stránky pak už čtou z cache.
+    """
+    size = os.path.getsize(path)
+    offsets = range(0, size, block_size)
+    local = threading.local()
+
+    def read_block(fd, offset):
+        if not hasattr(local, 'buffer'):
+            local.buffer = bytearray(block_size)
+        os.preadv(fd, [local.buffer], offset)
+
+    def run():
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            # Sekvenční přístup - jádro může zvětšit vlastní readahead
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="checkpoint-read") as pool:
+                # Bloky v pořadí souboru - první tenzory jsou v cache nejdřív
+                for future in [pool.submit(read_block, fd, offset) for offset in offsets]:
+                    future.result()
+        except OSError as e:
+            print(f"⚠️ Předčítání {os.path.basename(path)} selhalo: {e}")
+        finally:
+            os.close(fd)
+
+    thread = threading.Thread(target=run, name="checkpoint-readahead", daemon=True)
+    thread.start()
+    return thread
+
+
+def load_state_dict(path, torch_dtype=None):
+    """
+    State dict safetensors souboru jako pohledy do memory-mapped souboru.
+
+    Tenzory s jiným dtype než `torch_dtype` (jen plovoucí čárka) se převedou
+    po jednom. Mapování zůstává platné, dokud na něj odkazují tenzory.
+    """
+    header = read_safetensors_header(path)
+    data_start = header['data_start']
+    with open(path, 'rb') as f:
+        # ACCESS_COPY - zapisovatelné (torch.frombuffer) a změny se do souboru nepropíšou
+        mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+
+    state_dict = {}
+    for name, info in header['tensors'].items():
+        dtype = SAFETENSORS_TORCH_DTYPES[info['dtype']]
+        begin, end = info['data_offsets']
+        offset = data_start + begin
+        element_size = torch.tensor([], dtype=dtype).element_size()
+        count = (end - begin) // element_size
+        if count == 0:
+            tensor = torch.empty(info['shape'], dtype=dtype)
+        elif offset % element_size:
+            # Nezarovnaná data (starší zapisovače) - tenzor se zkopíruje
+            tensor = torch.frombuffer(bytearray(mapping[offset:offset + end - begin]), dtype=dtype).view(info['shape'])
+        else:
+            tensor = torch.frombuffer(mapping, dtype=dtype, count=count, offset=offset).view(info['shape'])
+        if torch_dtype is not None and tensor.is_floating_point() and tensor.dtype != torch_dtype:
+            tensor = tensor.to(torch_dtype)
+        state_dict[name] = tensor
+    return state_dict
+
+
+_default_dtype_lock = threading.Lock()
+
+
+@contextmanager
+def default_dtype(torch_dtype):
+    """Dočasně nastaví výchozí dtype torch (nové prázdné parametry vznikají rovnou v něm)."""
+    if torch_dtype is None or not torch_dtype.is_floating_point:
+        yield
+        return
+    with _default_dtype_lock:
+        previous = torch.get_default_dtype()
+        torch.set_default_dtype(torch_dtype)
+        try:
+            yield
+        finally:
+            torch.set_default_dtype(previous)
+
+
+def load_single_file_pipeline(pipeline_class, model_path, torch_dtype=None):
+    """
+    Obdoba `pipeline_class.from_single_file(model_path, torch_dtype=...)` pro
+    safetensors checkpointy, bez načtení celého souboru do paměti.
+    """
+    from diffusers.pipelines.stable_diffusion.convert_from_ckpt import download_from_original_stable_diffusion_ckpt
+
+    reader = readahead(model_path) if os.path.getsize(model_path) >= READAHEAD_MIN_BYTES else None
+    with span('checkpoint_map'):
+        state_dict = load_state_dict(model_path)
+    # Stejné výchozí hodnoty jako from_single_file
+    with default_dtype(torch_dtype):
+        pipe = download_from_original_stable_diffusion_ckpt(
+            state_dict,
+            pipeline_class=pipeline_class,
+            model_type=None,
+            stable_unclip=None,
+            controlnet=None,
+            from_safetensors=True,
+            extract_ema=False,
+            image_size=None,
+            scheduler_type="pndm",
+            num_in_channels=None,
+            upcast_attention=None,
+            load_safety_checker=True,
+            prediction_type=None,
+        )
+    del state_dict
+    if torch_dtype is not None:
+        pipe.to(torch_dtype=torch_dtype)
+    if reader is not None:
+        reader.join()
+    return pipe
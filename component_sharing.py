@@ -0,0 +1,124 @@
+"""
+Sdílení shodných komponent mezi rezidentními pipeline
+
+SDXL finetuny většinou nemění VAE ani text encodery - full modely načtené
+vedle sebe a base pipeline pro LoRA by tak držely několik bajtově shodných
+kopií. Při načtení pipeline (ještě na CPU, před přesunem na zařízení) se
+komponenty otisknou hashem vah a pokud už v paměti je shodná instance pro
+stejné zařízení a dtype, pipeline dostane ji a vlastní kopie se zahodí.
+
+Pool drží jen slabé odkazy - komponenta zmizí s poslední pipeline, která ji
+používá. Generování běží v jednom vlákně plánovače dávek, takže dočasné
+změny sdílené komponenty (upcast VAE, slicing) se mezi pipeline nepřekrývají.
+Text encodery base pipeline pro LoRA se nesdílí - adaptéry je upravují na místě.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import weakref
+
+import torch
+
+from tracing import count
+
+# Sdílet shodné VAE, text encodery a tokenizery mezi načtenými pipeline
+SHARE_COMPONENTS = os.getenv('SHARE_COMPONENTS', 'true').lower() == 'true'
+SHARED_COMPONENTS = ('vae', 'text_encoder', 'text_encoder_2', 'tokenizer', 'tokenizer_2')
+# Komponenty, které LoRA adaptéry mění na místě
+LORA_ADAPTED_COMPONENTS = ('text_encoder', 'text_encoder_2')
+GB = 1024 ** 3
+
+
+def module_bytes(module):
+    return sum(t.numel() * t.element_size() for t in list(module.parameters()) + list(module.buffers()))
+
+
+def fingerprint_module(module):
+    """Hash konfigurace a všech vah modulu (jména, dtype, tvary a bajty)."""
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update(type(module).__name__.encode())
+    config = getattr(module, 'config', None)
+    if config is not None:
+        config_dict = config.to_dict() if hasattr(config, 'to_dict') else dict(config)
+        # Cesta zdroje a verze knihovny se mezi shodnými komponentami liší
+        config_dict = {k: v for k, v in config_dict.items() if not k.startswith('_') and k != 'transformers_version'}
+        digest.update(json.dumps(config_dict, sort_keys=True, default=str).encode())
+    for name, tensor in sorted(module.state_dict().items()):
+        digest.update(f"{name}:{tensor.dtype}:{tuple(tensor.shape)}".encode())
+        data = tensor.detach().cpu().contiguous().reshape(-1)
+        if data.numel():
+            digest.update(data.view(torch.uint8).numpy())
+    return digest.hexdigest()
+
+
+def fingerprint_tokenizer(tokenizer):
+    """Hash slovníku, BPE merges a speciálních tokenů (bez cesty, ze které se načetl)."""
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update(type(tokenizer).__name__.encode())
+    digest.update(json.dumps(tokenizer.get_vocab(), sort_keys=True).encode())
+    merges = getattr(tokenizer, 'bpe_ranks', {})
+    digest.update(json.dumps(sorted(merges, key=merges.get), default=list).encode())
+    digest.update(json.dumps(
+        [tokenizer.model_max_length, tokenizer.special_tokens_map], sort_keys=True, default=str
+    ).encode())
+    return digest.hexdigest()
+
+
+class ComponentPool:
+    """Slabé odkazy na komponenty načtených pipeline klíčované otiskem vah."""
+
+    def __init__(self):
+        self._components = {}
+        self._lock = threading.Lock()
+        self.shared = 0
+        self.saved_bytes = 0
+
+    def share(self, pipe, device, exclude=()):
+        """Nahradí komponenty pipeline shodnými již načtenými instancemi; vrací počet sdílených."""
+        shared = 0
+        for name in SHARED_COMPONENTS:
+            component = getattr(pipe, name, None)
+            if component is None or name in exclude:
+                continue
+            if isinstance(component, torch.nn.Module):
+                key = (name, str(device), str(component.dtype), fingerprint_module(component))
+            elif hasattr(component, 'get_vocab'):
+                key = (name, None, None, fingerprint_tokenizer(component))
+            else:
+                continue
+
+            with self._lock:
+                self._components = {k: ref for k, ref in self._components.items() if ref() is not None}
+                ref = self._components.get(key)
+                existing = ref() if ref is not None else None
+                if existing is None:
+                    self._components[key] = weakref.ref(component)
+                    continue
+            if existing is component:
+                continue
+            setattr(pipe, name, existing)
+            shared += 1
+            with self._lock:
+                self.shared += 1
+                if isinstance(component, torch.nn.Module):
+                    self.saved_bytes += module_bytes(component)
+            count('components_shared_total', component=name)
+        return shared
+
+    def stats(self):
+        with self._lock:
+            return {
+                'pooled': sum(1 for ref in self._components.values() if ref() is not None),
+                'shared': self.shared,
+                'saved_gb': self.saved_bytes / GB,
+            }
+
+
+_pool = ComponentPool()
+
+
+def get_component_pool() -> ComponentPool:
+    """Vrátí procesově sdílený pool komponent."""
+    return _pool
@@ -0,0 +1,233 @@
+"""
+Textové podmínění (prompt embeddings) pro SDXL pipeline
+
+Embeddings se počítají jednou před denoisingem a pipeline dostává hotové
+`prompt_embeds`. Pokud jsou pozitivní a negativní podmínění identická,
+classifier-free guidance je degenerovaná:
+
+    uncond + g * (cond - uncond) == cond,   protože cond - uncond == 0
+
+a stačí jedna větev UNetu na krok (guidance_scale=1.0) se stejným výsledkem.
+
+Hotová podmínění se ukládají do cache (RAM + disk) klíčované identitou modelu,
+clip_skip a promptem. Jakmile je podmínění modelu v cache, text encodery lze
+z pipeline uvolnit a ušetřit několik GB paměti.
+"""
+
+import gc
+import hashlib
+import inspect
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import torch
+from safetensors.torch import load_file, save_file
+
+from config import resolve_cache_dir
+from tracing import count
+
+SKIP_DEGENERATE_CFG = os.getenv('SKIP_DEGENERATE_CFG', 'true').lower() == 'true'
+RELEASE_TEXT_ENCODERS = os.getenv('RELEASE_TEXT_ENCODERS', 'true').lower() == 'true'
+CONDITIONING_MEMORY_ENTRIES = int(os.getenv('CONDITIONING_MEMORY_ENTRIES', '32'))
+
+CONDITIONING_KEYS = (
+    'prompt_embeds', 'negative_prompt_embeds', 'pooled_prompt_embeds', 'negative_pooled_prompt_embeds'
+)
+
+
+class TextEncodersReleased(RuntimeError):
+    """Podmínění není v cache a text encodery pipeline už byly uvolněny."""
+
+
+class DetachedTextEncoder(torch.nn.Module):
+    """Zástupce uvolněného text encoderu - pipeline z něj čte jen dtype a config."""
+
+    def __init__(self, dtype, config=None):
+        super().__init__()
+        self.register_buffer('dtype_marker', torch.zeros(0, dtype=dtype), persistent=False)
+        # add_time_ids potřebují config.projection_dim druhého encoderu
+        self.config = config
+
+    @property
+    def dtype(self):
+        return self.dtype_marker.dtype
+
+    def forward(self, *args, **kwargs):
+        raise TextEncodersReleased("Text encoder byl uvolněn - podmínění musí přijít z cache")
+
+
+def text_encoders_released(pipe):
+    """True, pokud pipeline už nemá skutečné text encodery."""
+    return isinstance(getattr(pipe, 'text_encoder_2', None), DetachedTextEncoder)
+
+
+def release_text_encoders(pipe):
+    """Nahradí text encodery pipeline zástupci a uvolní jejich váhy."""
+    if text_encoders_released(pipe):
+        return
+    for name in ('text_encoder', 'text_encoder_2'):
+        encoder = getattr(pipe, name, None)
+        if encoder is not None:
+            setattr(pipe, name, DetachedTextEncoder(encoder.dtype, getattr(encoder, 'config', None)))
+    gc.collect()
+    if torch.cuda.is_available():
+        torch.cuda.empty_cache()
+
+
+def supports_clip_skip(pipe):
+    """Zda `encode_prompt` nainstalované verze diffusers umí clip_skip."""
+    return 'clip_skip' in inspect.signature(pipe.encode_prompt).parameters
+
+
+def encode_conditioning(pipe, prompt="", negative_prompt=None, clip_skip=None):
+    """
+    Zakóduje prompt stejně jako pipeline (s CFG větví) pro jeden vzorek.
+
+    `clip_skip` se předá jen pokud ho nainstalovaná verze diffusers podporuje.
+    """
+    kwargs = {
+        'prompt': prompt,
+        'device': pipe._execution_device,
+        'num_images_per_prompt': 1,
+        'do_classifier_free_guidance': True,
+        'negative_prompt': negative_prompt,
+    }
+    if clip_skip is not None and supports_clip_skip(pipe):
+        kwargs['clip_skip'] = clip_skip
+
+    with torch.no_grad():
+        prompt_embeds, negative_prompt_embeds, pooled, negative_pooled = pipe.encode_prompt(**kwargs)
+
+    return {
+        'prompt_embeds': prompt_embeds,
+        'negative_prompt_embeds': negative_prompt_embeds,
+        'pooled_prompt_embeds': pooled,
+        'negative_pooled_prompt_embeds': negative_pooled,
+    }
+
+
+def is_degenerate_guidance(conditioning):
+    """True, pokud jsou pozitivní a negativní podmínění bitově shodná."""
+    return (
+        torch.equal(conditioning['prompt_embeds'], conditioning['negative_prompt_embeds'])
+        and torch.equal(conditioning['pooled_prompt_embeds'], conditioning['negative_pooled_prompt_embeds'])
+    )
+
+
+def conditioning_call_kwargs(conditioning, guidance_scale):
+    """
+    Argumenty pro volání pipeline s hotovým podmíněním.
+
+    Při degenerované CFG se spustí jediná větev UNetu (guidance_scale=1.0).
+    """
+    if guidance_scale > 1.0 and SKIP_DEGENERATE_CFG and is_degenerate_guidance(conditioning):
+        return {
+            'prompt_embeds': conditioning['prompt_embeds'],
+            'pooled_prompt_embeds': conditioning['pooled_prompt_embeds'],
+            'guidance_scale': 1.0,
+        }
+    return dict(conditioning, guidance_scale=guidance_scale)
+
+
+class ConditioningCache:
+    """Cache hotových podmínění v RAM (LRU) a na disku (safetensors)."""
+
+    def __init__(self, cache_dir, max_memory_entries=CONDITIONING_MEMORY_ENTRIES):
+        self.cache_dir = cache_dir
+        self.max_memory_entries = max_memory_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(model_identity, clip_skip, prompt, negative_prompt, torch_dtype, device):
+        """Klíč podmínění - hash identity modelu, clip_skip a promptů."""
+        raw = json.dumps([model_identity, clip_skip, prompt, negative_prompt, str(torch_dtype), str(device)])
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.safetensors")
+
+    def get(self, key, device):
+        with self._lock:
+            conditioning = self._memory.get(key)
+            if conditioning is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                count('cache_hits_total', cache='conditioning')
+        if conditioning is None and os.path.exists(self._path(key)):
+            try:
+                conditioning = load_file(self._path(key))
+            except Exception as e:
+                print(f"⚠️ Poškozená cache podmínění {key}: {e}")
+                conditioning = None
+            if conditioning is not None:
+                self._remember(key, conditioning)
+                with self._lock:
+                    self.hits += 1
+                    count('cache_hits_total', cache='conditioning')
+        if conditioning is None:
+            with self._lock:
+                self.misses += 1
+                count('cache_misses_total', cache='conditioning')
+            return None
+        return {name: tensor.to(device) for name, tensor in conditioning.items()}
+
+    def put(self, key, conditioning):
+        cpu_conditioning = {name: conditioning[name].detach().cpu().contiguous() for name in CONDITIONING_KEYS}
+        self._remember(key, cpu_conditioning)
+        # Zápis přes dočasný soubor, aby souběžný proces nečetl polovičatý soubor
+        tmp_path = self._path(key) + f".{os.getpid()}.tmp"
+        save_file(cpu_conditioning, tmp_path)
+        os.replace(tmp_path, self._path(key))
+
+    def _remember(self, key, conditioning):
+        with self._lock:
+            self._memory[key] = conditioning
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_memory_entries:
+                self._memory.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'in_memory': len(self._memory)}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_conditioning_cache() -> ConditioningCache:
+    """Vrátí procesově sdílenou cache podmínění."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ConditioningCache(resolve_cache_dir('conditioning'))
+        return _cache
+
+
+def get_conditioning(pipe, model_identity, prompt="", negative_prompt=None, clip_skip=None):
+    """
+    Vrátí podmínění z cache, nebo ho spočítá a uloží.
+
+    Pokud v cache chybí a text encodery už byly uvolněny, vyhodí
+    `TextEncodersReleased` - volající musí pipeline načíst znovu.
+    """
+    # clip_skip, který diffusers ignoruje, nesmí tříštit cache
+    effective_clip_skip = clip_skip if supports_clip_skip(pipe) else None
+    device = pipe._execution_device
+    cache = get_conditioning_cache()
+    key = cache.make_key(model_identity, effective_clip_skip, prompt, negative_prompt, pipe.unet.dtype, device)
+
+    conditioning = cache.get(key, device)
+    if conditioning is not None:
+        return conditioning
+    if text_encoders_released(pipe):
+        raise TextEncodersReleased(f"Podmínění pro {model_identity} není v cache")
+
+    conditioning = encode_conditioning(pipe, prompt, negative_prompt, effective_clip_skip)
+    cache.put(key, conditioning)
+    return conditioning
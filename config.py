@@ -0,0 +1,59 @@
+"""
+Konfigurace aplikace z environment variables
+
+Sdílená mezi Streamlit UI a moduly pro správu modelů, aby moduly nemusely
+importovat app.py (který při importu spouští Streamlit skript).
+"""
+
+import os
+
+FORCE_CPU = os.getenv('FORCE_CPU', 'false').lower() == 'true'
+MAX_MEMORY_GB = float(os.getenv('MAX_MEMORY_GB', '8'))
+# BASE_MODEL - nepoužíváme base modely, pouze uživatelské full a LoRA modely
+# auto = rozhodne plán paměti (memory_planner.py), true/false = vynutit/zakázat
+ENABLE_ATTENTION_SLICING = os.getenv('ENABLE_ATTENTION_SLICING', 'auto')
+ENABLE_CPU_OFFLOAD = os.getenv('ENABLE_CPU_OFFLOAD', 'auto')
+LORA_MODELS_PATH = os.getenv('LORA_MODELS_PATH', '/data/loras')
+FULL_MODELS_PATH = os.getenv('FULL_MODELS_PATH', '/data/models')
+HF_HOME = os.getenv('HF_HOME', '/root/.cache/huggingface')
+BASE_MODEL = os.getenv('BASE_MODEL', 'stabilityai/stable-diffusion-xl-base-1.0')
+# Malá náhodně inicializovaná SDXL pipeline místo skutečných modelů (testy na CPU)
+TINY_PIPELINE = os.getenv('TINY_PIPELINE', 'false').lower() == 'true'
+# Složka pro modely nahrané přes UI
+UPLOADED_MODELS_PATH = os.getenv('UPLOADED_MODELS_PATH', 'models')
+
+# HTTP inference API - pokud je nastavena URL, Streamlit UI generuje přes službu
+INFERENCE_API_URL = os.getenv('INFERENCE_API_URL', '').rstrip('/')
+API_HOST = os.getenv('API_HOST', '0.0.0.0')
+API_PORT = int(os.getenv('API_PORT', '8600'))
+
+# Rozpočet paměti pro rezidentní pipeline (GPU vs. RAM)
+PIPELINE_CACHE_DEVICE_GB = float(os.getenv('PIPELINE_CACHE_DEVICE_GB', str(MAX_MEMORY_GB)))
+PIPELINE_CACHE_HOST_GB = float(os.getenv('PIPELINE_CACHE_HOST_GB', str(MAX_MEMORY_GB * 2)))
+
+# Persistentní cache (metadata modelů, katalog, ...) - na /data přežije restart podu
+CACHE_DIR = os.getenv('MODEL_CACHE_DIR', '/data/.cache/neural-art')
+
+
+def resolve_model_dirs():
+    """Vytvoří složky modelů; bez práv k zápisu (lokální vývoj) použije lokální složky."""
+    try:
+        os.makedirs(LORA_MODELS_PATH, exist_ok=True)
+        os.makedirs(FULL_MODELS_PATH, exist_ok=True)
+        return LORA_MODELS_PATH, FULL_MODELS_PATH
+    except OSError:
+        os.makedirs('./lora_models', exist_ok=True)
+        os.makedirs('./models', exist_ok=True)
+        return './lora_models', './models'
+
+
+def resolve_cache_dir(subdir: str = '') -> str:
+    """Vrátí zapisovatelný adresář cache s fallbackem pro lokální vývoj."""
+    for base in (CACHE_DIR, os.path.expanduser('~/.cache/neural-art')):
+        path = os.path.join(base, subdir)
+        try:
+            os.makedirs(path, exist_ok=True)
+            return path
+        except OSError:
+            continue
+    raise OSError(f"Nelze vytvořit adresář cache: {subdir or CACHE_DIR}")
@@ -0,0 +1,193 @@
+"""
+Cache převedených full modelů
+
+`from_single_file` (i memory-mapped varianta v checkpoint_loader.py) při
+každém načtení přemapovává klíče původního checkpointu a sestavuje z nich
+komponenty diffusers. Po prvním načtení se proto pipeline uloží přes
+`save_pretrained` ve formátu diffusers (komponenty zvlášť, v cílovém dtype)
+a další načtení jde přes `from_pretrained` bez převodu.
+
+Položky jsou klíčované SHA-256 obsahu zdrojového souboru a dtype, takže
+přejmenovaný nebo znovu nahraný model převod nezopakuje. Požadavek hledá
+položku jen podle už známého hashe (cache inspekcí klíčovaná cestou,
+velikostí a mtime) - hashování celého souboru, převod a zápis několika GB
+běží ve vlákně na pozadí a první požadavek na ně nečeká. Cache leží vedle
+FULL_MODELS_PATH (mimo složku, kterou prochází katalog modelů) a je omezená
+velikostí - při překročení se mažou nejdéle nepoužité položky (podle mtime
+složky, který se při každém použití obnoví). Stejné úložiště používá i cache
+sloučených LoRA (lora_fusion.py), jen s vlastní složkou a klíči.
+"""
+
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from config import FULL_MODELS_PATH, resolve_cache_dir
+from model_inspect import content_digest, known_content_digest
+from tracing import count, span
+
+# Ukládat převedené full modely a načítat je bez převodu
+CONVERTED_CACHE = os.getenv('CONVERTED_CACHE', 'true').lower() == 'true'
+CONVERTED_CACHE_PATH = os.getenv(
+    'CONVERTED_CACHE_PATH', os.path.join(os.path.dirname(os.path.abspath(FULL_MODELS_PATH)), 'converted')
+)
+CONVERTED_CACHE_GB = float(os.getenv('CONVERTED_CACHE_GB', '50'))
+# Změna formátu uložených položek (např. jiná verze převodu) je zneplatní
+CONVERTED_FORMAT_VERSION = 1
+GB = 1024 ** 3
+
+
+def directory_bytes(path):
+    return sum(
+        os.path.getsize(os.path.join(dir_path, name))
+        for dir_path, _dirs, files in os.walk(path) for name in files
+    )
+
+
+def dtype_name(torch_dtype):
+    return str(torch_dtype).replace('torch.', '')
+
+
+def converted_key(model_path, torch_dtype):
+    """Klíč položky: hash obsahu zdrojového checkpointu a cílový dtype."""
+    return f"{content_digest(model_path)}-{dtype_name(torch_dtype)}"
+
+
+def known_converted_key(model_path, torch_dtype):
+    """Klíč položky bez čtení souboru, nebo None, pokud hash obsahu ještě není známý."""
+    digest = known_content_digest(model_path)
+    return f"{digest}-{dtype_name(torch_dtype)}" if digest else None
+
+
+class ConvertedCache:
+    """Pipeline ve formátu diffusers na disku klíčované řetězcem, LRU omezená velikostí."""
+
+    def __init__(self, root, max_bytes, name='converted'):
+        self.root = root
+        self.max_bytes = max_bytes
+        # Jméno cache v metrikách
+        self.name = name
+        self._lock = threading.Lock()
+        # Převody na pozadí po jednom - každý drží celou pipeline v RAM
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"{name}-save")
+        self._pending = set()
+
+    def entry_path(self, key):
+        return os.path.join(self.root, f"v{CONVERTED_FORMAT_VERSION}-{key}")
+
+    def lookup(self, key):
+        """Cesta k uložené pipeline, nebo None."""
+        path = self.entry_path(key)
+        if not os.path.isdir(path):
+            count('cache_misses_total', cache=self.name)
+            return None
+        # Obnovení mtime - pořadí pro LRU úklid
+        os.utime(path)
+        count('cache_hits_total', cache=self.name)
+        return path
+
+    def store(self, key, pipe, notify=print):
+        """
+        Uloží načtenou pipeline (ještě před přesunem na zařízení).
+
+        Zapisuje se do dočasné složky a ta se přejmenuje až po dokončení,
+        takže jiný proces nikdy nenačte rozepsanou položku.
+        """
+        path = self.entry_path(key)
+        if os.path.isdir(path):
+            return path
+        os.makedirs(self.root, exist_ok=True)
+        tmp_path = tempfile.mkdtemp(dir=self.root, prefix='.tmp-')
+        try:
+            with span(f'{self.name}_save'):
+                pipe.save_pretrained(tmp_path, safe_serialization=True)
+            try:
+                os.rename(tmp_path, path)
+            except OSError:
+                # Souběžně ji uložil jiný proces
+                if not os.path.isdir(path):
+                    raise
+                shutil.rmtree(tmp_path, ignore_errors=True)
+        except BaseException:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            raise
+        notify(f"💾 Pipeline uložena do cache {self.name} ({directory_bytes(path) / GB:.1f} GB)")
+        self.evict(keep=path)
+        return path
+
+    def store_in_background(self, task_id, key_fn, build, notify=print):
+        """
+        Spočítá klíč (`key_fn()`) a uloží pipeline z `build()` ve vlákně na pozadí.
+
+        `build` sestaví vlastní pipeline - živá pipeline se mezitím přesouvá na
+        zařízení a generuje, takže se z ní ukládat nedá. Úloha se stejným
+        `task_id` se nespouští dvakrát.
+        """
+        with self._lock:
+            if task_id in self._pending:
+                return
+            self._pending.add(task_id)
+
+        def run():
+            try:
+                key = key_fn()
+                if not os.path.isdir(self.entry_path(key)):
+                    self.store(key, build(), notify)
+            except Exception as e:
+                # Plný disk apod. - požadavky dál převádí checkpoint samy
+                notify(f"⚠️ Pipeline nelze uložit do cache {self.name}: {e}")
+            finally:
+                with self._lock:
+                    self._pending.discard(task_id)
+
+        self._executor.submit(run)
+
+    def entries(self):
+        """Položky cache od nejdéle nepoužité: [(cesta, mtime, velikost)]."""
+        if not os.path.isdir(self.root):
+            return []
+        entries = []
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if name.startswith('.tmp-') or not os.path.isdir(path):
+                continue
+            entries.append((path, os.stat(path).st_mtime, directory_bytes(path)))
+        return sorted(entries, key=lambda entry: entry[1])
+
+    def evict(self, keep=None):
+        """Smaže nejdéle nepoužité položky nad limit velikosti (kromě `keep`)."""
+        with self._lock:
+            entries = self.entries()
+            total = sum(size for _path, _mtime, size in entries)
+            for path, _mtime, size in entries:
+                if total <= self.max_bytes:
+                    break
+                if path == keep:
+                    continue
+                shutil.rmtree(path, ignore_errors=True)
+                total -= size
+                count('cache_evictions_total', cache=self.name)
+
+
+def resolve_cache_root(path, subdir):
+    """`path`, bez práv k zápisu (lokální vývoj) podsložka lokální cache."""
+    try:
+        os.makedirs(path, exist_ok=True)
+        return path
+    except OSError:
+        return resolve_cache_dir(subdir)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_converted_cache() -> ConvertedCache:
+    """Vrátí procesově sdílenou cache převedených modelů."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ConvertedCache(resolve_cache_root(CONVERTED_CACHE_PATH, 'converted'), int(CONVERTED_CACHE_GB * GB))
+        return _cache
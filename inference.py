@@ -0,0 +1,591 @@
+"""
+Generační jádro bez závislosti na Streamlitu
+
+Sdílí ho Streamlit UI (lokální režim) i worker proces HTTP API. Varování
+se předávají přes callback `notify` (výchozí `print`), průběh přes
+`progress_callback(progress, text="")`.
+"""
+
+import gc
+import os
+import time
+
+import torch
+from diffusers import StableDiffusionXLImg2ImgPipeline
+from diffusers import (
+    DPMSolverMultistepScheduler,
+    EulerDiscreteScheduler,
+    EulerAncestralDiscreteScheduler,
+    DDIMScheduler,
+    LMSDiscreteScheduler,
+    PNDMScheduler
+)
+
+from config import (
+    BASE_MODEL,
+    TINY_PIPELINE,
+)
+from pipeline_registry import get_pipeline_registry
+from component_sharing import LORA_ADAPTED_COMPONENTS, SHARE_COMPONENTS, get_component_pool
+from checkpoint_loader import CHECKPOINT_MMAP, load_single_file_pipeline
+from converted_cache import CONVERTED_CACHE, converted_key, get_converted_cache, known_converted_key
+from model_inspect import inspect_model
+from job_params import check_denoising_steps
+from memory_planner import (
+    available_memory_bytes,
+    capacity_bytes,
+    describe_plan,
+    estimate_output_bytes,
+    estimate_weight_bytes,
+    plan_execution,
+)
+from conditioning import (
+    RELEASE_TEXT_ENCODERS,
+    TextEncodersReleased,
+    conditioning_call_kwargs,
+    get_conditioning,
+    release_text_encoders,
+)
+from lora_fusion import FUSED_LORA, get_lora_fusion
+from lora_manager import adapter_name_for, file_identity, get_adapter_manager
+from latent_cache import prepare_image_latents
+from upscaling import get_upscale_stage
+from tiling import tiled_execution
+from system_probe import probe_device
+from tracing import count, get_tracer, span, traced, traced_method
+
+
+class InferenceError(RuntimeError):
+    """Chyba generování, kterou lze zobrazit uživateli."""
+
+
+class MemoryBusyError(InferenceError):
+    """Požadavek se vejde do kapacity, ale paměť teď drží jiné úlohy - plánovač ho zkusí později."""
+
+def get_optimal_device():
+    """Určí optimální zařízení pro inference - průzkum (včetně testu CUDA) proběhne jednou za proces"""
+    probe = probe_device()
+    return probe['device'], probe['reason']
+
+# Funkce pro detekci typu modelu
+@traced('model_inspect')
+def detect_model_type(file_path, notify=print):
+    """Detekuje zda je soubor LoRA model nebo full safetensors model"""
+    try:
+        # Čte se jen JSON hlavička, výsledek je v cache podle (cesta, velikost, mtime)
+        return inspect_model(file_path)['model_type']
+    except Exception as e:
+        notify(f"Nelze detekovat typ modelu: {e}")
+        return "unknown"
+
+# Mapování názvů samplerů na třídy schedulerů
+# Názvy musí odpovídat job_params.SAMPLERS (validace v API a CLI)
+SCHEDULER_MAP = {
+    "DPMSolverMultistepScheduler": DPMSolverMultistepScheduler,
+    "EulerDiscreteScheduler": EulerDiscreteScheduler,
+    "EulerAncestralDiscreteScheduler": EulerAncestralDiscreteScheduler,
+    "DDIMScheduler": DDIMScheduler,
+    "LMSDiscreteScheduler": LMSDiscreteScheduler,
+    "PNDMScheduler": PNDMScheduler
+}
+
+def convert_checkpoint(model_path, torch_dtype, clip_skip):
+    """Sestaví pipeline převodem původního single-file checkpointu"""
+    if CHECKPOINT_MMAP and model_path.endswith('.safetensors'):
+        # Full model přes memory-mapping s paralelním předčítáním (checkpoint_loader.py)
+        return load_single_file_pipeline(StableDiffusionXLImg2ImgPipeline, model_path, torch_dtype)
+    # Načtení full safetensors modelu
+    return StableDiffusionXLImg2ImgPipeline.from_single_file(
+        model_path,
+        torch_dtype=torch_dtype,
+        use_safetensors=True,
+        low_cpu_mem_usage=True,
+        clip_skip=clip_skip
+    )
+
+def load_full_model(model_path, torch_dtype, clip_skip):
+    """Full model z cache převedených modelů, jinak převodem z checkpointu (cache se plní na pozadí)"""
+    if not CONVERTED_CACHE:
+        return convert_checkpoint(model_path, torch_dtype, clip_skip)
+    
+    cache = get_converted_cache()
+    # Jen už známý hash (cesta, velikost, mtime) - celý soubor se v požadavku nehashuje
+    key = known_converted_key(model_path, torch_dtype)
+    converted_path = cache.lookup(key) if key else None
+    if converted_path:
+        # Už převedený model ve formátu diffusers - bez přemapování klíčů
+        return StableDiffusionXLImg2ImgPipeline.from_pretrained(
+            converted_path,
+            torch_dtype=torch_dtype,
+            use_safetensors=True,
+            low_cpu_mem_usage=True,
+            clip_skip=clip_skip
+        )
+    
+    if not key:
+        count('cache_misses_total', cache='converted')
+    pipe = convert_checkpoint(model_path, torch_dtype, clip_skip)
+    # Hash obsahu, vlastní převod a zápis několika GB běží mimo požadavek
+    # (až po převodu pro požadavek, aby se oba převody nepřekrývaly)
+    cache.store_in_background(
+        (os.path.abspath(model_path), str(torch_dtype)),
+        lambda: converted_key(model_path, torch_dtype),
+        lambda: convert_checkpoint(model_path, torch_dtype, clip_skip),
+    )
+    return pipe
+
+@traced('load')
+def load_pipeline(model_path, model_type, device, torch_dtype, clip_skip, enable_memory_efficient_attention, enable_cpu_offload):
+    """Načte pipeline z disku a aplikuje paměťové optimalizace"""
+    if TINY_PIPELINE:
+        # Malá náhodně inicializovaná SDXL pipeline pro testy na CPU
+        from tiny_pipeline import build_tiny_pipeline
+        pipe = build_tiny_pipeline(torch_dtype)
+    elif model_type == "fused_lora":
+        # Base model s vahami sloučené LoRA (lora_fusion.py), uložený ve formátu diffusers
+        pipe = StableDiffusionXLImg2ImgPipeline.from_pretrained(
+            model_path,
+            torch_dtype=torch_dtype,
+            use_safetensors=True,
+            low_cpu_mem_usage=True,
+            clip_skip=clip_skip
+        )
+    elif model_type == "lora":
+        # Načtení base modelu pro LoRA
+        pipe = StableDiffusionXLImg2ImgPipeline.from_pretrained(
+            BASE_MODEL,
+            torch_dtype=torch_dtype,
+            variant="fp16" if device == "cuda" else None,
+            use_safetensors=True,
+            low_cpu_mem_usage=True,
+            clip_skip=clip_skip
+        )
+    else:
+        pipe = load_full_model(model_path, torch_dtype, clip_skip)
+    
+    # Shodné VAE, text encodery a tokenizery s již načtenými pipeline se sdílí.
+    # Offload přesouvá moduly hooky mezi zařízeními - takové pipeline nesdílí nic.
+    if SHARE_COMPONENTS and not enable_cpu_offload:
+        exclude = LORA_ADAPTED_COMPONENTS if model_type == "lora" else ()
+        get_component_pool().share(pipe, device, exclude=exclude)
+    
+    # Memory efficient optimizations
+    if enable_memory_efficient_attention:
+        pipe.enable_attention_slicing()
+        pipe.enable_vae_slicing()
+        
+    if enable_cpu_offload:
+        pipe.enable_model_cpu_offload()
+    else:
+        pipe = pipe.to(device)
+    
+    return pipe
+
+@traced('lora_attach')
+def attach_lora(pipe, model_path, notify=print):
+    """Aktivuje LoRA na rezidentní base pipeline, vrátí True při úspěchu"""
+    manager = get_adapter_manager(pipe)
+    try:
+        # Již připojený adaptér se jen aktivuje, jinak se váhy vezmou z cache v RAM
+        manager.activate(adapter_name_for(model_path), model_path)
+        return True
+    except Exception as e:
+        notify(f"Nelze načíst LoRA model: {e}")
+        # Pokračovat bez LoRA
+        manager.deactivate()
+        return False
+
+def variant_seeds(seed, variance_seed, num_images):
+    """Seedy jednotlivých variant (None = náhodný generátor)"""
+    if seed is None:
+        return [None] * num_images
+    seeds = [seed]
+    for i in range(1, num_images):
+        if variance_seed is not None:
+            # Pro varianty použijeme kombinaci původního seed a variance seed
+            seeds.append(seed + (variance_seed * i) % 2147483647)
+        else:
+            seeds.append(seed)
+    return seeds
+
+def model_file_identity(model_path):
+    """Identita souboru modelu (cesta, velikost, mtime); bez souboru jen cesta"""
+    return list(file_identity(model_path)) if os.path.isfile(model_path) else model_path
+
+def conditioning_identity(model_type, model_path, lora_attached):
+    """Identita modelu pro cache podmínění - co všechno ovlivňuje text encodery"""
+    if model_type in ("full_model", "fused_lora"):
+        return model_file_identity(model_path)
+    identity = [BASE_MODEL]
+    if lora_attached:
+        # LoRA bez vah text encoderu podmínění nemění
+        lora_touches_text = True
+        if os.path.isfile(model_path):
+            lora_touches_text = inspect_model(model_path).get('lora_text_encoder', True)
+        if lora_touches_text:
+            identity.append(model_file_identity(model_path))
+    return identity
+
+def vae_identity(model_type, model_path):
+    """Identita VAE pro cache latentů - LoRA VAE nemění, rozhoduje jen základní model"""
+    if model_type == "full_model":
+        return model_file_identity(model_path)
+    return [BASE_MODEL]
+
+def sample_generators(device, seeds):
+    """Generátor pro každý vzorek; None, pokud žádný vzorek nemá seed (globální RNG)"""
+    if all(seed is None for seed in seeds):
+        return None
+    generators = []
+    for seed in seeds:
+        generator = torch.Generator(device=device)
+        if seed is None:
+            # Vzorek bez seedu ve smíšené dávce dostane náhodný seed
+            generator.seed()
+        else:
+            generator.manual_seed(seed)
+        generators.append(generator)
+    return generators
+
+def batch_image_latents(pipe, images, generators, vae_model_identity, dtype):
+    """Počáteční latenty pro mikro-dávku - souvislé úseky stejného vstupu se kódují jednou"""
+    parts = []
+    start = 0
+    while start < len(images):
+        end = start
+        while end < len(images) and images[end] is images[start]:
+            end += 1
+        parts.append(prepare_image_latents(
+            pipe, images[start], vae_model_identity, end - start, dtype,
+            generators[start:end] if generators else None
+        ))
+        start = end
+    return torch.cat(parts, dim=0)
+
+def apply_plan(pipe, plan):
+    """Nastaví attention a VAE slicing podle plánu paměti (přepíná se jen při změně)"""
+    sliced = any(type(processor).__name__.startswith("SlicedAttn") for processor in pipe.unet.attn_processors.values())
+    if plan['attention_slicing'] and not sliced:
+        pipe.enable_attention_slicing()
+    elif not plan['attention_slicing'] and sliced:
+        pipe.disable_attention_slicing()
+    if plan['vae_slicing']:
+        pipe.enable_vae_slicing()
+    else:
+        pipe.disable_vae_slicing()
+
+def admit_request(registry, registry_path, registry_type, device, torch_dtype, weight_bytes, num_images, width, height, output_bytes, do_classifier_free_guidance):
+    """
+    Vybere plán paměti před načtením modelu.
+
+    Požadavek, který se nevejde ani na prázdné zařízení, se odmítne hned.
+    Jinak se pro plán uvolní nepoužívané pipeline; pokud ani to nestačí,
+    vyhodí MemoryBusyError a plánovač dávek požadavek vrátí do fronty -
+    vlákno plánovače mezitím spouští ostatní požadavky.
+    """
+    keys = {offload: registry.make_key(registry_path, registry_type, torch_dtype, device, offload) for offload in (False, True)}
+    plan_args = dict(
+        num_images=num_images, width=width, height=height, torch_dtype=torch_dtype, device=device,
+        weight_bytes=weight_bytes, do_classifier_free_guidance=do_classifier_free_guidance, output_bytes=output_bytes,
+    )
+    
+    capacity = {'device': capacity_bytes(device) if device == "cuda" else 0, 'host': capacity_bytes("cpu")}
+    if plan_execution(budgets=capacity, **plan_args) is None:
+        count('admission_rejected_total', reason='capacity')
+        raise InferenceError(
+            f"❌ Požadavek ({num_images}× {width}x{height}) se nevejde do paměti ani s dlaždicemi a offloadem - "
+            f"snižte rozlišení, počet variant nebo upscaling"
+        )
+    
+    resident_modes = tuple(offload for offload, key in keys.items() if registry.is_resident(key))
+    # Pooly plánu odpovídají poolům registru; nepoužívané pipeline jiných modelů lze uvolnit
+    free = {'device': available_memory_bytes(device) if device == "cuda" else 0, 'host': available_memory_bytes("cpu")}
+    budgets = {pool: free[pool] + registry.reclaimable_bytes(pool, keep=keys.values()) for pool in free}
+    plan = plan_execution(budgets=budgets, resident_modes=resident_modes, **plan_args)
+    if plan is None:
+        count('admission_deferred_total')
+        raise MemoryBusyError("❌ Paměť je obsazená jinými úlohami - zkuste to prosím znovu")
+    for pool, peak in plan['peak_bytes'].items():
+        if peak > free[pool]:
+            registry.make_room(pool, peak - free[pool], keep=keys.values())
+    count('admission_total', plan=plan['name'])
+    print(f"🧠 Plán paměti: {describe_plan(plan)}")
+    return plan
+
+def generate_variants(pipe, device, samples, strength, guidance_scale, num_inference_steps, progress_callback, model_identity, clip_skip=2, sampler="DPMSolverMultistepScheduler", vae_model_identity=None, notify=print, plan=None):
+    """
+    Vygeneruje vzorky na již načtené pipeline v dávkách (jeden generátor na vzorek).
+
+    `samples` je seznam (vstupní obrázek, seed) se stejným rozlišením vstupů;
+    vrací seznam výsledků ve stejném pořadí, None u vzorků, jejichž dávka selhala.
+    Bez `plan` se plán paměti vybere podle aktuálně volné paměti.
+    """
+    num_images = len(samples)
+    
+    # Nastavení scheduleru
+    if sampler in SCHEDULER_MAP:
+        with span('scheduler_swap', sampler=sampler):
+            pipe.scheduler = SCHEDULER_MAP[sampler].from_config(pipe.scheduler.config)
+    
+    progress_callback(0.6, f"Generuji {num_images} variant...")
+    
+    # Nastavení generátorů pro reprodukovatelnost - stejné seedy jako při generování po jedné
+    images = [image for image, _seed in samples]
+    generators = sample_generators(device, [seed for _image, seed in samples])
+    
+    # Prázdný prompt, protože nechceme generovat podle textu - embeddings
+    # bereme z cache a při shodných větvích CFG poběží jediná větev UNetu
+    conditioning = conditioning_call_kwargs(
+        get_conditioning(pipe, model_identity, "", clip_skip=clip_skip), guidance_scale
+    )
+    
+    # Mikro-dávky, slicing a dlaždice podle plánu paměti pro rozlišení vstupu
+    width, height = images[0].size
+    if plan is None:
+        free = available_memory_bytes(device)
+        plan = plan_execution(
+            num_images, width, height, pipe.unet.dtype, device, 0, {'device': free, 'host': available_memory_bytes("cpu")},
+            resident_modes=(False, True), do_classifier_free_guidance=conditioning['guidance_scale'] > 1.0
+        ) or {'batch_size': 1, 'attention_slicing': True, 'vae_slicing': True, 'tiling': True}
+    apply_plan(pipe, plan)
+    
+    with tiled_execution(pipe, width, height, notify, force=plan['tiling']):
+        return generate_micro_batches(
+            pipe, images, generators, plan['batch_size'], strength, num_inference_steps,
+            progress_callback, conditioning, vae_model_identity or model_identity, notify
+        )
+
+def generate_micro_batches(pipe, images, generators, batch_size, strength, num_inference_steps, progress_callback, conditioning, vae_model_identity, notify=print):
+    """Spustí pipeline po mikro-dávkách; None u vzorků, jejichž dávka selhala"""
+    num_images = len(images)
+    results = []
+    for start in range(0, num_images, batch_size):
+        batch_count = min(batch_size, num_images - start)
+        
+        # Callback pro progress bar během generování - zároveň měří dobu kroků
+        step_clock = [time.perf_counter()]
+        
+        def callback_fn(step, timestep, latents):
+            now = time.perf_counter()
+            get_tracer().record_span('denoise_step', now - step_clock[0], step=step, batch=batch_count)
+            step_clock[0] = now
+            # Mapování kroků generování na progress 0.6 - 0.85
+            generation_progress = 0.6 + (start / num_images) * 0.25 + (step / num_inference_steps) * (0.25 * batch_count / num_images)
+            progress_callback(generation_progress)
+            return latents
+        
+        # Aktualizace progress pro každou dávku
+        progress_callback(0.6 + (start / num_images) * 0.25, f"Generuji obrázky {start+1}-{start+batch_count}/{num_images}...")
+        
+        # Aplikace stylu na vstupní obrázek - VAE encoder běží jen při miss
+        # v cache latentů, vzorek se bere s generátorem daného výstupu
+        batch_generators = generators[start:start + batch_count] if generators else None
+        try:
+            image_latents = batch_image_latents(
+                pipe, images[start:start + batch_count], batch_generators,
+                vae_model_identity, conditioning['prompt_embeds'].dtype
+            )
+            step_clock[0] = time.perf_counter()
+            with traced_method(pipe.vae, 'decode', 'vae_decode'):
+                batch = pipe(
+                    image=image_latents,
+                    num_images_per_prompt=batch_count,
+                    strength=strength,
+                    num_inference_steps=num_inference_steps,
+                    generator=batch_generators,
+                    callback=callback_fn,
+                    callback_steps=1,
+                    **conditioning
+                ).images
+            
+            results.extend(batch)
+        
+        except Exception as e:
+            notify(f"Chyba při generování obrázků {start+1}-{start+batch_count}: {e}")
+            results.extend([None] * batch_count)
+    
+    return results
+
+def upscale_images(images, upscale_factor, progress_callback):
+    """Zvětší výsledky po dlaždicích (upscaling.py); při chybě ponechá původní obrázek"""
+    return get_upscale_stage().upscale_images(images, upscale_factor, progress_callback)
+
+# Funkce pro aplikaci stylu na vstupní obrázek
+def generate_images(input_image, model_path, model_type, strength, guidance_scale, num_inference_steps, progress_callback, clip_skip=2, seed=None, upscale_factor=1, num_images=1, sampler="DPMSolverMultistepScheduler", variance_seed=None, variance_strength=0.0, notify=print):
+    """
+    Aplikuje styl modelu na vstupní obrázek a vrátí seznam všech variant.
+
+    Chyby určené uživateli vyhazuje jako `InferenceError`.
+    """
+    request = {
+        'input_image': input_image,
+        'seed': seed,
+        'variance_seed': variance_seed,
+        'num_images': num_images,
+        'upscale_factor': upscale_factor,
+    }
+    return generate_batch(
+        model_path, model_type, [request], strength, guidance_scale, num_inference_steps,
+        progress_callback, clip_skip=clip_skip, sampler=sampler, notify=notify
+    )[0]
+
+@traced('generate')
+def generate_batch(model_path, model_type, requests, strength, guidance_scale, num_inference_steps, progress_callback, clip_skip=2, sampler="DPMSolverMultistepScheduler", notify=print):
+    """
+    Vygeneruje více požadavků na stejném modelu v jednom průchodu pipeline.
+
+    Každý požadavek je slovník s klíči `input_image`, `seed`, `variance_seed`,
+    `num_images` a `upscale_factor`; vstupy musí mít stejné rozlišení. Vrací
+    seznam výsledků (seznamů variant) ve stejném pořadí jako `requests`.
+    """
+    # Použití optimální device detekce s fallback
+    device, device_reason = get_optimal_device()
+    torch_dtype = torch.float16 if device == "cuda" else torch.float32
+    
+    # Logování device informací
+    if "chyba" in device_reason.lower():
+        print(f"Warning: {device_reason}")
+    
+    # Progress tracking - začátek
+    progress_callback(0.1)
+    
+    # Pokročilé vyčištění paměti před generováním
+    if device == "cuda":
+        torch.cuda.empty_cache()
+        torch.cuda.synchronize()
+    gc.collect()
+    
+    # Nastavení memory efficient attention pro velké modely
+    os.environ["PYTORCH_CUDA_ALLOC_CONF"] = "max_split_size_mb:512"
+    
+    if model_type not in ("lora", "full_model"):
+        raise InferenceError("Nepodporovaný typ modelu")
+    if sampler not in SCHEDULER_MAP:
+        raise InferenceError(f"Neznámý sampler: {sampler}")
+    try:
+        check_denoising_steps(num_inference_steps, strength)
+    except ValueError as e:
+        raise InferenceError(f"❌ {e}") from e
+    
+    # Vzorky všech požadavků za sebou - varianty jednoho vstupu tvoří souvislý úsek
+    samples = [
+        (request['input_image'], sample_seed)
+        for request in requests
+        for sample_seed in variant_seeds(request['seed'], request['variance_seed'], request['num_images'])
+    ]
+    
+    registry = get_pipeline_registry()
+    
+    # Odhad paměti požadavku - váhy, aktivace pro rozlišení a dávku, výstupy po upscalingu
+    width, height = samples[0][0].size
+    output_bytes = sum(
+        estimate_output_bytes(width, height, request['num_images'], request['upscale_factor'])
+        for request in requests
+    )
+    
+    def run(device, torch_dtype):
+        # Hot LoRA sloučená do vah base modelu běží jako samostatný model bez adaptéru
+        fused_path = None
+        if model_type == "lora" and FUSED_LORA and not TINY_PIPELINE:
+            fused_path = get_lora_fusion().resolve(model_path, torch_dtype, notify)
+        load_path, load_type = (fused_path, "fused_lora") if fused_path else (model_path, model_type)
+        
+        # Rezidentní pipeline - LoRA sdílí jednu base pipeline, full modely a sloučené LoRA mají vlastní
+        registry_path = BASE_MODEL if load_type == "lora" else load_path
+        registry_type = "base" if load_type == "lora" else load_type
+        
+        # Plán (mikro-dávky, slicing, dlaždice, offload) se vybírá před načtením modelu
+        plan = admit_request(
+            registry, registry_path, registry_type, device, torch_dtype,
+            estimate_weight_bytes(load_path, load_type, torch_dtype), len(samples), width, height,
+            output_bytes, guidance_scale > 1.0
+        )
+        enable_cpu_offload = plan['cpu_offload']
+        memory_pool = "device" if device == "cuda" and not enable_cpu_offload else "host"
+        key = registry.make_key(registry_path, registry_type, torch_dtype, device, enable_cpu_offload)
+        # Slicing se nastavuje před každým generováním podle plánu (apply_plan)
+        loader = lambda: load_pipeline(
+            load_path, load_type, device, torch_dtype, clip_skip,
+            False, enable_cpu_offload
+        )
+        
+        # Base pipeline pro LoRA zůstává v paměti trvale (jedna na zařízení)
+        for attempt in range(2):
+            try:
+                with registry.lease(key, loader, memory_pool, pinned=load_type == "lora") as pipe:
+                    # Progress tracking - pipeline připravena
+                    progress_callback(0.4)
+                    
+                    lora_attached = False
+                    if load_type == "lora":
+                        # Progress tracking - výměna LoRA adaptéru
+                        progress_callback(0.5)
+                        lora_attached = attach_lora(pipe, model_path, notify)
+                    
+                    # Progress tracking - příprava generování
+                    progress_callback(0.6)
+                    
+                    results = generate_variants(
+                        pipe, device, samples, strength, guidance_scale, num_inference_steps,
+                        progress_callback, conditioning_identity(load_type, load_path, lora_attached),
+                        clip_skip=clip_skip, sampler=sampler,
+                        vae_model_identity=vae_identity(load_type, load_path), notify=notify, plan=plan
+                    )
+                    
+                    # Podmínění full modelu je v cache - text encodery už nepotřebujeme.
+                    # Base pipeline si je nechává, LoRA je mohou měnit.
+                    if load_type in ("full_model", "fused_lora") and RELEASE_TEXT_ENCODERS:
+                        release_text_encoders(pipe)
+                    return results
+            except TextEncodersReleased:
+                # Podmínění zmizelo z cache - pipeline načteme znovu i s text encodery
+                if attempt:
+                    raise
+                registry.invalidate(key)
+    
+    try:
+        # Progress tracking - načítání modelu
+        progress_callback(0.2)
+        
+        try:
+            results = run(device, torch_dtype)
+        except InferenceError:
+            # Odmítnutí plánem paměti apod. - zpráva je už určená uživateli
+            raise
+        except Exception as e:
+            if model_type == "lora" and device == "cuda" and isinstance(e, RuntimeError) and "CUDA" in str(e):
+                # Fallback na CPU při CUDA chybě
+                notify(f"⚠️ CUDA chyba při načítání modelu, přepínám na CPU: {str(e)[:50]}...")
+                device = "cpu"
+                torch_dtype = torch.float32
+                results = run(device, torch_dtype)
+            elif model_type == "full_model":
+                raise InferenceError(f"Chyba při načítání full modelu: {e}") from e
+            else:
+                raise
+        
+        # Progress tracking - generování dokončeno
+        progress_callback(0.85)
+        
+        # Rozdělení výsledků zpět mezi požadavky, bez vzorků ze selhaných dávek
+        outputs = []
+        offset = 0
+        for request in requests:
+            images = [image for image in results[offset:offset + request['num_images']] if image is not None]
+            offset += request['num_images']
+            # Upscaling pokud je povoleno
+            if request['upscale_factor'] > 1:
+                images = upscale_images(images, request['upscale_factor'], progress_callback)
+            outputs.append(images)
+        
+        # Progress tracking - dokončeno
+        progress_callback(1.0)
+        
+        return outputs
+        
+    finally:
+        # Vyčištění dočasné paměti po generování - pipeline zůstává v registru
+        if device == "cuda":
+            torch.cuda.empty_cache()
+        gc.collect()
+
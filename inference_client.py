@@ -0,0 +1,114 @@
+"""
+Klient HTTP inference API (api_server.py)
+
+Používá jen standardní knihovnu, aby Streamlit UI v režimu klienta
+nepotřebovalo další závislosti.
+"""
+
+import base64
+import io
+import json
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+
+from PIL import Image
+
+from config import INFERENCE_API_URL
+
+
+class RemoteInferenceError(RuntimeError):
+    """Chyba hlášená inference API nebo nedostupná služba."""
+
+
+class InferenceClient:
+    """Zadává úlohy inference API a čeká na jejich výsledky."""
+
+    def __init__(self, base_url, timeout=30):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+
+    def _request(self, path, payload=None):
+        data = json.dumps(payload).encode() if payload is not None else None
+        req = urllib.request.Request(
+            self.base_url + path, data=data,
+            headers={'Content-Type': 'application/json'} if data is not None else {}
+        )
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout) as response:
+                return response.read()
+        except urllib.error.HTTPError as e:
+            try:
+                message = json.loads(e.read()).get('error', str(e))
+            except ValueError:
+                message = str(e)
+            raise RemoteInferenceError(message) from e
+        except urllib.error.URLError as e:
+            raise RemoteInferenceError(f"Inference API není dostupné ({self.base_url}): {e.reason}") from e
+
+    def submit(self, input_image, model_path, model_type=None, **params):
+        """Zadá úlohu a vrátí její id."""
+        buf = io.BytesIO()
+        input_image.save(buf, format="PNG")
+        payload = dict(
+            params,
+            image_base64=base64.b64encode(buf.getvalue()).decode(),
+            model_path=os.path.abspath(model_path) if model_path else None,
+            model_type=model_type,
+        )
+        return json.loads(self._request('/v1/jobs', payload))['job_id']
+
+    def status(self, job_id):
+        return json.loads(self._request(f'/v1/jobs/{job_id}'))
+
+    def fetch_images(self, job_id):
+        """Stáhne všechny varianty dokončené úlohy."""
+        result = json.loads(self._request(f'/v1/jobs/{job_id}/result'))
+        images = []
+        for url in result['images']:
+            image = Image.open(io.BytesIO(self._request(url)))
+            image.load()
+            images.append(image)
+        return images
+
+    def wait(self, job_id, progress_callback=None, notify=print, poll_interval=0.5):
+        """Čeká na dokončení úlohy a vrátí seznam variant."""
+        reported_warnings = 0
+        while True:
+            job = self.status(job_id)
+            for message in job['warnings'][reported_warnings:]:
+                notify(message)
+            reported_warnings = len(job['warnings'])
+            if progress_callback is not None and job['status'] == 'running':
+                progress_callback(job['progress'])
+            if job['status'] == 'done':
+                if progress_callback is not None:
+                    progress_callback(1.0)
+                return self.fetch_images(job_id)
+            if job['status'] == 'error':
+                raise RemoteInferenceError(job['error'])
+            time.sleep(poll_interval)
+
+    def generate(self, input_image, model_path, model_type, progress_callback=None, notify=print, **params):
+        """Zadá úlohu a počká na výsledek - stejné parametry jako `generate_images`."""
+        job_id = self.submit(input_image, model_path, model_type, **params)
+        return self.wait(job_id, progress_callback, notify)
+
+    def stats(self):
+        return json.loads(self._request('/v1/stats'))
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_inference_client(base_url=None) -> InferenceClient:
+    """Vrátí procesově sdíleného klienta pro INFERENCE_API_URL."""
+    global _client
+    base_url = (base_url or INFERENCE_API_URL).rstrip('/')
+    with _client_lock:
+        if _client is None or _client.base_url != base_url:
+            _client = InferenceClient(base_url)
+        return _client
@@ -0,0 +1,350 @@
+"""
+Dlouho běžící worker proces pro generování
+
+Worker drží pipeline rezidentní mezi požadavky (registr pipeline, cache
+podmínění, latentů a LoRA vah žijí v jeho procesu) a úlohy spouští přes
+plánovač dávek (batch_scheduler.py). Rodičovský proces (HTTP
+API) vede frontu a stav úloh; worker posílá události `started`, `progress`,
+`warning`, `done`, `error`, `stats` a po předehřátí modelů `ready` přes
+frontu událostí.
+
+Rodič předává workeru nejvýš API_WORKER_IN_FLIGHT úloh najednou (tolik jich
+plánovač může spojit do dávek), zbytek čeká ve frontě rodiče. Pokud worker
+spadne (např. OOM killer), rozpracovaná úloha se označí jako chybná, předané
+a ještě nespuštěné úlohy se vrátí na začátek fronty a worker se spustí
+znovu s novou frontou úloh - úlohy ve frontě tak zůstanou zachovány.
+"""
+
+import multiprocessing
+import os
+import queue
+import shutil
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+
+API_JOB_RETENTION = int(os.getenv('API_JOB_RETENTION', '200'))
+# Kolik úloh má worker najednou (spojují se do dávek), ostatní čekají v rodiči
+API_WORKER_IN_FLIGHT = int(os.getenv('API_WORKER_IN_FLIGHT', '8'))
+# Úloha předaná workeru, který pokaždé spadl dřív, než ohlásil start, se vzdá
+MAX_JOB_ATTEMPTS = 2
+
+
+def engine_loaded():
+    """Generační jádro už je v procesu naimportované (statistiky pak nic nenačítají)."""
+    return 'batch_scheduler' in sys.modules
+
+
+def collect_worker_stats():
+    """Statistiky cache a plánovače dávek ve worker procesu."""
+    from batch_scheduler import get_batch_scheduler
+    from component_sharing import get_component_pool
+    from conditioning import get_conditioning_cache
+    from latent_cache import get_latent_cache
+    from lora_fusion import get_lora_fusion
+    from lora_manager import get_lora_weight_cache
+    from pipeline_registry import get_pipeline_registry
+    from tracing import get_tracer
+    from upscaling import get_upscale_stage
+
+    return {
+        'registry': get_pipeline_registry().stats(),
+        'components': get_component_pool().stats(),
+        'conditioning': get_conditioning_cache().stats(),
+        'latents': get_latent_cache().stats(),
+        'lora_weights': get_lora_weight_cache().stats(),
+        'fused_loras': get_lora_fusion().stats(),
+        'batching': get_batch_scheduler().stats(),
+        'upscaling': get_upscale_stage().stats(),
+        'metrics': get_tracer().snapshot(),
+    }
+
+
+def save_results(job, images, upscale_factor=1):
+    """
+    Uloží varianty jako PNG do adresáře úlohy a vrátí jejich cesty. Upscaling
+    zapisuje rovnou do souborů, takže zvětšené varianty nejsou v paměti najednou.
+    """
+    from upscaling import get_upscale_stage
+
+    paths = [os.path.join(job['dir'], f"variant_{i + 1}.png") for i in range(len(images))]
+    if upscale_factor > 1:
+        return get_upscale_stage().upscale_to_files(images, upscale_factor, paths)
+    for image, path in zip(images, paths):
+        image.save(path, format="PNG")
+    return paths
+
+
+def submit_job(scheduler, job, event_queue):
+    """Předá úlohu plánovači dávek; výsledek ohlásí přes frontu událostí."""
+    from PIL import Image
+
+    job_id = job['id']
+    # Upscaling až při ukládání - po dlaždicích rovnou na disk
+    params = dict(job['params'])
+    upscale_factor = params.pop('upscale_factor', 1)
+
+    def progress(value, text=""):
+        event_queue.put(('progress', job_id, {'progress': float(value), 'message': text}))
+
+    def notify(message):
+        event_queue.put(('warning', job_id, {'message': str(message)}))
+
+    def finished(future):
+        try:
+            paths = save_results(job, future.result(), upscale_factor)
+            event_queue.put(('done', job_id, {'images': paths}))
+        except Exception as e:
+            event_queue.put(('error', job_id, {'error': str(e)}))
+        try:
+            event_queue.put(('stats', None, collect_worker_stats()))
+        except Exception as e:
+            print(f"⚠️ Nelze získat statistiky workeru: {e}")
+
+    try:
+        input_image = Image.open(job['input_path']).convert("RGB")
+    except Exception as e:
+        event_queue.put(('error', job_id, {'error': f"Nelze načíst vstupní obrázek: {e}"}))
+        return
+    future = scheduler.submit(
+        input_image, job['model_path'], job['model_type'],
+        progress_callback=progress, notify=notify,
+        on_start=lambda: event_queue.put(('started', job_id, {'pid': os.getpid()})),
+        **params
+    )
+    future.add_done_callback(finished)
+
+
+def worker_main(job_queue, event_queue):
+    """
+    Hlavní smyčka worker procesu - úlohy předává plánovači dávek, aby se
+    souběžné kompatibilní úlohy spojily. `None` ve frontě worker ukončí.
+    Nejdřív předehřeje modely z PRELOAD_MODELS; úlohy mezitím čekají ve frontě.
+    """
+    from batch_scheduler import get_batch_scheduler
+    from warmup import run_warmup
+
+    scheduler = get_batch_scheduler()
+    event_queue.put(('ready', None, run_warmup()))
+    event_queue.put(('stats', None, collect_worker_stats()))
+    while True:
+        job = job_queue.get()
+        if job is None:
+            break
+        submit_job(scheduler, job, event_queue)
+    # Rozpracované úlohy doběhnou před ukončením
+    scheduler.wait_idle()
+
+
+class InferenceWorker:
+    """Správce worker procesu a stavu úloh (běží v procesu HTTP API)."""
+
+    def __init__(self, jobs_dir, retention=API_JOB_RETENTION, in_flight=API_WORKER_IN_FLIGHT):
+        self.jobs_dir = jobs_dir
+        self.retention = retention
+        self.in_flight = max(1, in_flight)
+        # spawn - CUDA nelze používat ve forknutém procesu
+        self._ctx = multiprocessing.get_context('spawn')
+        # Fronta úloh patří jednomu worker procesu - po pádu se zahodí i s tím, co v ní zbylo
+        self._job_queue = None
+        self._event_queue = self._ctx.Queue()
+        self._process = None
+        self._listener = None
+        self._jobs = OrderedDict()
+        # Úlohy čekající v rodiči a úlohy předané aktuálnímu workeru
+        self._pending = deque()
+        self._dispatched = set()
+        self._lock = threading.Lock()
+        self.restarts = 0
+        self.worker_stats = {}
+        # Stav předehřátí workeru - připraven až po dokončení (i po restartu)
+        self.readiness = {'ready': False}
+        self._stopping = False
+        # Zpoždění restartu roste, pokud worker padá hned po startu
+        self._restart_delay = 0.0
+        self._next_restart = 0.0
+
+    # --- životní cyklus ------------------------------------------------------
+
+    def start(self):
+        """Spustí worker proces a vlákno zpracovávající jeho události (idempotentní)."""
+        with self._lock:
+            self._ensure_process()
+            self._dispatch()
+            if self._listener is None or not self._listener.is_alive():
+                self._listener = threading.Thread(target=self._listen, name="inference-events", daemon=True)
+                self._listener.start()
+
+    def _ensure_process(self):
+        if self._process is not None and self._process.is_alive():
+            return
+        if self._process is not None:
+            self._requeue_dispatched(self._process.exitcode)
+        self.readiness = {'ready': False}
+        self._job_queue = self._ctx.Queue()
+        self._process = self._ctx.Process(
+            target=worker_main, args=(self._job_queue, self._event_queue),
+            name="inference-worker", daemon=True
+        )
+        self._process.start()
+
+    def is_alive(self):
+        return self._process is not None and self._process.is_alive()
+
+    def stop(self, timeout=10):
+        """Ukončí worker po dokončení rozpracované úlohy."""
+        self._stopping = True
+        if self._process is not None:
+            self._job_queue.put(None)
+            self._process.join(timeout)
+
+    # --- úlohy ---------------------------------------------------------------
+
+    def create_job_dir(self):
+        """Vytvoří adresář nové úlohy a vrátí (id, cesta)."""
+        job_id = uuid.uuid4().hex
+        job_dir = os.path.join(self.jobs_dir, job_id)
+        os.makedirs(job_dir, exist_ok=True)
+        return job_id, job_dir
+
+    def submit(self, job_id, job_dir, input_path, model_path, model_type, params):
+        """Zařadí úlohu do fronty workeru a vrátí její stav."""
+        job = {
+            'id': job_id,
+            'dir': job_dir,
+            'input_path': input_path,
+            'model_path': model_path,
+            'model_type': model_type,
+            'params': params,
+            'status': 'queued',
+            'progress': 0.0,
+            'message': '',
+            'warnings': [],
+            'images': [],
+            'error': None,
+            'created': time.time(),
+            'started': None,
+            'finished': None,
+            'attempts': 0,
+        }
+        with self._lock:
+            self._jobs[job_id] = job
+            self._pending.append(job_id)
+            self._prune()
+            self._dispatch()
+        return self.get(job_id)
+
+    def _dispatch(self):
+        """Předá workeru čekající úlohy, dokud nemá API_WORKER_IN_FLIGHT rozpracovaných."""
+        if not self.is_alive():
+            return
+        while self._pending and len(self._dispatched) < self.in_flight:
+            job = self._jobs.get(self._pending.popleft())
+            if job is None or job['status'] != 'queued':
+                continue
+            job['attempts'] += 1
+            self._dispatched.add(job['id'])
+            self._job_queue.put({key: job[key] for key in ('id', 'dir', 'input_path', 'model_path', 'model_type', 'params')})
+
+    def get(self, job_id):
+        """Kopie stavu úlohy, nebo None."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job, warnings=list(job['warnings']), images=list(job['images'])) if job else None
+
+    def queue_length(self):
+        with self._lock:
+            return sum(1 for job in self._jobs.values() if job['status'] == 'queued')
+
+    def _prune(self):
+        """Zapomene nejstarší dokončené úlohy nad limit a smaže jejich soubory."""
+        finished = [job_id for job_id, job in self._jobs.items() if job['status'] in ('done', 'error')]
+        for job_id in finished[:max(0, len(finished) - self.retention)]:
+            job = self._jobs.pop(job_id)
+            shutil.rmtree(job['dir'], ignore_errors=True)
+
+    # --- události workeru ----------------------------------------------------
+
+    def _listen(self):
+        while True:
+            try:
+                kind, job_id, payload = self._event_queue.get(timeout=1.0)
+            except queue.Empty:
+                self._check_worker()
+                continue
+            self._handle(kind, job_id, payload)
+
+    def _handle(self, kind, job_id, payload):
+        with self._lock:
+            if kind == 'stats':
+                self.worker_stats = payload
+                return
+            if kind == 'ready':
+                self.readiness = payload
+                return
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            if kind == 'started':
+                job.update(status='running', started=time.time())
+            elif kind == 'progress':
+                job['progress'] = payload['progress']
+                if payload['message']:
+                    job['message'] = payload['message']
+            elif kind == 'warning':
+                job['warnings'].append(payload['message'])
+            elif kind == 'done':
+                job.update(status='done', progress=1.0, images=payload['images'], finished=time.time())
+                self._finish(job_id)
+            elif kind == 'error':
+                job.update(status='error', error=payload['error'], finished=time.time())
+                self._finish(job_id)
+
+    def _finish(self, job_id):
+        self._dispatched.discard(job_id)
+        self._restart_delay = 0.0
+        self._prune()
+        self._dispatch()
+
+    def _requeue_dispatched(self, exitcode):
+        """
+        Úlohy předané skončenému workeru: rozpracované označí jako chybné,
+        nespuštěné vrátí na začátek fronty v původním pořadí.
+        """
+        requeued = set()
+        for job_id in self._dispatched:
+            job = self._jobs.get(job_id)
+            if job is None:
+                continue
+            if job['status'] == 'running':
+                job.update(status='error', finished=time.time(),
+                           error=f"Worker proces skončil (exit code {exitcode})")
+            elif job['status'] == 'queued' and job['attempts'] >= MAX_JOB_ATTEMPTS:
+                # Událost `started` se při zabití procesu nemusí odeslat - úloha
+                # mohla pád sama způsobit, proto se nezkouší donekonečna
+                job.update(status='error', finished=time.time(),
+                           error=f"Worker proces opakovaně skončil (exit code {exitcode})")
+            elif job['status'] == 'queued':
+                requeued.add(job_id)
+        self._dispatched.clear()
+        # self._jobs je seřazený podle zadání
+        self._pending.extendleft(reversed([job_id for job_id in self._jobs if job_id in requeued]))
+        self._prune()
+        if requeued:
+            print(f"🔁 {len(requeued)} úloh předaných workeru se vrací do fronty")
+
+    def _check_worker(self):
+        """Při pádu workeru vyřídí jeho úlohy a spustí nový (se zpožděním při opakovaných pádech)."""
+        with self._lock:
+            if self._stopping or self._process is None or self._process.is_alive():
+                return
+            if time.time() < self._next_restart:
+                return
+            print(f"❌ Worker proces skončil (exit code {self._process.exitcode}), spouštím znovu")
+            self.restarts += 1
+            self._restart_delay = min(30.0, self._restart_delay * 2 or 1.0)
+            self._next_restart = time.time() + self._restart_delay
+            self._ensure_process()
+            self._dispatch()
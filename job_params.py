@@ -0,0 +1,67 @@
+"""
+Parametry generování sdílené HTTP API a dávkovým CLI
+
+Bez závislosti na torch/diffusers - validace běží i v procesu API, který
+modely nenačítá.
+"""
+
+# Názvy schedulerů diffusers, které umí inference.SCHEDULER_MAP
+SAMPLERS = (
+    "DPMSolverMultistepScheduler",
+    "EulerDiscreteScheduler",
+    "EulerAncestralDiscreteScheduler",
+    "DDIMScheduler",
+    "LMSDiscreteScheduler",
+    "PNDMScheduler",
+)
+
+# Parametry úlohy: (typ, výchozí hodnota, minimum, maximum) - výchozí hodnoty a rozsahy odpovídají UI
+JOB_PARAMS = {
+    'strength': (float, 0.6, 0.1, 1.0),
+    'guidance_scale': (float, 7.5, 1.0, 30.0),
+    'num_inference_steps': (int, 20, 1, 150),
+    'clip_skip': (int, 2, 1, 4),
+    'seed': (int, None, 0, 2147483647),
+    'upscale_factor': (int, 1, 1, 4),
+    'num_images': (int, 1, 1, 8),
+    'sampler': (str, "DPMSolverMultistepScheduler", None, None),
+    'variance_seed': (int, None, 0, 2147483647),
+    'variance_strength': (float, 0.0, 0.0, 1.0),
+}
+# Parametry s výčtem povolených hodnot
+JOB_PARAM_CHOICES = {'sampler': SAMPLERS}
+
+
+def denoising_steps(num_inference_steps, strength):
+    """Počet kroků, které img2img skutečně provede (diffusers: int(kroky × strength))."""
+    return min(int(num_inference_steps * strength), num_inference_steps)
+
+
+def check_denoising_steps(num_inference_steps, strength):
+    """ValueError, pokud by img2img neprovedl ani jeden krok (pipeline by spadla)."""
+    if denoising_steps(num_inference_steps, strength) < 1:
+        raise ValueError(
+            f"Strength {strength} při {num_inference_steps} krocích nedá ani jeden krok odšumění - "
+            f"zvyšte strength nebo počet kroků"
+        )
+
+
+def parse_job_params(values):
+    """Převede parametry z formuláře/JSON na typy `generate_images`; ValueError při chybě."""
+    params = {}
+    for name, (cast, default, minimum, maximum) in JOB_PARAMS.items():
+        raw = values.get(name)
+        if raw is None or raw == "":
+            params[name] = default
+            continue
+        try:
+            value = cast(raw)
+        except (TypeError, ValueError):
+            raise ValueError(f"Neplatná hodnota parametru {name}: {raw!r}")
+        if minimum is not None and not minimum <= value <= maximum:
+            raise ValueError(f"Parametr {name} musí být v rozsahu {minimum} - {maximum}")
+        if name in JOB_PARAM_CHOICES and value not in JOB_PARAM_CHOICES[name]:
+            raise ValueError(f"Parametr {name} musí být jeden z: {', '.join(JOB_PARAM_CHOICES[name])}")
+        params[name] = value
+    check_denoising_steps(params['num_inference_steps'], params['strength'])
+    return params
@@ -0,0 +1,135 @@
+"""
+Cache VAE-zakódovaných vstupních obrázků
+
+Uživatelé typicky nahrají jednu fotku a ladí strength, CFG, seed nebo LoRA -
+vstup se přitom pokaždé znovu kóduje VAE encoderem. Cache drží parametry
+latentního rozdělení (mean/logvar) klíčované hashem obsahu obrázku, identitou
+VAE a cílovým rozlišením.
+
+Ukládá se rozdělení, ne vzorek: vzorek se z něj vytáhne generátorem daného
+výstupu stejně jako v `prepare_latents` pipeline, takže výsledky se seedem
+zůstávají shodné s během bez cache.
+"""
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import torch
+from diffusers.models.vae import DiagonalGaussianDistribution
+
+from tracing import count, traced
+
+LATENT_CACHE_MB = float(os.getenv('LATENT_CACHE_MB', '256'))
+
+
+def image_content_hash(image):
+    """Hash obsahu PIL obrázku (režim, rozměry a pixely)."""
+    digest = hashlib.sha256(f"{image.mode}:{image.size}".encode())
+    digest.update(image.tobytes())
+    return digest.hexdigest()
+
+
+class LatentCache:
+    """LRU cache parametrů latentního rozdělení omezená velikostí."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            params = self._entries.get(key)
+            if params is None:
+                self.misses += 1
+                count('cache_misses_total', cache='latents')
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            count('cache_hits_total', cache='latents')
+            return params
+
+    def put(self, key, params):
+        with self._lock:
+            self._entries[key] = params
+            self._entries.move_to_end(key)
+            while len(self._entries) > 1 and self._total_bytes() > self.max_bytes:
+                self._entries.popitem(last=False)
+
+    def _total_bytes(self):
+        return sum(p.numel() * p.element_size() for p in self._entries.values())
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'entries': len(self._entries),
+                'cached_mb': self._total_bytes() / (1024 * 1024),
+            }
+
+
+_cache = LatentCache(int(LATENT_CACHE_MB * 1024 * 1024))
+
+
+def get_latent_cache() -> LatentCache:
+    """Vrátí procesově sdílenou cache latentů."""
+    return _cache
+
+
+@traced('vae_encode')
+def encode_latent_distribution(pipe, image_tensor, device, dtype):
+    """Zakóduje předzpracovaný obrázek VAE encoderem stejně jako pipeline."""
+    image = image_tensor.to(device=device, dtype=dtype)
+    # VAE v float16 přetéká - pipeline ho stejně dočasně převádí na float32
+    upcast = pipe.vae.config.force_upcast
+    if upcast:
+        image = image.float()
+        pipe.vae.to(dtype=torch.float32)
+    try:
+        with torch.no_grad():
+            return pipe.vae.encode(image).latent_dist.parameters
+    finally:
+        if upcast:
+            pipe.vae.to(dtype)
+
+
+def prepare_image_latents(pipe, image, vae_identity, count, dtype, generators=None):
+    """
+    Vrátí počáteční latenty (count, 4, h, w) pro img2img, s VAE encoderem jen při miss.
+
+    Výsledek lze předat pipeline jako `image` - 4kanálový vstup pipeline
+    nekóduje znovu.
+    """
+    device = pipe._execution_device
+    image_tensor = pipe.image_processor.preprocess(image)
+    key = (
+        str(vae_identity),
+        image_content_hash(image),
+        tuple(image_tensor.shape[-2:]),
+        str(dtype),
+        bool(getattr(pipe.vae, 'use_tiling', False)),
+        str(device),
+    )
+
+    cache = get_latent_cache()
+    params = cache.get(key)
+    if params is None:
+        params = encode_latent_distribution(pipe, image_tensor, device, dtype).detach().cpu()
+        cache.put(key, params)
+    params = params.to(device)
+
+    # Vzorkování jako v prepare_latents: jeden vzorek na generátor
+    if generators:
+        distribution = DiagonalGaussianDistribution(params)
+        samples = torch.cat([distribution.sample(generator) for generator in generators], dim=0)
+    else:
+        samples = DiagonalGaussianDistribution(params.repeat(count, 1, 1, 1)).sample(None)
+
+    return pipe.vae.config.scaling_factor * samples.to(dtype)
@@ -0,0 +1,187 @@
+"""
+Sloučené (fused) LoRA pro často používané styly
+
+Připojený adaptér stojí při každém volání UNetu výpočet navíc (LoRA vrstvy
+vedle každé projekce). LoRA, které tvoří většinu provozu, se proto sloučí do
+vah base modelu (`fuse_lora`) a výsledná pipeline se uloží na disk ve formátu
+diffusers - požadavky na takový styl pak běží rychlostí čistého base modelu.
+
+O sloučení rozhoduje četnost: LoRA použitá alespoň FUSED_LORA_MIN_REQUESTS×
+za posledních FUSED_LORA_WINDOW_S sekund se sloučí na pozadí (na CPU, aby se
+nesahalo na sdílenou base pipeline) a do té doby se generuje s adaptérem.
+
+Klíč položky tvoří hash obsahu LoRA, identita base modelu, váha a dtype -
+změna souboru LoRA nebo aktualizace base modelu tak vede k nové položce
+a staré se časem uvolní LRU úklidem (converted_cache.py). Požadavek hledá
+položku jen podle už známého hashe a identity; hashování souboru LoRA
+a procházení base modelu běží ve vlákně na pozadí (jako u converted_cache.py).
+"""
+
+import hashlib
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from config import BASE_MODEL, FULL_MODELS_PATH
+from converted_cache import ConvertedCache, dtype_name, resolve_cache_root
+from lora_manager import get_lora_weight_cache
+from model_inspect import content_digest, known_content_digest
+from tracing import span
+
+# Slučovat často používané LoRA do vah base modelu
+FUSED_LORA = os.getenv('FUSED_LORA', 'false').lower() == 'true'
+# Kolik požadavků v okně udělá z LoRA "hot" styl
+FUSED_LORA_MIN_REQUESTS = int(os.getenv('FUSED_LORA_MIN_REQUESTS', '5'))
+FUSED_LORA_WINDOW_S = float(os.getenv('FUSED_LORA_WINDOW_S', '3600'))
+FUSED_LORA_PATH = os.getenv(
+    'FUSED_LORA_PATH', os.path.join(os.path.dirname(os.path.abspath(FULL_MODELS_PATH)), 'fused_loras')
+)
+FUSED_LORA_CACHE_GB = float(os.getenv('FUSED_LORA_CACHE_GB', '30'))
+# Adaptéry se připojují s výchozí váhou - sloučení musí použít stejnou
+DEFAULT_LORA_SCALE = 1.0
+GB = 1024 ** 3
+
+
+def base_model_identity():
+    """Identita base modelu - lokální cesta podle obsahu, model z Hubu podle revize v cache."""
+    if os.path.isfile(BASE_MODEL):
+        return content_digest(BASE_MODEL)
+    if os.path.isdir(BASE_MODEL):
+        digest = hashlib.sha256()
+        for dir_path, _dirs, files in sorted(os.walk(BASE_MODEL)):
+            for name in sorted(files):
+                stat = os.stat(os.path.join(dir_path, name))
+                digest.update(f"{os.path.relpath(os.path.join(dir_path, name), BASE_MODEL)}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+        return digest.hexdigest()
+    try:
+        from huggingface_hub import try_to_load_from_cache
+        # .../snapshots/<commit>/model_index.json
+        cached = try_to_load_from_cache(BASE_MODEL, 'model_index.json')
+        if isinstance(cached, str):
+            return f"{BASE_MODEL}@{os.path.basename(os.path.dirname(cached))}"
+    except ImportError:
+        pass
+    return BASE_MODEL
+
+
+def format_fused_key(lora_digest, base_identity, torch_dtype, scale=DEFAULT_LORA_SCALE):
+    """Klíč sloučené pipeline - mění se se souborem LoRA i s base modelem."""
+    base = hashlib.sha256(base_identity.encode()).hexdigest()[:16]
+    return f"lora-{lora_digest[:32]}-base-{base}-x{scale:g}-{dtype_name(torch_dtype)}"
+
+
+def build_fused_pipeline(lora_path, torch_dtype, scale=DEFAULT_LORA_SCALE):
+    """Načte base model na CPU, sloučí do něj LoRA a odpojí adaptér (váhy zůstanou sloučené)."""
+    import torch
+    from diffusers import StableDiffusionXLImg2ImgPipeline
+
+    pipe = StableDiffusionXLImg2ImgPipeline.from_pretrained(
+        BASE_MODEL,
+        torch_dtype=torch_dtype,
+        variant="fp16" if torch_dtype == torch.float16 else None,
+        use_safetensors=True,
+        low_cpu_mem_usage=True,
+    )
+    pipe.load_lora_weights(get_lora_weight_cache().get(lora_path))
+    pipe.fuse_lora(lora_scale=scale)
+    pipe.unload_lora_weights()
+    return pipe
+
+
+class LoraFusion:
+    """Počítá použití LoRA a slučuje ty nejpoužívanější do cache na disku."""
+
+    def __init__(self, cache, min_requests=FUSED_LORA_MIN_REQUESTS, window_s=FUSED_LORA_WINDOW_S):
+        self.cache = cache
+        self.min_requests = min_requests
+        self.window_s = window_s
+        # cesta LoRA -> časy požadavků v okně
+        self._uses = {}
+        # Úlohy na pozadí (výpočet klíče, sloučení) podle (cesta LoRA, dtype)
+        self._building = set()
+        # Identita base modelu z posledního výpočtu na pozadí
+        self._base_identity = None
+        self._lock = threading.Lock()
+        # Slučuje se po jedné LoRA - každé sloučení drží celý base model v RAM
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="lora-fusion")
+
+    def record(self, lora_path):
+        """Zaznamená požadavek a vrátí počet požadavků v okně."""
+        now = time.time()
+        with self._lock:
+            uses = self._uses.setdefault(os.path.abspath(lora_path), deque())
+            uses.append(now)
+            while uses and uses[0] < now - self.window_s:
+                uses.popleft()
+            return len(uses)
+
+    def known_key(self, lora_path, torch_dtype):
+        """Klíč bez čtení souborů, nebo None, pokud hash LoRA nebo identita base modelu ještě nejsou známé."""
+        digest = known_content_digest(lora_path)
+        base_identity = self._base_identity
+        if digest is None or base_identity is None:
+            return None
+        return format_fused_key(digest, base_identity, torch_dtype)
+
+    def resolve(self, lora_path, torch_dtype, notify=print):
+        """
+        Cesta ke sloučené pipeline pro LoRA, nebo None (generuje se s adaptérem).
+
+        Klíč se hledá jen podle už známých hashů; neznámý se spočítá na pozadí.
+        Hot LoRA bez sloučené položky se začne slučovat na pozadí.
+        """
+        uses = self.record(lora_path)
+        key = self.known_key(lora_path, torch_dtype)
+        path = self.cache.lookup(key) if key is not None else None
+        hot = uses >= self.min_requests
+        if path is not None or (key is not None and not hot):
+            return path
+        task_id = (os.path.abspath(lora_path), str(torch_dtype))
+        with self._lock:
+            if task_id in self._building:
+                return None
+            self._building.add(task_id)
+        if hot:
+            notify(f"🔥 LoRA {os.path.basename(lora_path)} je často používaná ({uses}× za {self.window_s / 60:.0f} min) - slučuji na pozadí")
+        # Požadavek mezitím skončí - z vlákna na pozadí se jen loguje
+        self._executor.submit(self._build, task_id, lora_path, torch_dtype, hot)
+        return None
+
+    def _build(self, task_id, lora_path, torch_dtype, hot, notify=print):
+        """Spočítá klíč (hash LoRA, identita base modelu) a u hot LoRA bez položky ji sloučí."""
+        try:
+            self._base_identity = base_model_identity()
+            key = format_fused_key(content_digest(lora_path), self._base_identity, torch_dtype)
+            if not hot or os.path.isdir(self.cache.entry_path(key)):
+                return
+            with span('lora_fuse'):
+                pipe = build_fused_pipeline(lora_path, torch_dtype)
+                self.cache.store(key, pipe, notify)
+            notify(f"✅ LoRA {os.path.basename(lora_path)} sloučena - další požadavky poběží bez adaptéru")
+        except Exception as e:
+            notify(f"⚠️ Sloučení LoRA {os.path.basename(lora_path)} selhalo: {e}")
+        finally:
+            with self._lock:
+                self._building.discard(task_id)
+
+    def stats(self):
+        with self._lock:
+            return {'tracked': len(self._uses), 'building': len(self._building)}
+
+
+_fusion = None
+_fusion_lock = threading.Lock()
+
+
+def get_lora_fusion() -> LoraFusion:
+    """Vrátí procesově sdílenou správu sloučených LoRA."""
+    global _fusion
+    with _fusion_lock:
+        if _fusion is None:
+            cache = ConvertedCache(
+                resolve_cache_root(FUSED_LORA_PATH, 'fused_loras'), int(FUSED_LORA_CACHE_GB * GB), name='fused_lora'
+            )
+            _fusion = LoraFusion(cache)
+        return _fusion
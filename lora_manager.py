@@ -0,0 +1,191 @@
+"""
+Správa LoRA adaptérů na rezidentní base pipeline
+
+Base SDXL pipeline zůstává načtená a LoRA se na ni pouze připojují a odpojují
+podle jména. Naparsované váhy adaptérů drží LRU cache v RAM, takže přepnutí
+mezi již použitými LoRA stojí jen výměnu adaptéru, ne čtení z disku.
+
+Novější diffusers (PEFT backend) umí více pojmenovaných adaptérů naráz
+(`set_adapters`, `delete_adapters`). Starší verze mají jediný slot - tam se
+adaptér vymění přes `unload_lora_weights` a načtení z cache v RAM.
+"""
+
+import hashlib
+import os
+import threading
+import weakref
+from collections import OrderedDict
+
+from safetensors.torch import load_file
+
+from tracing import count
+
+GB = 1024 ** 3
+
+LORA_CACHE_GB = float(os.getenv('LORA_CACHE_GB', '4'))
+LORA_MAX_ATTACHED = int(os.getenv('LORA_MAX_ATTACHED', '4'))
+
+
+def file_identity(path):
+    """Identita souboru pro invalidaci cache: (cesta, velikost, mtime)."""
+    stat = os.stat(path)
+    return (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+
+
+def adapter_name_for(path):
+    """Stabilní jméno adaptéru (PEFT nepovoluje tečky ve jménech modulů)."""
+    return "lora_" + hashlib.sha1(os.path.abspath(path).encode()).hexdigest()[:12]
+
+
+class LoraWeightCache:
+    """LRU cache naparsovaných LoRA state dictů v RAM, omezená velikostí."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, path):
+        """Vrátí state dict LoRA souboru (mělká kopie - diffusers slovník mění)."""
+        identity = file_identity(path)
+        with self._lock:
+            entry = self._entries.get(identity[0])
+            if entry is not None and entry['identity'] == identity:
+                self._entries.move_to_end(identity[0])
+                self.hits += 1
+                count('cache_hits_total', cache='lora_weights')
+                return dict(entry['state_dict'])
+            self.misses += 1
+            count('cache_misses_total', cache='lora_weights')
+
+        state_dict = load_file(path, device="cpu")
+        size_bytes = sum(t.numel() * t.element_size() for t in state_dict.values())
+        with self._lock:
+            self._entries[identity[0]] = {
+                'identity': identity,
+                'state_dict': state_dict,
+                'size_bytes': size_bytes,
+            }
+            self._entries.move_to_end(identity[0])
+            while len(self._entries) > 1 and self._total_bytes() > self.max_bytes:
+                self._entries.popitem(last=False)
+        return dict(state_dict)
+
+    def _total_bytes(self):
+        return sum(e['size_bytes'] for e in self._entries.values())
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'cached': len(self._entries),
+                'cached_gb': self._total_bytes() / GB,
+            }
+
+
+class LoraAdapterManager:
+    """Připojuje, aktivuje, deaktivuje a odpojuje LoRA adaptéry jedné pipeline."""
+
+    def __init__(self, pipe, weight_cache: LoraWeightCache, max_attached: int = LORA_MAX_ATTACHED):
+        # Slabý odkaz - správce je hodnotou WeakKeyDictionary klíčovaného pipeline,
+        # silný odkaz by pipeline (i s adaptéry) nikdy neuvolnil
+        self._pipe = weakref.ref(pipe)
+        self.weight_cache = weight_cache
+        self.multi_adapter = hasattr(pipe, "set_adapters") and hasattr(pipe, "delete_adapters")
+        self.max_attached = max_attached if self.multi_adapter else 1
+        # jméno adaptéru -> identita zdrojového souboru, v LRU pořadí
+        self.attached = OrderedDict()
+        self.active = None
+        self.swaps = 0
+
+    @property
+    def pipe(self):
+        return self._pipe()
+
+    def attach(self, name, path):
+        """Připojí adaptér ze souboru nebo adresáře (bez aktivace u multi-adapter backendu)."""
+        identity = file_identity(path) if os.path.isfile(path) else (os.path.abspath(path),)
+        if self.attached.get(name) == identity:
+            self.attached.move_to_end(name)
+            return
+        if name in self.attached:
+            # Soubor se změnil - starou verzi odpojíme
+            self.unload(name)
+
+        # Uvolnění místa pro nový adaptér
+        while len(self.attached) >= self.max_attached:
+            self.unload(next(iter(self.attached)))
+
+        source = self.weight_cache.get(path) if os.path.isfile(path) else path
+        if self.multi_adapter:
+            self.pipe.load_lora_weights(source, adapter_name=name)
+        else:
+            try:
+                self.pipe.load_lora_weights(source)
+            except Exception:
+                # Částečně načtené váhy nesmí zůstat v base pipeline
+                self.pipe.unload_lora_weights()
+                raise
+            self.active = name
+        self.attached[name] = identity
+        self.swaps += 1
+
+    def activate(self, name, path):
+        """Aktivuje adaptér, v případě potřeby ho nejdřív připojí."""
+        self.attach(name, path)
+        self.attached.move_to_end(name)
+        if self.multi_adapter and self.active != name:
+            self.pipe.set_adapters([name])
+            self.pipe.enable_lora()
+        self.active = name
+
+    def deactivate(self):
+        """Vypne LoRA, pipeline pak generuje jako čistý base model."""
+        if self.active is None:
+            return
+        if self.multi_adapter:
+            self.pipe.disable_lora()
+            self.active = None
+        else:
+            # Jediný slot nelze vypnout bez odpojení
+            self.unload(self.active)
+
+    def unload(self, name):
+        """Odpojí adaptér z pipeline."""
+        if name not in self.attached:
+            return
+        if self.multi_adapter:
+            self.pipe.delete_adapters(name)
+        else:
+            self.pipe.unload_lora_weights()
+        del self.attached[name]
+        if self.active == name:
+            self.active = None
+
+    def unload_all(self):
+        """Odpojí všechny adaptéry."""
+        for name in list(self.attached):
+            self.unload(name)
+
+
+_weight_cache = LoraWeightCache(int(LORA_CACHE_GB * GB))
+_managers = weakref.WeakKeyDictionary()
+_managers_lock = threading.Lock()
+
+
+def get_lora_weight_cache() -> LoraWeightCache:
+    """Vrátí procesově sdílenou cache LoRA vah."""
+    return _weight_cache
+
+
+def get_adapter_manager(pipe) -> LoraAdapterManager:
+    """Vrátí správce adaptérů pro danou pipeline (jeden na pipeline)."""
+    with _managers_lock:
+        manager = _managers.get(pipe)
+        if manager is None:
+            manager = LoraAdapterManager(pipe, _weight_cache)
+            _managers[pipe] = manager
+        return manager
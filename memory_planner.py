@@ -0,0 +1,187 @@
+"""
+Odhad paměti pro generování a výběr plánu provedení
+
+Heuristika vychází z měření SDXL img2img: aktivace UNetu rostou zhruba
+lineárně s počtem pixelů (s attention slicing / SDPA) a s počtem vzorků,
+classifier-free guidance zdvojnásobuje efektivní dávku UNetu.
+
+Pro každý požadavek se odhadne špička paměti (váhy modelu podle dtype,
+aktivace UNetu a VAE decoderu podle rozlišení a dávky, výstupy po upscalingu)
+a vybere se nejlevnější plán, který se vejde: celá dávka najednou, menší
+mikro-dávky, slicing, dlaždice a nakonec CPU offload. Co se nevejde ani
+s offloadem, se odmítne ještě před načtením modelu.
+"""
+
+import os
+
+import psutil
+import torch
+
+from config import ENABLE_ATTENTION_SLICING, ENABLE_CPU_OFFLOAD, TINY_PIPELINE
+from model_inspect import inspect_model
+from tiling import UNET_TILE_SIZE, VAE_TILE_SIZE, should_tile
+
+GB = 1024 ** 3
+
+# ~1.2 GB aktivací na jeden vzorek UNetu při 1024x1024 ve fp16
+UNET_ACTIVATION_ELEMENTS_PER_PIXEL = 600
+# ~3 GB aktivací VAE decoderu na obrázek 1024x1024 ve fp16
+VAE_DECODE_ELEMENTS_PER_PIXEL = 1400
+# Attention slicing zhruba polovina špičky aktivací UNetu
+ATTENTION_SLICING_FACTOR = 0.5
+# SDXL: UNet 2.6 mld., text encodery 0.8 mld., VAE 0.08 mld. parametrů
+SDXL_PARAMETERS = 3.5e9
+# Při CPU offloadu je na GPU nejvýše největší komponenta (UNet)
+UNET_WEIGHT_FRACTION = 0.75
+# Rezerva na fragmentaci alokátoru a dočasné buffery
+MEMORY_SAFETY_FACTOR = 0.8
+
+MAX_BATCH_SIZE = int(os.getenv('MAX_BATCH_SIZE', '8'))
+# Jak dlouho požadavek čeká ve frontě na uvolnění paměti, než se odmítne
+MEMORY_WAIT_S = float(os.getenv('MEMORY_WAIT_S', '30'))
+
+# Velikost prvku uloženého tenzoru podle dtype v hlavičce safetensors
+SAFETENSORS_DTYPE_BYTES = {'F64': 8, 'F32': 4, 'F16': 2, 'BF16': 2, 'I64': 8, 'I32': 4, 'I8': 1, 'U8': 1}
+
+# Plány od nejlevnějšího: (jméno, attention slicing, VAE slicing, dlaždice, CPU offload)
+EXECUTION_PLANS = (
+    ('resident', False, False, False, False),
+    ('micro_batch', False, False, False, False),
+    ('sliced', True, True, False, False),
+    ('tiled', True, True, True, False),
+    ('offload', True, True, True, True),
+)
+
+
+def element_size(torch_dtype):
+    return torch.tensor([], dtype=torch_dtype).element_size()
+
+
+def estimate_sample_bytes(width, height, torch_dtype, do_classifier_free_guidance=True):
+    """Odhad špičkové paměti aktivací na jeden generovaný vzorek."""
+    unet_batch = 2 if do_classifier_free_guidance else 1
+    return int(width * height * UNET_ACTIVATION_ELEMENTS_PER_PIXEL * element_size(torch_dtype) * unet_batch)
+
+
+def estimate_weight_bytes(model_path, model_type, torch_dtype):
+    """Velikost vah pipeline po načtení v `torch_dtype`."""
+    if TINY_PIPELINE:
+        return 0
+    size = element_size(torch_dtype)
+    if model_type == "lora":
+        # Base model + váhy adaptéru
+        lora_bytes = os.path.getsize(model_path) if os.path.isfile(model_path) else 0
+        return int(SDXL_PARAMETERS * size) + lora_bytes
+    if model_type == "fused_lora" or not os.path.isfile(model_path):
+        # Sloučená LoRA má velikost base modelu
+        return int(SDXL_PARAMETERS * size)
+    # Soubor se při načtení převede do cílového dtype - přepočet podle převažujícího dtype
+    dtypes = inspect_model(model_path).get('dtypes') or {}
+    stored = max(dtypes, key=dtypes.get) if dtypes else 'F16'
+    return int(os.path.getsize(model_path) * size / SAFETENSORS_DTYPE_BYTES.get(stored, 2))
+
+
+def estimate_output_bytes(width, height, num_images, upscale_factor=1):
+    """RGB výsledky v RAM - vygenerované a případně zvětšené."""
+    pixels = width * height * (1 + upscale_factor ** 2 if upscale_factor > 1 else 1)
+    return int(pixels * 3 * num_images)
+
+
+def available_memory_bytes(device):
+    """Paměť, kterou může generování ještě použít (po načtení vah)."""
+    if device == "cuda" and torch.cuda.is_available():
+        free, _total = torch.cuda.mem_get_info()
+        return int(free * MEMORY_SAFETY_FACTOR)
+    return int(psutil.virtual_memory().available * MEMORY_SAFETY_FACTOR)
+
+
+def capacity_bytes(device):
+    """Celková paměť zařízení - strop, pod který se požadavek musí vejít i na prázdném stroji."""
+    if device == "cuda" and torch.cuda.is_available():
+        return int(torch.cuda.get_device_properties(0).total_memory * MEMORY_SAFETY_FACTOR)
+    return int(psutil.virtual_memory().total * MEMORY_SAFETY_FACTOR)
+
+
+def activation_bytes(batch_size, width, height, torch_dtype, do_classifier_free_guidance, attention_slicing, vae_slicing, tiling):
+    """Špička aktivací - UNet a VAE decoder neběží současně, rozhoduje větší z nich."""
+    if tiling:
+        unet_size = (min(width, UNET_TILE_SIZE), min(height, UNET_TILE_SIZE))
+        vae_pixels = min(width, VAE_TILE_SIZE) * min(height, VAE_TILE_SIZE)
+    else:
+        unet_size = (width, height)
+        vae_pixels = width * height
+    unet = estimate_sample_bytes(*unet_size, torch_dtype, do_classifier_free_guidance) * batch_size
+    if attention_slicing:
+        unet *= ATTENTION_SLICING_FACTOR
+    vae = vae_pixels * VAE_DECODE_ELEMENTS_PER_PIXEL * element_size(torch_dtype) * (1 if vae_slicing else batch_size)
+    return int(max(unet, vae))
+
+
+def peak_bytes(batch_size, width, height, torch_dtype, device, weight_bytes, resident, do_classifier_free_guidance,
+               output_bytes, attention_slicing, vae_slicing, tiling, cpu_offload):
+    """Odhad špičky podle poolu ({'device', 'host'}); `resident` = váhy už jsou načtené."""
+    activations = activation_bytes(
+        batch_size, width, height, torch_dtype, do_classifier_free_guidance, attention_slicing, vae_slicing, tiling
+    )
+    weights = 0 if resident else weight_bytes
+    if device != "cuda":
+        return {'device': 0, 'host': weights + activations + output_bytes}
+    if cpu_offload:
+        # Komponenty se na GPU přesouvají po jedné, zbytek vah čeká v RAM
+        return {'device': int(weight_bytes * UNET_WEIGHT_FRACTION) + activations, 'host': weights + output_bytes}
+    return {'device': weights + activations, 'host': output_bytes}
+
+
+def candidate_plans(device):
+    """Plány povolené konfigurací (ENABLE_ATTENTION_SLICING, ENABLE_CPU_OFFLOAD: auto/true/false)."""
+    slicing = ENABLE_ATTENTION_SLICING.lower()
+    offload = ENABLE_CPU_OFFLOAD.lower()
+    for name, attention_slicing, vae_slicing, tiling, cpu_offload in EXECUTION_PLANS:
+        # Offload má smysl jen z GPU do RAM
+        if cpu_offload and (device != "cuda" or offload == 'false'):
+            continue
+        if not cpu_offload and device == "cuda" and offload == 'true':
+            continue
+        if slicing in ('true', 'false'):
+            attention_slicing = vae_slicing = slicing == 'true'
+        yield name, attention_slicing, vae_slicing, tiling, cpu_offload
+
+
+def plan_execution(num_images, width, height, torch_dtype, device, weight_bytes, budgets,
+                   resident_modes=(), do_classifier_free_guidance=True, output_bytes=0):
+    """
+    Nejlevnější plán, jehož odhad špičky se vejde do `budgets` ({'device', 'host'} v bajtech).
+
+    `resident_modes` jsou hodnoty CPU offloadu, se kterými už je pipeline
+    načtená (její váhy se nepočítají znovu). Vrací slovník plánu, nebo None.
+    """
+    max_batch = max(1, min(num_images, MAX_BATCH_SIZE))
+    for name, attention_slicing, vae_slicing, tiling, cpu_offload in candidate_plans(device):
+        # Velké vstupy běží po dlaždicích vždy (TILING_MIN_PIXELS)
+        tiling = tiling or should_tile(width, height)
+        # "resident" = celá dávka najednou, ostatní plány hledají největší mikro-dávku
+        batch_sizes = [max_batch] if name == 'resident' else range(max_batch, 0, -1)
+        for batch_size in batch_sizes:
+            peak = peak_bytes(
+                batch_size, width, height, torch_dtype, device, weight_bytes, cpu_offload in resident_modes,
+                do_classifier_free_guidance, output_bytes, attention_slicing, vae_slicing, tiling, cpu_offload
+            )
+            if all(peak[pool] <= budgets.get(pool, 0) for pool in peak if peak[pool]):
+                return {
+                    'name': name,
+                    'batch_size': batch_size,
+                    'attention_slicing': attention_slicing,
+                    'vae_slicing': vae_slicing,
+                    'tiling': tiling,
+                    'cpu_offload': cpu_offload,
+                    'peak_bytes': peak,
+                }
+    return None
+
+
+def describe_plan(plan):
+    """Krátký popis plánu pro log a UI."""
+    peak = plan['peak_bytes']
+    options = [option for option in ('attention_slicing', 'vae_slicing', 'tiling', 'cpu_offload') if plan[option]]
+    return (f"{plan['name']} (dávka {plan['batch_size']}, {', '.join(options) or 'bez omezení'}; "
+            f"odhad GPU {peak['device'] / GB:.1f} GB, RAM {peak['host'] / GB:.1f} GB)")
@@ -0,0 +1,342 @@
+"""
+Persistentní katalog modelů (SQLite) s inkrementálním skenováním
+
+Místo `os.walk` přes všechny kandidátní složky při každém rerunu se katalog
+udržuje v SQLite databázi v adresáři cache. Adresář se znovu vylistuje
+jen tehdy, když se změnil jeho mtime (přidání, smazání nebo přejmenování
+souboru), jinak se použijí uložené řádky. Velikost a mtime (`stat`) se při
+každé obnově ověří jen u nepřečtených a nedávno zapsaných souborů (skenovaných
+ještě během zápisu), u ostatních jednou za CATALOG_RESTAT_INTERVAL - soubor
+přepsaný na místě se tak prozkoumá znovu nejpozději po tomto intervalu. Pro každý soubor se ukládá velikost, typ
+modelu, rank LoRA, základní architektura a metadata z hlavičky.
+
+Soubor, jehož hlavičku nešlo přečíst, se v katalogu zobrazí jako 'unknown'
+bez mtime - další obnova ho zkusí přečíst znovu.
+
+Volitelný watcher ve vlákně na pozadí katalog periodicky obnovuje, takže
+nově nahrané soubory se v selektorech objeví do několika sekund.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing
+
+from config import resolve_cache_dir, resolve_model_dirs
+from model_inspect import inspect_model
+from tracing import traced
+
+CATALOG_WATCH = os.getenv('CATALOG_WATCH', 'true').lower() == 'true'
+CATALOG_WATCH_INTERVAL = float(os.getenv('CATALOG_WATCH_INTERVAL', '3'))
+# Jak často se ověří i soubory, které se dlouho neměnily (s); nedávno zapsané při každé obnově
+CATALOG_RESTAT_INTERVAL = float(os.getenv('CATALOG_RESTAT_INTERVAL', '300'))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS catalog_dirs (
+    kind TEXT, path TEXT, root TEXT, mtime_ns INTEGER, subdirs TEXT,
+    PRIMARY KEY (kind, path)
+);
+CREATE TABLE IF NOT EXISTS catalog_files (
+    kind TEXT, path TEXT, root TEXT, dir TEXT, name TEXT,
+    size INTEGER, mtime_ns INTEGER, model_type TEXT, lora_rank INTEGER,
+    base_arch TEXT, metadata TEXT,
+    PRIMARY KEY (kind, path)
+);
+CREATE INDEX IF NOT EXISTS catalog_files_dir ON catalog_files (kind, dir);
+"""
+
+
+def detect_runpod_paths():
+    """Detekuje dostupné RunPod cesty pro modely."""
+    possible_paths = {
+        'workspace_loras': '/workspace/loras',
+        'workspace_models': '/workspace/models', 
+        'data_loras': '/data/loras',
+        'data_models': '/data/models',
+        'runpod_volume_loras': '/runpod-volume/loras',
+        'runpod_volume_models': '/runpod-volume/models',
+        'content_loras': '/content/loras',  # Colab style
+        'content_models': '/content/models'
+    }
+    
+    available_paths = []
+    for name, path in possible_paths.items():
+        if os.path.exists(path):
+            available_paths.append(path)
+    
+    return available_paths
+
+
+def get_catalog_roots():
+    """Kořenové složky katalogu jako (cesta, role) v pořadí priority."""
+    lora_models_path, full_models_path = resolve_model_dirs()
+    runpod_paths = detect_runpod_paths()
+    # Složka LoRA (např. ./lora_models) nesmí být kořenem full modelů
+    roots = [(path, 'lora') for path in [lora_models_path] + runpod_paths if 'lora' in path.lower()]
+    roots += [(path, 'full') for path in [full_models_path] + runpod_paths if 'model' in path.lower()]
+    return roots
+
+
+def display_name(root, file_path):
+    """Název pro zobrazení ve formátu <složka zdroje>/<relativní cesta>."""
+    return f"{os.path.basename(root)}/{os.path.relpath(file_path, root)}"
+
+
+class ModelCatalog:
+    """Katalog .safetensors souborů pro role 'lora' a 'full'."""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.roots = []
+        self._scan_lock = threading.Lock()
+        self._watcher = None
+        self.last_refresh = 0.0
+        self._last_full_restat = 0.0
+        with closing(self._connect()) as conn, conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def set_roots(self, roots):
+        """Nastaví kořenové složky jako seznam (cesta, role) v pořadí priority."""
+        self.roots = list(dict.fromkeys(roots))
+
+    # --- skenování ---------------------------------------------------------
+
+    @traced('model_discovery')
+    def refresh(self):
+        """Inkrementálně obnoví katalog - listuje jen změněné adresáře."""
+        with self._scan_lock, closing(self._connect()) as conn, conn:
+            now = time.time()
+            full_restat = now - self._last_full_restat >= CATALOG_RESTAT_INTERVAL
+            # Na řádky zapsané před tímto okamžikem stačí pomalý průchod
+            restat_since = None if full_restat else int((now - CATALOG_RESTAT_INTERVAL) * 1e9)
+            for root, kind in self.roots:
+                if os.path.isdir(root):
+                    self._scan_dir(conn, kind, root, root, restat_since)
+                else:
+                    self._forget_subtree(conn, kind, root)
+            if full_restat:
+                self._last_full_restat = now
+            self.last_refresh = time.time()
+
+    def rebuild(self):
+        """Zahodí uložený stav adresářů a projde vše znovu."""
+        with closing(self._connect()) as conn, conn:
+            conn.execute("DELETE FROM catalog_dirs")
+        self.refresh()
+
+    def _scan_dir(self, conn, kind, root, dir_path, restat_since=None):
+        try:
+            dir_mtime = os.stat(dir_path).st_mtime_ns
+        except OSError:
+            self._forget_subtree(conn, kind, dir_path)
+            return
+
+        row = conn.execute(
+            "SELECT mtime_ns, subdirs FROM catalog_dirs WHERE kind = ? AND path = ?",
+            (kind, dir_path)
+        ).fetchone()
+
+        if row is not None and row[0] == dir_mtime:
+            subdirs = json.loads(row[1])
+            self._restat_files(conn, kind, root, dir_path, restat_since)
+        else:
+            subdirs = self._list_dir(conn, kind, root, dir_path)
+            if subdirs is None:
+                return
+            conn.execute(
+                "INSERT OR REPLACE INTO catalog_dirs (kind, path, root, mtime_ns, subdirs) VALUES (?, ?, ?, ?, ?)",
+                (kind, dir_path, root, dir_mtime, json.dumps(subdirs))
+            )
+
+        for subdir in subdirs:
+            self._scan_dir(conn, kind, root, subdir, restat_since)
+
+    def _list_dir(self, conn, kind, root, dir_path):
+        """Vylistuje změněný adresář a srovná soubory s databází."""
+        known = {
+            path: (size, mtime_ns)
+            for path, size, mtime_ns in conn.execute(
+                "SELECT path, size, mtime_ns FROM catalog_files WHERE kind = ? AND dir = ?",
+                (kind, dir_path)
+            )
+        }
+        subdirs = []
+        present = set()
+        try:
+            with os.scandir(dir_path) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.path)
+                    elif entry.name.endswith('.safetensors'):
+                        stat = entry.stat()
+                        present.add(entry.path)
+                        if known.get(entry.path) != (stat.st_size, stat.st_mtime_ns):
+                            self._store_file(conn, kind, root, dir_path, entry.path, stat, known.get(entry.path))
+        except PermissionError:
+            return None
+
+        for path in set(known) - present:
+            conn.execute("DELETE FROM catalog_files WHERE kind = ? AND path = ?", (kind, path))
+
+        # Zmizelé podadresáře
+        previous = conn.execute(
+            "SELECT subdirs FROM catalog_dirs WHERE kind = ? AND path = ?", (kind, dir_path)
+        ).fetchone()
+        if previous is not None:
+            for subdir in set(json.loads(previous[0])) - set(subdirs):
+                self._forget_subtree(conn, kind, subdir)
+
+        return sorted(subdirs)
+
+    def _restat_files(self, conn, kind, root, dir_path, restat_since=None):
+        """
+        Soubory nezměněného adresáře - přepsané na místě nebo dosud nepřečtené
+        prozkoumá znovu. S `restat_since` (ns) jen nepřečtené a zapsané od té doby.
+        """
+        query = "SELECT path, size, mtime_ns FROM catalog_files WHERE kind = ? AND dir = ?"
+        params = [kind, dir_path]
+        if restat_since is not None:
+            query += " AND (mtime_ns IS NULL OR mtime_ns >= ?)"
+            params.append(restat_since)
+        known = conn.execute(query, params).fetchall()
+        for path, size, mtime_ns in known:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                conn.execute("DELETE FROM catalog_files WHERE kind = ? AND path = ?", (kind, path))
+                continue
+            if (size, mtime_ns) != (stat.st_size, stat.st_mtime_ns):
+                self._store_file(conn, kind, root, dir_path, path, stat, (size, mtime_ns))
+
+    def _store_file(self, conn, kind, root, dir_path, file_path, stat, previous=None):
+        mtime_ns = stat.st_mtime_ns
+        try:
+            info = inspect_model(file_path)
+        except Exception as e:
+            # Opakované selhání (soubor se stále zapisuje, poškozený soubor) se nehlásí znovu
+            if previous is None or previous[1] is not None:
+                print(f"⚠️ Nelze přečíst hlavičku {file_path}: {e}")
+            info = {'model_type': 'unknown', 'lora_rank': None, 'base_arch': None, 'metadata': {}}
+            # Bez mtime se řádek při další obnově nebude shodovat a hlavička se zkusí přečíst znovu
+            mtime_ns = None
+        conn.execute(
+            "INSERT OR REPLACE INTO catalog_files "
+            "(kind, path, root, dir, name, size, mtime_ns, model_type, lora_rank, base_arch, metadata) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (kind, file_path, root, dir_path, display_name(root, file_path), stat.st_size,
+             mtime_ns, info['model_type'], info['lora_rank'], info['base_arch'],
+             json.dumps(info['metadata']))
+        )
+
+    def _forget_subtree(self, conn, kind, dir_path):
+        # Prefixové porovnání místo LIKE - cesty mohou obsahovat '_' a '%'
+        prefix = dir_path.rstrip('/') + '/'
+        conn.execute("DELETE FROM catalog_files WHERE kind = ? AND (dir = ? OR substr(dir, 1, ?) = ?)",
+                     (kind, dir_path, len(prefix), prefix))
+        conn.execute("DELETE FROM catalog_dirs WHERE kind = ? AND (path = ? OR substr(path, 1, ?) = ?)",
+                     (kind, dir_path, len(prefix), prefix))
+
+    # --- watcher -----------------------------------------------------------
+
+    def start_watcher(self, interval=CATALOG_WATCH_INTERVAL):
+        """Spustí vlákno, které katalog periodicky obnovuje (idempotentní)."""
+        if self._watcher is not None and self._watcher.is_alive():
+            return
+
+        def watch():
+            while True:
+                try:
+                    self.refresh()
+                except Exception as e:
+                    print(f"⚠️ Chyba při obnově katalogu modelů: {e}")
+                time.sleep(interval)
+
+        self._watcher = threading.Thread(target=watch, name="model-catalog-watcher", daemon=True)
+        self._watcher.start()
+
+    def refresh_if_stale(self, max_age=CATALOG_WATCH_INTERVAL):
+        """Obnoví katalog, pokud neběží watcher a poslední obnova je starší než max_age."""
+        if self._watcher is not None and self._watcher.is_alive() and self.last_refresh:
+            return
+        if time.time() - self.last_refresh >= max_age:
+            self.refresh()
+
+    # --- dotazy ------------------------------------------------------------
+
+    def list_models(self, kind, search=None, base_arch=None, lora_rank=None):
+        """
+        Vrátí modely dané role s volitelným filtrem podle názvu, architektury a ranku.
+
+        Každá položka má klíče `name`, `path`, `size_mb`, `source`, `model_type`,
+        `lora_rank` a `base_arch`; seřazeno podle názvu.
+        """
+        query = ("SELECT name, path, size, root, model_type, lora_rank, base_arch "
+                 "FROM catalog_files WHERE kind = ?")
+        params = [kind]
+        if search:
+            query += " AND name LIKE ?"
+            params.append(f"%{search}%")
+        if base_arch:
+            query += " AND base_arch = ?"
+            params.append(base_arch)
+        if lora_rank:
+            query += " AND lora_rank = ?"
+            params.append(lora_rank)
+
+        # Soubor dosažitelný z více kořenů zobrazíme jen jednou (dle priority kořenů)
+        priority = {root: i for i, (root, root_kind) in enumerate(self.roots) if root_kind == kind}
+        rows = {}
+        with closing(self._connect()) as conn:
+            for row in conn.execute(query, params):
+                name, path, size, root, model_type, rank, arch = row
+                if root not in priority:
+                    continue
+                if path in rows and priority[rows[path]['source']] <= priority[root]:
+                    continue
+                rows[path] = {
+                    'name': name,
+                    'path': path,
+                    'size_mb': size / (1024 * 1024),
+                    'source': root,
+                    'model_type': model_type,
+                    'lora_rank': rank,
+                    'base_arch': arch,
+                }
+        return sorted(rows.values(), key=lambda x: x['name'])
+
+    def facets(self, kind):
+        """Dostupné hodnoty filtrů (architektury a ranky) pro danou roli."""
+        with closing(self._connect()) as conn:
+            arches = [r[0] for r in conn.execute(
+                "SELECT DISTINCT base_arch FROM catalog_files WHERE kind = ? AND base_arch IS NOT NULL "
+                "ORDER BY base_arch", (kind,))]
+            ranks = [r[0] for r in conn.execute(
+                "SELECT DISTINCT lora_rank FROM catalog_files WHERE kind = ? AND lora_rank IS NOT NULL "
+                "ORDER BY lora_rank", (kind,))]
+        return {'base_arch': arches, 'lora_rank': ranks}
+
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+
+def get_model_catalog(roots=None) -> ModelCatalog:
+    """
+    Vrátí procesově sdílený katalog; při prvním volání (a CATALOG_WATCH=true)
+    spustí watcher. `roots` je seznam (cesta, role) a při změně se aktualizuje.
+    """
+    global _catalog
+    with _catalog_lock:
+        if _catalog is None:
+            _catalog = ModelCatalog(os.path.join(resolve_cache_dir(), 'model_catalog.sqlite'))
+        if roots is not None and list(dict.fromkeys(roots)) != _catalog.roots:
+            _catalog.set_roots(roots)
+            _catalog.last_refresh = 0.0
+    if CATALOG_WATCH:
+        _catalog.start_watcher()
+    return _catalog
@@ -0,0 +1,255 @@
+"""
+Inspekce safetensors souborů čtením pouze JSON hlavičky
+
+Safetensors soubor začíná 8 bajty (délka hlavičky, little-endian u64) a JSON
+hlavičkou s názvy, dtype a tvary tenzorů a volitelnými `__metadata__`. Pro
+klasifikaci modelu tak stačí přečíst několik kB místo celého 7 GB checkpointu.
+
+Výsledek klasifikace se ukládá do SQLite cache klíčované (cesta, velikost,
+mtime), takže opakovaná klasifikace stojí jen jeden `stat`.
+"""
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import struct
+import threading
+from collections import Counter
+from contextlib import closing
+
+from config import resolve_cache_dir
+
+# Hlavička větší než 100 MB znamená poškozený nebo jiný soubor
+MAX_HEADER_BYTES = 100 * 1024 * 1024
+GB = 1024 ** 3
+
+LORA_KEY_MARKERS = ('lora_unet', 'lora_te', 'lora_down', 'lora_up', 'lora_A', 'lora_B', 'lora.down', 'lora.up')
+FULL_MODEL_KEY_MARKERS = ('model.diffusion_model', 'first_stage_model', 'cond_stage_model', 'conditioner.embedders')
+# Hash obsahu se čte po blocích; jméno souboru v úložišti nahraných modelů je hash
+DIGEST_CHUNK_BYTES = 8 * 1024 * 1024
+SHA256_PATTERN = re.compile(r'[0-9a-f]{64}')
+
+
+def read_safetensors_header(file_path):
+    """
+    Přečte hlavičku safetensors souboru bez načtení tenzorů.
+
+    Vrací slovník `{'tensors': {název: {'dtype', 'shape', 'data_offsets'}},
+    'metadata': {...}, 'data_start': ...}` - offsety tenzorů jsou relativní
+    k `data_start` (začátek dat za hlavičkou).
+    """
+    with open(file_path, 'rb') as f:
+        prefix = f.read(8)
+        if len(prefix) != 8:
+            raise ValueError("Soubor je příliš krátký pro safetensors")
+        header_size = struct.unpack('<Q', prefix)[0]
+        if header_size > MAX_HEADER_BYTES:
+            raise ValueError(f"Neplatná délka hlavičky: {header_size}")
+        header = json.loads(f.read(header_size))
+
+    metadata = header.pop('__metadata__', None) or {}
+    tensors = {
+        name: {'dtype': info.get('dtype'), 'shape': info.get('shape', []), 'data_offsets': info.get('data_offsets')}
+        for name, info in header.items()
+    }
+    return {'tensors': tensors, 'metadata': metadata, 'data_start': 8 + header_size}
+
+
+def _lora_rank(tensors, metadata):
+    """Určí rank LoRA z tvarů down/A matic (nejčastější hodnota)."""
+    ranks = Counter()
+    for name, info in tensors.items():
+        if ('lora_down' in name or 'lora_A' in name or 'lora.down' in name) and info['shape']:
+            ranks[info['shape'][0]] += 1
+    if ranks:
+        return ranks.most_common(1)[0][0]
+    network_dim = metadata.get('ss_network_dim')
+    try:
+        return int(network_dim) if network_dim is not None else None
+    except ValueError:
+        return None
+
+
+def _base_architecture(tensors, metadata):
+    """Odhadne základní architekturu (sdxl, sdxl_refiner, sd2, sd1)."""
+    base_version = str(metadata.get('ss_base_model_version', '')).lower()
+    if base_version.startswith('sdxl'):
+        return 'sdxl_refiner' if 'refiner' in base_version else 'sdxl'
+
+    keys = tensors.keys()
+    # Full checkpointy
+    if any(k.startswith('conditioner.embedders.1') for k in keys):
+        return 'sdxl'
+    if any(k.startswith('conditioner.embedders.0.model') for k in keys):
+        return 'sdxl_refiner'
+    if any(k.startswith('cond_stage_model.model') for k in keys):
+        return 'sd2'
+    if any(k.startswith('cond_stage_model.transformer') for k in keys):
+        return 'sd1'
+
+    # LoRA - SDXL má dva text encodery a jiné bloky UNetu
+    if any(k.startswith(('lora_te1_', 'lora_te2_')) or 'text_encoder_2' in k for k in keys):
+        return 'sdxl'
+    if any('input_blocks_4_1_transformer_blocks_1' in k or 'down_blocks.2.attentions.0.transformer_blocks.1' in k
+           for k in keys):
+        return 'sdxl'
+    for name, info in tensors.items():
+        if name.startswith('lora_te_') and 'lora_down' in name and len(info['shape']) == 2:
+            # Šířka text encoderu: 768 = SD 1.x, 1024 = SD 2.x
+            return 'sd2' if info['shape'][1] == 1024 else 'sd1'
+    if any(k.startswith('lora_unet_') or k.startswith('unet.') for k in keys):
+        return 'sd1'
+    return None
+
+
+def classify_header(header, file_size):
+    """Klasifikuje model z hlavičky: typ, rank LoRA a základní architekturu."""
+    tensors = header['tensors']
+    metadata = header['metadata']
+    size_gb = file_size / GB
+
+    # LoRA modely obsahují specifické klíče (samotné "alpha" nestačí - full
+    # checkpointy mají alphas_cumprod)
+    has_lora_keys = any(
+        any(marker in key for marker in LORA_KEY_MARKERS) or key.endswith('.alpha')
+        for key in tensors
+    )
+    # Full modely obsahují kompletní váhy UNetu, VAE a text encoderu
+    has_full_keys = any(any(marker in key for marker in FULL_MODEL_KEY_MARKERS) for key in tensors)
+
+    if has_lora_keys:
+        model_type = "lora"
+    elif has_full_keys:
+        model_type = "full_model"
+    else:
+        # Pokud nejsme si jisti, zkusíme podle velikosti (LoRA bývají < 1 GB)
+        model_type = "lora" if size_gb < 1.0 else "full_model"
+
+    return {
+        'model_type': model_type,
+        'lora_rank': _lora_rank(tensors, metadata) if model_type == "lora" else None,
+        # LoRA s vahami text encoderu mění podmínění promptu
+        'lora_text_encoder': model_type == "lora" and any(
+            'lora_te' in key or 'text_encoder' in key for key in tensors
+        ),
+        'base_arch': _base_architecture(tensors, metadata),
+        'tensor_count': len(tensors),
+        'dtypes': dict(Counter(info['dtype'] for info in tensors.values())),
+        'metadata': metadata,
+    }
+
+
+class InspectionCache:
+    """Persistentní cache klasifikací klíčovaná (cesta, velikost, mtime)."""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._memory = {}
+        self._lock = threading.Lock()
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS inspections ("
+                "path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, result TEXT)"
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def get(self, path, size, mtime_ns):
+        with self._lock:
+            cached = self._memory.get(path)
+        if cached is not None and cached[0] == size and cached[1] == mtime_ns:
+            return cached[2]
+
+        with closing(self._connect()) as conn, conn:
+            row = conn.execute(
+                "SELECT result FROM inspections WHERE path = ? AND size = ? AND mtime_ns = ?",
+                (path, size, mtime_ns)
+            ).fetchone()
+        if row is None:
+            return None
+        result = json.loads(row[0])
+        with self._lock:
+            self._memory[path] = (size, mtime_ns, result)
+        return result
+
+    def put(self, path, size, mtime_ns, result):
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO inspections (path, size, mtime_ns, result) VALUES (?, ?, ?, ?)",
+                (path, size, mtime_ns, json.dumps(result))
+            )
+        with self._lock:
+            self._memory[path] = (size, mtime_ns, result)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_inspection_cache() -> InspectionCache:
+    """Vrátí procesově sdílenou cache inspekcí."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = InspectionCache(os.path.join(resolve_cache_dir(), 'model_inspect.sqlite'))
+        return _cache
+
+
+def inspect_model(file_path):
+    """
+    Klasifikuje safetensors soubor z hlavičky, s cache podle (cesta, velikost, mtime).
+
+    Vrací slovník s klíči `model_type`, `lora_rank`, `base_arch`, `tensor_count`,
+    `dtypes`, `metadata` a `size_bytes`.
+    """
+    path = os.path.abspath(file_path)
+    stat = os.stat(path)
+    cache = get_inspection_cache()
+    result = cache.get(path, stat.st_size, stat.st_mtime_ns)
+    if result is None:
+        result = classify_header(read_safetensors_header(path), stat.st_size)
+        result['size_bytes'] = stat.st_size
+        cache.put(path, stat.st_size, stat.st_mtime_ns, result)
+    return result
+
+
+def known_content_digest(file_path):
+    """
+    SHA-256 obsahu, pokud je už známý - bez čtení souboru, jen `stat` a cache
+    inspekcí klíčovaná (cesta, velikost, mtime). Jinak None.
+    """
+    path = os.path.abspath(file_path)
+    stem = os.path.splitext(os.path.basename(path))[0]
+    if SHA256_PATTERN.fullmatch(stem) and os.path.basename(os.path.dirname(os.path.dirname(path))) == 'sha256':
+        # Úložiště nahraných modelů (`sha256/<ab>/<hash>.safetensors`) má hash ve jméně
+        return stem
+    return inspect_model(path).get('sha256')
+
+
+def content_digest(file_path):
+    """
+    SHA-256 obsahu souboru - spočítá se jednou a uloží k výsledku inspekce.
+
+    Soubory z úložiště nahraných modelů mají hash už ve jméně a nečtou se.
+    """
+    path = os.path.abspath(file_path)
+    digest = known_content_digest(path)
+    if digest is not None:
+        return digest
+
+    result = inspect_model(path)
+    stat = os.stat(path)
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(DIGEST_CHUNK_BYTES), b''):
+            sha256.update(chunk)
+    digest = sha256.hexdigest()
+
+    # Soubor změněný během čtení (kopírování) se neuloží - hash by patřil jiné verzi
+    after = os.stat(path)
+    if (after.st_size, after.st_mtime_ns) == (stat.st_size, stat.st_mtime_ns):
+        get_inspection_cache().put(path, stat.st_size, stat.st_mtime_ns, dict(result, sha256=digest))
+    return digest
@@ -0,0 +1,86 @@
+"""
+Obsahově adresované úložiště nahraných modelů
+
+Nahraný soubor se zapíše jednou, po blocích, do dočasného souboru a během
+zápisu se počítá jeho SHA-256. Výsledná cesta je odvozená z hashe
+(`<UPLOADED_MODELS_PATH>/sha256/<ab>/<hash>.safetensors`), takže stejný model
+nahraný vícekrát (i pod jiným jménem) leží na disku jen jednou. Cesta je
+stabilní, takže na ni navazují cache pipeline i podmínění.
+"""
+
+import hashlib
+import os
+import tempfile
+import threading
+
+from config import UPLOADED_MODELS_PATH
+
+MODEL_STORE_CHUNK_MB = int(os.getenv('MODEL_STORE_CHUNK_MB', '8'))
+
+
+class ModelStore:
+    """Úložiště souborů modelů pojmenovaných podle SHA-256 obsahu."""
+
+    def __init__(self, root, chunk_size=MODEL_STORE_CHUNK_MB * 1024 * 1024):
+        self.root = root
+        self.chunk_size = chunk_size
+        self.stats = {'stored': 0, 'deduplicated': 0, 'bytes_written': 0}
+
+    def path_for(self, digest):
+        return os.path.join(self.root, 'sha256', digest[:2], f"{digest}.safetensors")
+
+    def put_stream(self, stream):
+        """
+        Uloží obsah streamu (objekt s `read(n)`) a vrátí (cesta, hash, nový).
+        Stejný obsah vrátí existující cestu a dočasný soubor zahodí.
+        """
+        tmp_dir = os.path.join(self.root, 'tmp')
+        os.makedirs(tmp_dir, exist_ok=True)
+        sha256 = hashlib.sha256()
+        written = 0
+        fd, tmp_path = tempfile.mkstemp(dir=tmp_dir, suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                while True:
+                    chunk = stream.read(self.chunk_size)
+                    if not chunk:
+                        break
+                    sha256.update(chunk)
+                    f.write(chunk)
+                    written += len(chunk)
+                f.flush()
+                os.fsync(f.fileno())
+
+            digest = sha256.hexdigest()
+            path = self.path_for(digest)
+            if os.path.isfile(path):
+                os.remove(tmp_path)
+                self.stats['deduplicated'] += 1
+                return path, digest, False
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self.stats['stored'] += 1
+        self.stats['bytes_written'] += written
+        return path, digest, True
+
+    def put_upload(self, uploaded_file):
+        """Uloží soubor ze `st.file_uploader` bez kopie celého bufferu."""
+        uploaded_file.seek(0)
+        return self.put_stream(uploaded_file)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_model_store() -> ModelStore:
+    """Vrátí procesově sdílené úložiště nahraných modelů."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ModelStore(UPLOADED_MODELS_PATH)
+        return _store
@@ -0,0 +1,265 @@
+"""
+Rezidentní registr načtených pipeline
+
+Pipeline žijí v paměti procesu (mimo rerun Streamlit skriptu), takže opakovaný
+požadavek na stejný model přeskočí načítání úplně. Při překročení paměťového
+rozpočtu (GPU nebo RAM) se uvolňují nejdéle nepoužité pipeline (LRU).
+
+Komponenty sdílené více pipeline (component_sharing.py) se do obsazení poolu
+počítají jednou a uvolnění pipeline uvolní jen komponenty, které nikdo jiný
+nepoužívá.
+"""
+
+import gc
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import torch
+
+from config import PIPELINE_CACHE_DEVICE_GB, PIPELINE_CACHE_HOST_GB
+from tracing import count
+
+GB = 1024 ** 3
+
+
+def estimate_component_bytes(pipe):
+    """Paměť jednotlivých komponent pipeline: {id(modul): bajty parametrů a bufferů}."""
+    sizes = {}
+    for component in pipe.components.values():
+        if not isinstance(component, torch.nn.Module) or id(component) in sizes:
+            continue
+        seen = set()
+        total = 0
+        for tensor in list(component.parameters()) + list(component.buffers()):
+            # Sdílené tenzory (tied weights) započítáme jen jednou
+            if tensor.data_ptr() in seen:
+                continue
+            seen.add(tensor.data_ptr())
+            total += tensor.numel() * tensor.element_size()
+        sizes[id(component)] = total
+    return sizes
+
+
+class PipelineRegistry:
+    """LRU registr pipeline klíčovaný (model_path, model_type, dtype, device)."""
+
+    def __init__(self, host_budget_bytes: int, device_budget_bytes: int):
+        self.budgets = {'host': host_budget_bytes, 'device': device_budget_bytes}
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+        self._load_locks = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(model_path, model_type, torch_dtype, device, cpu_offload=False):
+        """Sestaví klíč registru (pipeline s CPU offloadem je samostatná položka)."""
+        return (str(model_path), model_type, str(torch_dtype), f"{device}+offload" if cpu_offload else str(device))
+
+    def is_resident(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def reclaimable_bytes(self, pool, keep=()):
+        """Paměť poolu, kterou lze hned uvolnit (nepoužívané a nepřipnuté pipeline mimo `keep`)."""
+        with self._lock:
+            victims = [
+                k for k, e in self._entries.items()
+                if e['pool'] == pool and e['leases'] == 0 and not e['pinned'] and k not in keep
+            ]
+            kept = self._pool_components(pool, exclude=victims)
+            freed = {}
+            for k in victims:
+                freed.update(self._entries[k]['components'])
+            return sum(size for component, size in freed.items() if component not in kept)
+
+    def make_room(self, pool, needed_bytes, keep=()):
+        """Uvolní nejdéle nepoužité pipeline z poolu, dokud neuvolní `needed_bytes`."""
+        freed = 0
+        with self._lock:
+            for k, e in list(self._entries.items()):
+                if freed >= needed_bytes:
+                    break
+                if e['pool'] != pool or e['leases'] or e['pinned'] or k in keep:
+                    continue
+                freed += self._exclusive_bytes(k)
+                del self._entries[k]
+                self.evictions += 1
+                count('cache_evictions_total', cache='pipelines')
+                print(f"♻️ Uvolňuji pipeline z paměti pro nový požadavek: {k[0]} ({k[1]})")
+        if freed:
+            gc.collect()
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+        return freed
+
+    @contextmanager
+    def lease(self, key, loader, memory_pool='host', pinned=False):
+        """
+        Zapůjčí pipeline pro jedno generování.
+
+        Při miss zavolá `loader()`, který vrátí připravenou pipeline. Po dobu
+        zápůjčky má volající pipeline exkluzivně a nemůže být uvolněna.
+        Pipeline s `pinned=True` (base model pro LoRA) se z LRU nikdy neuvolňuje;
+        připnutá je nejvýše jedna na (model, dtype, zařízení) bez ohledu na offload.
+        """
+        entry = self._acquire(key, loader, memory_pool, pinned)
+        entry['lock'].acquire()
+        try:
+            yield entry['pipe']
+        finally:
+            # Velikost se mohla změnit (připojené LoRA, uvolněné text encodery)
+            entry['components'] = estimate_component_bytes(entry['pipe'])
+            entry['size_bytes'] = sum(entry['components'].values())
+            entry['lock'].release()
+            with self._lock:
+                entry['leases'] -= 1
+                self._evict(entry['pool'])
+
+    def _acquire(self, key, loader, memory_pool, pinned):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                entry['leases'] += 1
+                self.hits += 1
+                count('cache_hits_total', cache='pipelines')
+                return entry
+            load_lock = self._load_locks.setdefault(key, threading.Lock())
+
+        # Načítání probíhá mimo hlavní zámek, aby nebrzdilo ostatní modely
+        with load_lock:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._entries.move_to_end(key)
+                    entry['leases'] += 1
+                    self.hits += 1
+                    count('cache_hits_total', cache='pipelines')
+                    return entry
+                self.misses += 1
+                count('cache_misses_total', cache='pipelines')
+                if pinned:
+                    self._drop_pinned_variants(key)
+
+            pipe = loader()
+            components = estimate_component_bytes(pipe)
+            entry = {
+                'pipe': pipe,
+                'pool': memory_pool,
+                'components': components,
+                'size_bytes': sum(components.values()),
+                'leases': 1,
+                'pinned': pinned,
+                'lock': threading.Lock(),
+            }
+            with self._lock:
+                self._entries[key] = entry
+                self._load_locks.pop(key, None)
+                self._evict(memory_pool)
+            return entry
+
+    def _drop_pinned_variants(self, key):
+        """
+        Připnutá pipeline je jedna na (model, dtype, zařízení) - varianta
+        s jiným režimem offloadu se před načtením nové uvolní, jinak by obě
+        zůstaly v paměti napořád (připnuté se z LRU neuvolňují).
+        """
+        device = key[3].split('+')[0]
+        for k, e in list(self._entries.items()):
+            if k[:3] == key[:3] and k[3].split('+')[0] == device and e['pinned'] and e['leases'] == 0:
+                del self._entries[k]
+                self.evictions += 1
+                count('cache_evictions_total', cache='pipelines')
+                print(f"♻️ Uvolňuji připnutou pipeline v jiném režimu offloadu: {k[0]} ({k[3]})")
+        gc.collect()
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+    def _pool_components(self, pool, exclude=()):
+        """Komponenty pipeline v poolu {id(modul): bajty} - sdílené jen jednou."""
+        components = {}
+        for k, e in self._entries.items():
+            if e['pool'] == pool and k not in exclude:
+                components.update(e['components'])
+        return components
+
+    def _pool_usage(self, pool):
+        return sum(self._pool_components(pool).values())
+
+    def _exclusive_bytes(self, key):
+        """Paměť, kterou uvolní odstranění pipeline (bez komponent sdílených s jinými)."""
+        entry = self._entries[key]
+        others = self._pool_components(entry['pool'], exclude=(key,))
+        return sum(size for component, size in entry['components'].items() if component not in others)
+
+    def _evict(self, pool):
+        """Uvolní nejdéle nepoužité pipeline, dokud pool nesplní rozpočet."""
+        evicted = False
+        while self._pool_usage(pool) > self.budgets[pool]:
+            victim = next(
+                (k for k, e in self._entries.items()
+                 if e['pool'] == pool and e['leases'] == 0 and not e['pinned']),
+                None
+            )
+            if victim is None:
+                # Vše je právě používané - rozpočet dočasně překročíme
+                break
+            del self._entries[victim]
+            self.evictions += 1
+            count('cache_evictions_total', cache='pipelines')
+            evicted = True
+            print(f"♻️ Uvolňuji pipeline z paměti: {victim[0]} ({victim[1]})")
+
+        if evicted:
+            gc.collect()
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+
+    def invalidate(self, key):
+        """Odstraní pipeline z registru (např. po chybě během generování)."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry['leases'] == 0:
+                del self._entries[key]
+        gc.collect()
+
+    def clear(self):
+        """Uvolní všechny nepoužívané pipeline."""
+        with self._lock:
+            for key in [k for k, e in self._entries.items() if e['leases'] == 0]:
+                del self._entries[key]
+        gc.collect()
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+    def stats(self):
+        """Vrátí statistiky registru (hit/miss/eviction a obsazenou paměť)."""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'resident': len(self._entries),
+                'host_gb': self._pool_usage('host') / GB,
+                'device_gb': self._pool_usage('device') / GB,
+                'models': [f"{key[0]} ({key[1]}, {key[3]})" for key in self._entries],
+            }
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_pipeline_registry() -> PipelineRegistry:
+    """Vrátí procesově sdílený registr pipeline (přežívá rerun Streamlit skriptu)."""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = PipelineRegistry(
+                host_budget_bytes=int(PIPELINE_CACHE_HOST_GB * GB),
+                device_budget_bytes=int(PIPELINE_CACHE_DEVICE_GB * GB),
+            )
+        return _registry
@@ -0,0 +1,97 @@
+"""
+Cache zakódovaných výsledků pro UI
+
+Každý výsledek se po vygenerování zakóduje jednou - plná kvalita do PNG
+(úroveň komprese RESULT_PNG_COMPRESS_LEVEL) a malá miniatura do WebP/JPEG.
+Náhledy, miniatury i tlačítka ke stažení pak posílají hotové bajty, při
+rerunu se nic nekóduje znovu a prohlížeč nedostává plné rozlišení kvůli
+150px miniatuře. PIL obrázky se po zakódování zahodí.
+"""
+
+import io
+import os
+import threading
+import uuid
+from collections import OrderedDict
+
+from tracing import span
+
+RESULT_CACHE_MB = float(os.getenv('RESULT_CACHE_MB', '512'))
+# 0 = bez komprese (nejrychlejší), 9 = nejmenší soubor
+RESULT_PNG_COMPRESS_LEVEL = int(os.getenv('RESULT_PNG_COMPRESS_LEVEL', '6'))
+THUMBNAIL_SIZE = int(os.getenv('THUMBNAIL_SIZE', '300'))
+THUMBNAIL_FORMAT = os.getenv('THUMBNAIL_FORMAT', 'WEBP').upper()
+THUMBNAIL_QUALITY = int(os.getenv('THUMBNAIL_QUALITY', '80'))
+
+THUMBNAIL_MIME = {'WEBP': 'image/webp', 'JPEG': 'image/jpeg'}
+
+
+def encode_png(image, compress_level=RESULT_PNG_COMPRESS_LEVEL):
+    buf = io.BytesIO()
+    image.save(buf, format="PNG", compress_level=compress_level)
+    return buf.getvalue()
+
+
+def encode_thumbnail(image, size=THUMBNAIL_SIZE, image_format=THUMBNAIL_FORMAT, quality=THUMBNAIL_QUALITY):
+    """Zmenšenina (delší strana `size`) ve WebP/JPEG."""
+    thumbnail = image.convert("RGB")
+    thumbnail.thumbnail((size, size))
+    buf = io.BytesIO()
+    thumbnail.save(buf, format=image_format, quality=quality)
+    return buf.getvalue()
+
+
+class ResultCache:
+    """LRU cache zakódovaných výsledků omezená velikostí."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.encoded = 0
+
+    def add(self, image):
+        """Zakóduje obrázek (PNG + miniatura) a vrátí klíč záznamu."""
+        with span('encode'):
+            entry = {
+                'png': encode_png(image),
+                'thumbnail': encode_thumbnail(image),
+                'thumbnail_mime': THUMBNAIL_MIME.get(THUMBNAIL_FORMAT, 'image/jpeg'),
+                'size': image.size,
+            }
+        key = uuid.uuid4().hex
+        with self._lock:
+            self._entries[key] = entry
+            self.encoded += 1
+            while len(self._entries) > 1 and self._total_bytes() > self.max_bytes:
+                self._entries.popitem(last=False)
+        return key
+
+    def add_all(self, images):
+        return [self.add(image) for image in images]
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def _total_bytes(self):
+        return sum(len(entry['png']) + len(entry['thumbnail']) for entry in self._entries.values())
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'encoded': self.encoded,
+                'cached_mb': self._total_bytes() / (1024 * 1024),
+            }
+
+
+_cache = ResultCache(int(RESULT_CACHE_MB * 1024 * 1024))
+
+
+def get_result_cache() -> ResultCache:
+    """Vrátí procesově sdílenou cache výsledků."""
+    return _cache
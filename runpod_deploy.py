@@ -154,7 +154,7 @@ def main():
         "env": [
             {"key": "FORCE_CPU", "value": "false"},
             {"key": "MAX_MEMORY_GB", "value": "24"},
-            {"key": "ENABLE_ATTENTION_SLICING", "value": "true"},
+            {"key": "ENABLE_ATTENTION_SLICING", "value": "auto"},
             {"key": "ENABLE_CPU_OFFLOAD", "value": "auto"},
             {"key": "BASE_MODEL", "value": "stabilityai/stable-diffusion-xl-base-1.0"}
         ]
@@ -177,7 +177,7 @@ def main():
         "env": [
             {"key": "FORCE_CPU", "value": "false"},
             {"key": "MAX_MEMORY_GB", "value": "24"},
-            {"key": "ENABLE_ATTENTION_SLICING", "value": "true"},
+            {"key": "ENABLE_ATTENTION_SLICING", "value": "auto"},
             {"key": "ENABLE_CPU_OFFLOAD", "value": "auto"},
             {"key": "BASE_MODEL", "value": "stabilityai/stable-diffusion-xl-base-1.0"}
         ]
@@ -32,6 +32,7 @@ export STREAMLIT_SERVER_MAX_MESSAGE_SIZE=50000  # 50GB in MB
 cleanup() {
     echo "🛑 Shutting down services..."
     kill $STREAMLIT_PID 2>/dev/null
+    [ -n "$API_PID" ] && kill $API_PID 2>/dev/null
     wait
     echo "✅ All services stopped"
     exit 0
@@ -90,6 +91,23 @@ filebrowser --port 8083 --address 0.0.0.0 --root /data --database /data/filebrow
 FILEBROWSER_PID=$!
 echo "FileBrowser PID: $FILEBROWSER_PID"
 
+# Volitelné inference API - Streamlit pak generuje přes službu
+if [ "${START_INFERENCE_API:-false}" = "true" ]; then
+    echo "🔌 Starting Inference API on port ${API_PORT:-8600}..."
+    python3 api_server.py > /tmp/inference_api.log 2>&1 &
+    API_PID=$!
+    echo "🔌 Inference API PID: $API_PID"
+    export INFERENCE_API_URL="${INFERENCE_API_URL:-http://localhost:${API_PORT:-8600}}"
+
+    # UI se spustí až po předehřátí modelů (PRELOAD_MODELS) - první uživatel nečeká na studený start
+    echo "🔥 Waiting for model warm-up..."
+    for i in $(seq 1 300); do
+        curl -sf "${INFERENCE_API_URL}/ready" > /dev/null && break
+        sleep 2
+    done
+    curl -sf "${INFERENCE_API_URL}/ready" > /dev/null && echo "✅ Inference API ready" || echo "⚠️ Warm-up not finished, starting UI anyway"
+fi
+
 # Spuštění Streamlit App s error handlingem
 echo "🎨 Starting Streamlit App on port 8501..."
 python3 -m streamlit run app.py --server.port=8501 --server.address=0.0.0.0 --server.headless=true > /tmp/streamlit.log 2>&1 &
@@ -0,0 +1,108 @@
+"""
+Jednorázový průzkum systému a zařízení
+
+Streamlit při každém rerunu spouští app.py znovu - informace o systému a
+test CUDA (alokace testovacího tenzoru) se proto počítají jednou za proces
+a dál se vrací z paměti. Průzkum zařízení importuje torch, a tak ho UI
+spouští ve vlákně na pozadí: první vykreslení stránky na torch nečeká a
+import se překryje s tím, než uživatel nahraje obrázek.
+"""
+
+import os
+import platform
+import threading
+
+import psutil
+
+from config import FORCE_CPU
+from tracing import span
+
+_probe = None
+_probe_lock = threading.Lock()
+_probe_thread = None
+
+
+def _run_device_probe():
+    """Určí optimální zařízení pro inference s fallback pro CUDA chyby"""
+    import torch
+
+    info = {
+        'device': "cpu",
+        'reason': "",
+        'cuda_available': torch.cuda.is_available(),
+        'cuda_device_count': torch.cuda.device_count() if torch.cuda.is_available() else 0,
+        'cuda_device_name': None,
+        'cuda_memory_gb': 0,
+    }
+    if FORCE_CPU:
+        info['reason'] = "Vynuceno CPU"
+        return info
+    if not info['cuda_available']:
+        info['reason'] = "CUDA není dostupná"
+        return info
+
+    try:
+        # Test CUDA funkčnosti s RTX 5090 fallback
+        test_tensor = torch.randn(10, device='cuda')
+        _ = test_tensor + 1  # Jednoduchý test operace
+        gpu_memory = torch.cuda.get_device_properties(0).total_memory / (1024**3)
+        info['cuda_device_name'] = torch.cuda.get_device_name(0)
+        info['cuda_memory_gb'] = gpu_memory
+        if gpu_memory < 4:
+            info['reason'] = f"Nedostatek GPU paměti ({gpu_memory:.1f} GB < 4 GB)"
+            return info
+
+        info['device'] = "cuda"
+        info['reason'] = f"GPU: {info['cuda_device_name']} ({gpu_memory:.1f} GB)"
+    except Exception as e:
+        # Fallback na CPU při CUDA chybách (RTX 5090 kompatibilita)
+        info['reason'] = f"CUDA chyba - fallback na CPU: {str(e)[:30]}..."
+    return info
+
+
+def probe_device():
+    """Výsledek průzkumu zařízení (spočítá se při prvním volání v procesu)."""
+    global _probe
+    with _probe_lock:
+        if _probe is None:
+            with span('device_probe'):
+                _probe = _run_device_probe()
+        return _probe
+
+
+def start_background_probe():
+    """Spustí průzkum zařízení ve vlákně na pozadí (idempotentní)."""
+    global _probe_thread
+    with _probe_lock:
+        if _probe is not None or _probe_thread is not None:
+            return
+        _probe_thread = threading.Thread(target=probe_device, name="device-probe", daemon=True)
+        _probe_thread.start()
+
+
+def wait_for_probe(timeout=None):
+    """Počká na průzkum spuštěný na pozadí; vrací výsledek, nebo None."""
+    thread = _probe_thread
+    if thread is not None:
+        thread.join(timeout)
+    return _probe
+
+
+def get_probe_if_ready():
+    """Výsledek průzkumu, pokud už doběhl - nikdy neblokuje a nic neimportuje."""
+    return _probe
+
+
+_system_info = None
+
+
+def get_system_info():
+    """Informace o systému bez torch (platforma, CPU, RAM) - jednou za proces."""
+    global _system_info
+    if _system_info is None:
+        _system_info = {
+            'platform': platform.system(),
+            'cpu_count': psutil.cpu_count() or os.cpu_count(),
+            'memory_gb': psutil.virtual_memory().total / (1024**3),
+        }
+    return _system_info
@@ -0,0 +1,120 @@
+"""
+Dlaždicové zpracování velkých vstupů
+
+Nad TILING_MIN_PIXELS se zapne:
+- dlaždicový VAE encode/decode (diffusers `enable_tiling`, překryv se prolíná),
+- dlaždicový denoising - UNet běží po překrývajících se dlaždicích latentu
+  a predikce šumu se skládají s váhami klesajícími k okrajům dlaždice
+  (MultiDiffusion), takže švy nejsou vidět.
+
+Paměť aktivací pak závisí na velikosti dlaždice, ne na rozlišení vstupu -
+4K+ vstupy běží s pevným stropem na CPU i GPU.
+"""
+
+import os
+from contextlib import contextmanager
+
+import torch
+from diffusers.models.unet_2d_condition import UNet2DConditionOutput
+
+# Od kolika pixelů vstupu se zapne dlaždicové zpracování (výchozí 2048x2048)
+TILING_MIN_PIXELS = int(os.getenv('TILING_MIN_PIXELS', str(2048 * 2048)))
+# Velikost a překryv dlaždic UNetu v pixelech obrázku
+UNET_TILE_SIZE = int(os.getenv('UNET_TILE_SIZE', '1024'))
+UNET_TILE_OVERLAP = int(os.getenv('UNET_TILE_OVERLAP', '256'))
+# Velikost dlaždic VAE v pixelech obrázku
+VAE_TILE_SIZE = int(os.getenv('VAE_TILE_SIZE', '512'))
+
+
+def should_tile(width, height):
+    return width * height > TILING_MIN_PIXELS
+
+
+def effective_size(width, height):
+    """Rozměry, podle kterých se plánuje paměť UNetu (při dlaždicích jedna dlaždice)."""
+    if not should_tile(width, height):
+        return width, height
+    return min(width, UNET_TILE_SIZE), min(height, UNET_TILE_SIZE)
+
+
+def tile_starts(size, tile, overlap):
+    """Počátky dlaždic pokrývajících `size`; poslední dlaždice končí na okraji."""
+    if size <= tile:
+        return [0]
+    stride = max(1, tile - overlap)
+    return list(range(0, size - tile, stride)) + [size - tile]
+
+
+def blend_ramp(length, overlap, device, dtype):
+    """Váhy podél jedné osy - lineární náběh na okrajích dlaždice, nikde nulové."""
+    ramp = torch.ones(length, device=device, dtype=dtype)
+    edge = min(overlap, length // 2)
+    if edge > 0:
+        values = torch.arange(1, edge + 1, device=device, dtype=dtype) / (edge + 1)
+        ramp[:edge] = values
+        ramp[-edge:] = values.flip(0)
+    return ramp
+
+
+def tiled_unet_forward(forward, tile, overlap):
+    """Obalí `unet.forward` tak, aby velké latenty počítal po dlaždicích."""
+
+    def tiled_forward(sample, timestep, *args, return_dict=True, **kwargs):
+        height, width = sample.shape[-2:]
+        if height <= tile and width <= tile:
+            return forward(sample, timestep, *args, return_dict=return_dict, **kwargs)
+
+        output = None
+        weights = torch.zeros((1, 1, height, width), device=sample.device, dtype=sample.dtype)
+        tile_h, tile_w = min(tile, height), min(tile, width)
+        mask = (
+            blend_ramp(tile_h, overlap, sample.device, sample.dtype)[:, None]
+            * blend_ramp(tile_w, overlap, sample.device, sample.dtype)[None, :]
+        )
+        for top in tile_starts(height, tile, overlap):
+            for left in tile_starts(width, tile, overlap):
+                region = (..., slice(top, top + tile_h), slice(left, left + tile_w))
+                prediction = forward(sample[region], timestep, *args, return_dict=False, **kwargs)[0]
+                if output is None:
+                    output = torch.zeros(
+                        prediction.shape[:-2] + (height, width), device=prediction.device, dtype=prediction.dtype
+                    )
+                output[region] += prediction * mask
+                weights[region] += mask
+        output = output / weights
+        if not return_dict:
+            return (output,)
+        return UNet2DConditionOutput(sample=output)
+
+    return tiled_forward
+
+
+@contextmanager
+def tiled_execution(pipe, width, height, notify=print, force=False):
+    """
+    Pro velké vstupy (nebo s `force` z plánu paměti) dočasně zapne dlaždicový
+    VAE a UNet; jinak nic nemění. Vrací True, pokud je dlaždicový režim aktivní.
+    """
+    if not (force or should_tile(width, height)):
+        yield False
+        return
+
+    vae, unet = pipe.vae, pipe.unet
+    vae_state = (vae.use_tiling, vae.tile_sample_min_size, vae.tile_latent_min_size)
+    # forward může být už obalený (např. accelerate hooky při CPU offloadu)
+    previous_forward = unet.__dict__.get('forward')
+
+    scale = pipe.vae_scale_factor
+    vae.enable_tiling()
+    vae.tile_sample_min_size = VAE_TILE_SIZE
+    vae.tile_latent_min_size = VAE_TILE_SIZE // scale
+    unet.forward = tiled_unet_forward(unet.forward, UNET_TILE_SIZE // scale, UNET_TILE_OVERLAP // scale)
+    notify(f"🧩 Vstup {width}x{height} - dlaždicové zpracování (UNet {UNET_TILE_SIZE}px, VAE {VAE_TILE_SIZE}px)")
+    try:
+        yield True
+    finally:
+        vae.use_tiling, vae.tile_sample_min_size, vae.tile_latent_min_size = vae_state
+        if previous_forward is not None:
+            unet.forward = previous_forward
+        else:
+            del unet.forward
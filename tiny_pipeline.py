@@ -0,0 +1,101 @@
+"""
+Malá náhodně inicializovaná SDXL img2img pipeline
+
+Stejná architektura jako SDXL (dva text encodery, UNet s `text_time`
+embeddingem, AutoencoderKL), jen s minimálními rozměry - generování na CPU
+trvá zlomek sekundy. Slouží k testování API, workeru a benchmarků bez
+stahování skutečných vah (TINY_PIPELINE=true). Výstupem je šum.
+"""
+
+import json
+import os
+
+import torch
+from diffusers import AutoencoderKL, EulerDiscreteScheduler, StableDiffusionXLImg2ImgPipeline, UNet2DConditionModel
+from transformers import CLIPTextConfig, CLIPTextModel, CLIPTextModelWithProjection, CLIPTokenizer
+
+from config import resolve_cache_dir
+
+TEXT_HIDDEN_SIZE = 32
+ADDITION_TIME_EMBED_DIM = 8
+# original_size + crops_coords_top_left + target_size
+ADD_TIME_IDS = 6
+
+
+def build_tiny_tokenizer():
+    """Tokenizer s minimálním slovníkem - neznámá slova se mapují na <|endoftext|>."""
+    tokenizer_dir = resolve_cache_dir('tiny_pipeline')
+    vocab_file = os.path.join(tokenizer_dir, 'vocab.json')
+    merges_file = os.path.join(tokenizer_dir, 'merges.txt')
+    # Pooled výstup CLIPu bere token s nejvyšším id - <|endoftext|> musí být poslední
+    with open(vocab_file, 'w') as f:
+        json.dump({'!': 0, '<|startoftext|>': 1, '<|endoftext|>': 2}, f)
+    with open(merges_file, 'w') as f:
+        f.write('#version: 0.2\n')
+    return CLIPTokenizer(vocab_file, merges_file, pad_token='!', model_max_length=77)
+
+
+def build_tiny_pipeline(torch_dtype=torch.float32, seed=0):
+    """Sestaví malou SDXL img2img pipeline s deterministicky náhodnými vahami."""
+    torch.manual_seed(seed)
+    unet = UNet2DConditionModel(
+        block_out_channels=(32, 64),
+        layers_per_block=2,
+        sample_size=32,
+        in_channels=4,
+        out_channels=4,
+        down_block_types=("DownBlock2D", "CrossAttnDownBlock2D"),
+        up_block_types=("CrossAttnUpBlock2D", "UpBlock2D"),
+        attention_head_dim=(2, 4),
+        use_linear_projection=True,
+        addition_embed_type="text_time",
+        addition_time_embed_dim=ADDITION_TIME_EMBED_DIM,
+        transformer_layers_per_block=(1, 2),
+        projection_class_embeddings_input_dim=ADDITION_TIME_EMBED_DIM * ADD_TIME_IDS + TEXT_HIDDEN_SIZE,
+        # Spojené skryté stavy obou text encoderů
+        cross_attention_dim=TEXT_HIDDEN_SIZE * 2,
+    )
+    scheduler = EulerDiscreteScheduler(
+        beta_start=0.00085,
+        beta_end=0.012,
+        steps_offset=1,
+        beta_schedule="scaled_linear",
+        timestep_spacing="leading",
+    )
+    vae = AutoencoderKL(
+        block_out_channels=[32, 64],
+        in_channels=3,
+        out_channels=3,
+        down_block_types=["DownEncoderBlock2D", "DownEncoderBlock2D"],
+        up_block_types=["UpDecoderBlock2D", "UpDecoderBlock2D"],
+        latent_channels=4,
+        sample_size=128,
+    )
+    text_encoder_config = CLIPTextConfig(
+        bos_token_id=1,
+        eos_token_id=2,
+        pad_token_id=0,
+        hidden_size=TEXT_HIDDEN_SIZE,
+        intermediate_size=37,
+        layer_norm_eps=1e-05,
+        num_attention_heads=4,
+        num_hidden_layers=5,
+        vocab_size=1000,
+        hidden_act="gelu",
+        projection_dim=TEXT_HIDDEN_SIZE,
+    )
+    tokenizer = build_tiny_tokenizer()
+
+    pipe = StableDiffusionXLImg2ImgPipeline(
+        vae=vae,
+        text_encoder=CLIPTextModel(text_encoder_config),
+        text_encoder_2=CLIPTextModelWithProjection(text_encoder_config),
+        tokenizer=tokenizer,
+        tokenizer_2=tokenizer,
+        unet=unet,
+        scheduler=scheduler,
+        requires_aesthetics_score=False,
+        force_zeros_for_empty_prompt=True,
+        add_watermarker=False,
+    )
+    return pipe.to(torch_dtype=torch_dtype)
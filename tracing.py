@@ -0,0 +1,281 @@
+"""
+Časové úseky, čítače a metriky generování
+
+`span(name)` měří dobu jedné fáze (načtení modelu, LoRA, scheduler, krok
+denoisingu, VAE encode/decode, upscaling, průzkum modelů...). Každý úsek se
+započítá do histogramu, s TRACE_LOG se navíc zapíše jako JSON řádek s id
+trasy a rodičovského úseku. Čítače (zásahy cache) a maxima paměti se
+sbírají vedle.
+
+Export: `snapshot()` vrací serializovatelný stav (posílá se i z worker
+procesu), `render_prometheus(snapshot)` z něj dělá textový formát pro
+Prometheus - endpoint `/metrics` v api_server.py, případně samostatný
+server na METRICS_PORT pro Streamlit bez API.
+"""
+
+import functools
+import json
+import os
+import resource
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Cesta k JSON logu úseků ("-" = stdout, prázdné = vypnuto)
+TRACE_LOG = os.getenv('TRACE_LOG', '')
+# Port samostatného /metrics serveru (0 = vypnuto)
+METRICS_PORT = int(os.getenv('METRICS_PORT', '0'))
+
+METRIC_PREFIX = "neural_art"
+# Hranice histogramu dob úseků v sekundách
+SPAN_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+
+def _label_key(labels):
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+class Tracer:
+    """Sběr úseků, čítačů a gauge metrik v rámci procesu."""
+
+    def __init__(self, log_path=TRACE_LOG):
+        self.log_path = log_path
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._log_file = None
+        # jméno úseku -> {'count', 'sum', 'max', 'buckets'}
+        self._spans = {}
+        self._counters = {}
+        self._gauges = {}
+
+    # --- úseky ---------------------------------------------------------------
+
+    def _stack(self):
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        return self._local.stack
+
+    @contextmanager
+    def span(self, name, **attributes):
+        """Změří blok kódu jako úsek `name`; vnořené úseky sdílí id trasy."""
+        stack = self._stack()
+        parent = stack[-1] if stack else None
+        span_id = uuid.uuid4().hex[:16]
+        trace_id = parent['trace_id'] if parent else uuid.uuid4().hex
+        stack.append({'span_id': span_id, 'trace_id': trace_id})
+        started = time.perf_counter()
+        error = None
+        try:
+            yield
+        except BaseException as e:
+            error = type(e).__name__
+            raise
+        finally:
+            stack.pop()
+            self.record_span(
+                name, time.perf_counter() - started, trace_id=trace_id, span_id=span_id,
+                parent_id=parent['span_id'] if parent else None, error=error, **attributes
+            )
+
+    def record_span(self, name, seconds, trace_id=None, span_id=None, parent_id=None, error=None, **attributes):
+        """Započítá úsek změřený jinde (např. krok denoisingu z callbacku)."""
+        if trace_id is None:
+            stack = self._stack()
+            if stack:
+                trace_id, parent_id = stack[-1]['trace_id'], stack[-1]['span_id']
+        with self._lock:
+            entry = self._spans.setdefault(name, {'count': 0, 'sum': 0.0, 'max': 0.0, 'buckets': [0] * len(SPAN_BUCKETS)})
+            entry['count'] += 1
+            entry['sum'] += seconds
+            entry['max'] = max(entry['max'], seconds)
+            for i, bound in enumerate(SPAN_BUCKETS):
+                if seconds <= bound:
+                    entry['buckets'][i] += 1
+            if error:
+                self._inc('span_errors_total', 1, {'span': name})
+        self.update_memory_peaks()
+        self._log({
+            'type': 'span', 'name': name, 'duration_ms': round(seconds * 1000, 3), 'ts': time.time(),
+            'trace_id': trace_id, 'span_id': span_id, 'parent_id': parent_id, 'error': error,
+            'pid': os.getpid(), **attributes,
+        })
+
+    # --- čítače a gauge ------------------------------------------------------
+
+    def _inc(self, name, value, labels):
+        key = (name, _label_key(labels))
+        self._counters[key] = self._counters.get(key, 0) + value
+
+    def count(self, name, value=1, **labels):
+        with self._lock:
+            self._inc(name, value, labels)
+
+    def set_gauge(self, name, value, **labels):
+        with self._lock:
+            self._gauges[(name, _label_key(labels))] = value
+
+    def max_gauge(self, name, value, **labels):
+        """Gauge jako maximum (high-water mark)."""
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._gauges[key] = max(self._gauges.get(key, 0), value)
+
+    def update_memory_peaks(self):
+        # ru_maxrss je na Linuxu v KB
+        self.max_gauge('memory_peak_bytes', resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024, kind='rss')
+        # torch se může zrovna importovat ve vlákně průzkumu zařízení - modul pak ještě nemá `cuda`
+        cuda = getattr(sys.modules.get('torch'), 'cuda', None)
+        if hasattr(cuda, 'is_initialized') and cuda.is_initialized():
+            self.max_gauge('memory_peak_bytes', cuda.max_memory_allocated(), kind='cuda_allocated')
+
+    # --- export --------------------------------------------------------------
+
+    def _log(self, record):
+        if not self.log_path:
+            return
+        line = json.dumps(record, ensure_ascii=False, default=str)
+        with self._lock:
+            if self.log_path == '-':
+                print(line, flush=True)
+                return
+            if self._log_file is None:
+                os.makedirs(os.path.dirname(os.path.abspath(self.log_path)), exist_ok=True)
+                self._log_file = open(self.log_path, 'a', encoding='utf-8')
+            self._log_file.write(line + '\n')
+            self._log_file.flush()
+
+    def snapshot(self):
+        """Serializovatelný stav metrik (lze poslat mezi procesy)."""
+        with self._lock:
+            return {
+                'spans': [dict(entry, name=name, buckets=list(entry['buckets'])) for name, entry in self._spans.items()],
+                'counters': [{'name': name, 'labels': dict(labels), 'value': value}
+                             for (name, labels), value in self._counters.items()],
+                'gauges': [{'name': name, 'labels': dict(labels), 'value': value}
+                           for (name, labels), value in self._gauges.items()],
+            }
+
+    def summary(self):
+        """Průměrná doba úseků v ms podle jména (pro UI)."""
+        with self._lock:
+            return {name: 1000 * entry['sum'] / entry['count'] for name, entry in self._spans.items()}
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"') for value in labels.values())
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(labels, escaped)) + "}"
+
+
+def render_prometheus(snapshot, extra_gauges=None):
+    """Textový formát Prometheus ze `snapshot()` a případných gauge (jméno, labely, hodnota)."""
+    lines = []
+    metric = f"{METRIC_PREFIX}_span_seconds"
+    lines.append(f"# HELP {metric} Doba fází generování")
+    lines.append(f"# TYPE {metric} histogram")
+    for entry in sorted(snapshot.get('spans', []), key=lambda entry: entry['name']):
+        labels = {'span': entry['name']}
+        for bound, count in zip(SPAN_BUCKETS, entry['buckets']):
+            lines.append(f"{metric}_bucket{_format_labels(dict(labels, le=bound))} {count}")
+        lines.append(f"{metric}_bucket{_format_labels(dict(labels, le='+Inf'))} {entry['count']}")
+        lines.append(f"{metric}_sum{_format_labels(labels)} {entry['sum']}")
+        lines.append(f"{metric}_count{_format_labels(labels)} {entry['count']}")
+
+    for kind, items in (('counter', snapshot.get('counters', [])), ('gauge', snapshot.get('gauges', []) + list(extra_gauges or []))):
+        by_name = {}
+        for item in items:
+            if isinstance(item, tuple):
+                item = {'name': item[0], 'labels': item[1], 'value': item[2]}
+            by_name.setdefault(item['name'], []).append(item)
+        for name in sorted(by_name):
+            metric = f"{METRIC_PREFIX}_{name}"
+            lines.append(f"# TYPE {metric} {kind}")
+            for item in by_name[name]:
+                lines.append(f"{metric}{_format_labels(item['labels'])} {item['value']}")
+    return "\n".join(lines) + "\n"
+
+
+_tracer = Tracer()
+
+
+def get_tracer() -> Tracer:
+    """Vrátí procesově sdílený tracer."""
+    return _tracer
+
+
+def span(name, **attributes):
+    """Zkratka pro `get_tracer().span(...)`."""
+    return _tracer.span(name, **attributes)
+
+
+def count(name, value=1, **labels):
+    _tracer.count(name, value, **labels)
+
+
+def traced(name):
+    """Dekorátor - celé volání funkce jako úsek `name`."""
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with _tracer.span(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def traced_method(obj, method_name, name):
+    """Dočasně měří volání `obj.<method_name>` jako úsek (např. vae.decode uvnitř pipeline)."""
+    previous = obj.__dict__.get(method_name)
+    method = getattr(obj, method_name)
+
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        with _tracer.span(name):
+            return method(*args, **kwargs)
+
+    setattr(obj, method_name, wrapper)
+    try:
+        yield
+    finally:
+        if previous is not None:
+            setattr(obj, method_name, previous)
+        else:
+            delattr(obj, method_name)
+
+
+_metrics_server = None
+_metrics_lock = threading.Lock()
+
+
+def start_metrics_server(port=METRICS_PORT):
+    """Spustí /metrics server ve vlákně na pozadí (idempotentní, 0 = vypnuto)."""
+    global _metrics_server
+    if not port:
+        return None
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = render_prometheus(_tracer.snapshot()).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    with _metrics_lock:
+        if _metrics_server is None:
+            _metrics_server = ThreadingHTTPServer(('0.0.0.0', port), MetricsHandler)
+            threading.Thread(target=_metrics_server.serve_forever, name="metrics-server", daemon=True).start()
+            print(f"📈 Metriky na http://0.0.0.0:{port}/metrics")
+        return _metrics_server
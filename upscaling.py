@@ -0,0 +1,177 @@
+"""
+Upscaling výsledků po dlaždicích
+
+Obrázek se rozdělí na dlaždice, každá se zvětší i s okrajem (kontext pro
+filtr) a z výsledku se vyřízne jen její vnitřek - švy tak nejsou vidět.
+Dlaždice běží paralelně ve vláknech (PIL při resize uvolňuje GIL).
+Obrázky se zpracovávají postupně: zatímco se jeden ukládá, zvětšuje se další,
+takže v paměti jsou nejvýš dva zvětšené obrázky bez ohledu na počet variant.
+
+Algoritmus je zásuvný - stačí podtřída `Upscaler` (např. naučený model)
+zaregistrovaná v UPSCALERS a vybraná přes UPSCALER.
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+from tracing import span
+
+UPSCALER = os.getenv('UPSCALER', 'lanczos')
+# Velikost dlaždice ve vstupních pixelech
+UPSCALE_TILE = int(os.getenv('UPSCALE_TILE', '256'))
+UPSCALE_WORKERS = int(os.getenv('UPSCALE_WORKERS', str(min(8, os.cpu_count() or 1))))
+
+
+class Upscaler:
+    """Rozhraní algoritmu upscalingu jedné dlaždice."""
+
+    name = "base"
+    # Potřebný kontext kolem dlaždice ve vstupních pixelech
+    margin = 0
+
+    def upscale_tile(self, tile, factor):
+        """Zvětší dlaždici (PIL Image) přesně `factor`-krát."""
+        raise NotImplementedError
+
+
+class LanczosUpscaler(Upscaler):
+    name = "lanczos"
+    # Lanczos-3 čte 3 vstupní pixely na každou stranu
+    margin = 3
+
+    def upscale_tile(self, tile, factor):
+        return tile.resize((tile.width * factor, tile.height * factor), Image.Resampling.LANCZOS)
+
+
+UPSCALERS = {
+    'lanczos': LanczosUpscaler,
+}
+
+
+def tile_boxes(width, height, tile_size):
+    """Dlaždice pokrývající obrázek jako (x0, y0, x1, y1)."""
+    for top in range(0, height, tile_size):
+        for left in range(0, width, tile_size):
+            yield left, top, min(left + tile_size, width), min(top + tile_size, height)
+
+
+class UpscaleStage:
+    """Paralelní upscaling po dlaždicích s měřením času jednotlivých fází."""
+
+    def __init__(self, upscaler=None, tile_size=UPSCALE_TILE, workers=UPSCALE_WORKERS):
+        self.upscaler = upscaler or UPSCALERS[UPSCALER]()
+        self.tile_size = tile_size
+        self.workers = max(1, workers)
+        self._tile_pool = ThreadPoolExecutor(self.workers, thread_name_prefix="upscale-tile")
+        # Ukládání běží vedle zvětšování dalšího obrázku
+        self._sink_pool = ThreadPoolExecutor(1, thread_name_prefix="upscale-sink")
+        self._lock = threading.Lock()
+        self.timings = {'tiles': 0.0, 'assemble': 0.0, 'sink': 0.0}
+        self.counts = {'images': 0, 'tiles': 0, 'failed': 0}
+
+    def _upscale_tile(self, image, box, factor):
+        started = time.perf_counter()
+        left, top, right, bottom = box
+        margin = self.upscaler.margin
+        crop_box = (
+            max(0, left - margin), max(0, top - margin),
+            min(image.width, right + margin), min(image.height, bottom + margin)
+        )
+        upscaled = self.upscaler.upscale_tile(image.crop(crop_box), factor)
+        offset_x = (left - crop_box[0]) * factor
+        offset_y = (top - crop_box[1]) * factor
+        tile = upscaled.crop((
+            offset_x, offset_y,
+            offset_x + (right - left) * factor, offset_y + (bottom - top) * factor
+        ))
+        return tile, time.perf_counter() - started
+
+    def upscale(self, image, factor):
+        """Zvětší jeden obrázek; dlaždice běží paralelně."""
+        started = time.perf_counter()
+        output = Image.new(image.mode, (image.width * factor, image.height * factor))
+        boxes = list(tile_boxes(image.width, image.height, self.tile_size))
+        futures = [self._tile_pool.submit(self._upscale_tile, image, box, factor) for box in boxes]
+        tile_seconds = 0.0
+        for box, future in zip(boxes, futures):
+            tile, seconds = future.result()
+            output.paste(tile, (box[0] * factor, box[1] * factor))
+            tile_seconds += seconds
+        with self._lock:
+            self.timings['tiles'] += tile_seconds
+            self.timings['assemble'] += time.perf_counter() - started
+            self.counts['tiles'] += len(boxes)
+            self.counts['images'] += 1
+        return output
+
+    def _timed_sink(self, sink, index, image):
+        started = time.perf_counter()
+        sink(index, image)
+        with self._lock:
+            self.timings['sink'] += time.perf_counter() - started
+
+    def run(self, images, factor, sink, progress_callback=None):
+        """
+        Zvětší obrázky postupně a každý předá `sink(index, image)`. Při chybě
+        upscalingu předá původní obrázek. Další obrázek se zvětšuje, zatímco
+        se předchozí ukládá.
+        """
+        progress_callback = progress_callback or (lambda value, text="": None)
+        progress_callback(0.9, "Upscaling obrázků...")
+        pending = None
+        for i, image in enumerate(images):
+            try:
+                with span('upscale', factor=factor, upscaler=self.upscaler.name):
+                    result = self.upscale(image, factor)
+            except Exception as e:
+                with self._lock:
+                    self.counts['failed'] += 1
+                progress_callback(0.95, f"Upscaling obrázku {i+1} selhal: {e}")
+                result = image  # Použij původní obrázek
+            if pending is not None:
+                pending.result()
+            pending = self._sink_pool.submit(self._timed_sink, sink, i, result)
+            del result
+            progress_callback(0.9 + ((i + 1) / len(images)) * 0.05, f"Upscaling {i+1}/{len(images)}...")
+        if pending is not None:
+            pending.result()
+
+    def upscale_images(self, images, factor, progress_callback=None):
+        """Zvětší obrázky do paměti - UI i worker ukládají průběžně (cache výsledků, `upscale_to_files`)."""
+        results = [None] * len(images)
+        self.run(images, factor, results.__setitem__, progress_callback)
+        return results
+
+    def upscale_to_files(self, images, factor, paths, progress_callback=None):
+        """Zvětší obrázky rovnou do PNG souborů - v paměti nezůstávají."""
+        def save(index, image):
+            image.save(paths[index], format="PNG")
+        self.run(images, factor, save, progress_callback)
+        return paths
+
+    def stats(self):
+        with self._lock:
+            return {
+                'upscaler': self.upscaler.name,
+                'tile_size': self.tile_size,
+                'workers': self.workers,
+                'seconds': {name: round(value, 3) for name, value in self.timings.items()},
+                **self.counts,
+            }
+
+
+_stage = None
+_stage_lock = threading.Lock()
+
+
+def get_upscale_stage() -> UpscaleStage:
+    """Vrátí procesově sdílenou fázi upscalingu."""
+    global _stage
+    with _stage_lock:
+        if _stage is None:
+            _stage = UpscaleStage()
+        return _stage
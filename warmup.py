@@ -0,0 +1,105 @@
+"""
+Předehřátí modelů při startu služby
+
+První požadavek po startu podu by jinak platil studené čtení z /data,
+sestavení pipeline a první běh kernelů a alokátoru. Modely z PRELOAD_MODELS
+se proto při startu načtou do registru rezidentních pipeline a každý projde
+jedním malým syntetickým generováním (přes plánovač dávek, takže se nepere
+s požadavky uživatelů). Příznak připravenosti se nastaví až po dokončení -
+API ho vrací na `/ready`, metriky jako gauge `ready`.
+"""
+
+import os
+import threading
+import time
+
+from PIL import Image
+
+from config import TINY_PIPELINE
+from model_catalog import get_catalog_roots
+from model_inspect import inspect_model
+from tracing import get_tracer, span
+
+# Modely k předehřátí - cesty nebo jména souborů ve složkách modelů, oddělené čárkou
+PRELOAD_MODELS = os.getenv('PRELOAD_MODELS', '')
+# Velikost syntetického vstupu a počet kroků zahřívacího generování
+WARMUP_SIZE = int(os.getenv('WARMUP_SIZE', '512'))
+WARMUP_STEPS = int(os.getenv('WARMUP_STEPS', '2'))
+
+_state = {'ready': False, 'started': None, 'finished': None, 'models': []}
+_state_lock = threading.Lock()
+_warmup_thread = None
+
+
+def resolve_preload_model(name):
+    """Cesta a typ modelu ze seznamu; jméno bez cesty se hledá ve složkách modelů."""
+    if TINY_PIPELINE:
+        return name, "full_model"
+    path = name
+    if not os.path.isfile(path):
+        candidates = [os.path.join(root, name) for root, _kind in get_catalog_roots()]
+        path = next((candidate for candidate in candidates if os.path.isfile(candidate)), None)
+        if path is None:
+            raise FileNotFoundError(f"Model {name} nebyl nalezen")
+    return os.path.realpath(path), inspect_model(path)['model_type']
+
+
+def preload_list(value=PRELOAD_MODELS):
+    return [name.strip() for name in value.split(',') if name.strip()]
+
+
+def warm_up_model(model_path, model_type, notify=print):
+    """Načte model do registru a spustí jedno malé generování."""
+    from batch_scheduler import get_batch_scheduler
+
+    image = Image.new("RGB", (WARMUP_SIZE, WARMUP_SIZE), (128, 128, 128))
+    with span('warmup', model_type=model_type):
+        get_batch_scheduler().run(
+            image, model_path, model_type, notify=notify,
+            strength=0.5, guidance_scale=7.5, num_inference_steps=WARMUP_STEPS, seed=0, num_images=1,
+        )
+
+
+def run_warmup(models=None, notify=print):
+    """Předehřeje modely a nastaví připravenost; chyba jednoho modelu start nezastaví."""
+    models = preload_list() if models is None else models
+    with _state_lock:
+        _state.update(ready=False, started=time.time(), finished=None, models=[])
+    get_tracer().set_gauge('ready', 0)
+
+    for name in models:
+        started = time.perf_counter()
+        record = {'model': name, 'ok': True, 'error': None}
+        try:
+            model_path, model_type = resolve_preload_model(name)
+            notify(f"🔥 Předehřívám model {os.path.basename(model_path)} ({model_type})...")
+            warm_up_model(model_path, model_type, notify)
+        except Exception as e:
+            record.update(ok=False, error=str(e))
+            notify(f"⚠️ Předehřátí modelu {name} selhalo: {e}")
+        record['seconds'] = round(time.perf_counter() - started, 2)
+        with _state_lock:
+            _state['models'].append(record)
+
+    with _state_lock:
+        _state.update(ready=True, finished=time.time())
+    get_tracer().set_gauge('ready', 1)
+    if models:
+        notify(f"✅ Předehřátí dokončeno ({len(models)} modelů)")
+    return get_readiness()
+
+
+def start_background_warmup(notify=print):
+    """Spustí předehřátí ve vlákně na pozadí (jednou za proces)."""
+    global _warmup_thread
+    with _state_lock:
+        if _warmup_thread is not None:
+            return
+        _warmup_thread = threading.Thread(target=run_warmup, kwargs={'notify': notify}, name="warmup", daemon=True)
+        _warmup_thread.start()
+
+
+def get_readiness():
+    """Kopie stavu předehřátí ({'ready', 'started', 'finished', 'models'})."""
+    with _state_lock:
+        return dict(_state, models=[dict(record) for record in _state['models']])
@@ -0,0 +1,91 @@
+"""
+Proudový export variant do ZIP
+
+Archiv se skládá za běhu po blocích - generátor `iter_zip` vrací bajty
+postupně, takže celý ZIP nikdy neleží v paměti (HTTP odpověď i zápis do
+souboru jen přeposílají bloky). PNG už jsou komprimované, proto se ukládají
+bez komprese (ZIP_STORED) a export je omezený jen rychlostí I/O.
+"""
+
+import io
+import os
+import tempfile
+import time
+import zipfile
+from collections import deque
+
+ZIP_CHUNK_SIZE = 1024 * 1024
+# Nad touto velikostí člena je potřeba ZIP64 (rozhodnuto předem, stream nelze přepsat)
+ZIP64_MEMBER_LIMIT = zipfile.ZIP64_LIMIT - ZIP_CHUNK_SIZE
+
+
+class _ChunkSink(io.RawIOBase):
+    """Nepřevíjitelný výstup - zipfile pak píše data descriptory místo přepisu hlaviček."""
+
+    def __init__(self):
+        self._chunks = deque()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        while self._chunks:
+            yield self._chunks.popleft()
+
+
+def _member_size(source):
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return len(source)
+    return os.path.getsize(source)
+
+
+def _iter_source(source, chunk_size):
+    """Obsah člena po blocích - bajty z paměti, nebo cesta k souboru."""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        view = memoryview(source)
+        for start in range(0, len(view), chunk_size):
+            yield view[start:start + chunk_size]
+        return
+    with open(source, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+
+def iter_zip(members, chunk_size=ZIP_CHUNK_SIZE):
+    """
+    Vrací ZIP po blocích. `members` je iterovatelné (jméno, zdroj), zdrojem
+    jsou bajty nebo cesta k souboru; členy se čtou až při zápisu.
+    """
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_STORED) as archive:
+        for name, source in members:
+            info = zipfile.ZipInfo(name, date_time=time.localtime()[:6])
+            info.compress_type = zipfile.ZIP_STORED
+            force_zip64 = _member_size(source) > ZIP64_MEMBER_LIMIT
+            with archive.open(info, 'w', force_zip64=force_zip64) as member:
+                for chunk in _iter_source(source, chunk_size):
+                    member.write(chunk)
+                    yield from sink.drain()
+            yield from sink.drain()
+    # Centrální adresář se zapíše při zavření archivu
+    yield from sink.drain()
+
+
+def write_zip(members, directory=None):
+    """Zapíše ZIP proudově do dočasného souboru a vrátí jeho cestu."""
+    fd, path = tempfile.mkstemp(suffix='.zip', dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            for chunk in iter_zip(members):
+                f.write(chunk)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path